@@ -0,0 +1,1055 @@
+#!/usr/bin/env python3
+"""
+Motor de análise dos resultados
+Combina os ratings subjetivos (MOS) com as métricas objetivas e gera o
+relatório (Markdown, figuras, PDF e análise com Gemini) sem depender da
+interface gráfica, para poder ser usado pela aplicação e pela linha de comandos
+"""
+
+import importlib.util
+import os
+import threading
+import time
+import warnings
+from datetime import datetime
+
+import matplotlib
+matplotlib.use('Agg')  # Usar backend não-interativo
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from analysis_manifest import AnalysisManifest, dataframe_hash, stage_key
+from frame_series import FRAME_SERIES_DIRNAME, FrameSeries, series_path, write_frame_series
+from metrics_cache import DEFAULT_CACHE_PATH, METRICS_VERSION, MetricsCache, file_fingerprint, run_cached_metric_jobs
+from quality_metrics import (JobControl, MetricsCancelled, PairMetrics, SamplingPolicy,
+                             format_frame_indices, run_metric_jobs)
+
+
+def safe_dirname(name):
+    """Nome de pasta seguro a partir do nome de um teste ou resultado"""
+    safe_name = "".join(c for c in name if c.isalnum() or c in (' ', '-', '_')).strip()
+    return safe_name.replace(' ', '_')
+
+
+def filter_playback_quality(ratings_df, min_fps_ratio):
+    """Remove os ensaios com reprodução degradada (FPS obtido < min_fps_ratio × FPS nominal)
+    
+    Usa as colunas de telemetria 'playback_fps' e 'nominal_fps' dos CSVs de
+    resultados; ensaios sem telemetria (CSVs antigos) são mantidos.
+    Devolve (DataFrame filtrado, número de ensaios removidos).
+    """
+    if not min_fps_ratio or 'playback_fps' not in ratings_df or 'nominal_fps' not in ratings_df:
+        return ratings_df, 0
+    
+    ratio = ratings_df['playback_fps'] / ratings_df['nominal_fps']
+    degraded = ratio.notna() & (ratio < min_fps_ratio)
+    return ratings_df[~degraded], int(degraded.sum())
+
+
+def aggregate_ratings(csv_paths, reference_path, min_fps_ratio=None):
+    """Combina os CSVs de ratings e calcula o MOS (média) de cada vídeo distorcido
+    
+    Com `min_fps_ratio` os ensaios com reprodução degradada são excluídos
+    (ver filter_playback_quality); o número de ensaios excluídos fica em
+    df.attrs['excluded_trials'].
+    Devolve um DataFrame com uma linha por vídeo distorcido ('rating_0_10' é a
+    média, com 'num_ratings', desvio padrão 'rating_std' e meia largura do
+    intervalo de confiança a 95% 'rating_ci95').
+    """
+    # Combinar todos os CSVs
+    all_dfs = []
+    for csv_path in csv_paths:
+        df = pd.read_csv(csv_path)
+        all_dfs.append(df)
+    
+    # Combinar DataFrames
+    combined_df = pd.concat(all_dfs, ignore_index=True)
+    return aggregate_rating_rows(combined_df, reference_path, min_fps_ratio,
+                                 'Análise Combinada' if len(csv_paths) > 1 else 'Análise')
+
+
+def aggregate_rating_rows(ratings_df, reference_path, min_fps_ratio=None, default_test_name='Análise'):
+    """Como aggregate_ratings, para ratings individuais já carregados (ex.: RatingsStore.query)"""
+    # Excluir ensaios em que o avaliador não viu uma reprodução fluida
+    ratings_df, excluded_trials = filter_playback_quality(ratings_df, min_fps_ratio)
+    if excluded_trials:
+        print(f"⚠ {excluded_trials} ensaio(s) excluído(s) por reprodução degradada "
+              f"(< {min_fps_ratio:.0%} do FPS nominal)")
+    
+    result_df = summarize_ratings(ratings_df, reference_path, default_test_name)
+    result_df.attrs['excluded_trials'] = excluded_trials
+    return result_df
+
+
+def summarize_ratings(ratings_df, reference_path, default_test_name='Análise'):
+    """Agrega os ratings individuais numa linha por vídeo distorcido (uma única passagem groupby)
+    
+    Os campos descritivos vêm da primeira ocorrência preenchida de cada vídeo;
+    colunas ou valores em falta recebem o valor por omissão (nome do teste,
+    nome da referência, 0).
+    """
+    grouped = ratings_df.groupby('distorted_filename', sort=True)
+    mos_df = grouped['rating_0_10'].agg(['mean', 'count', 'std'])
+    
+    # Intervalo de confiança a 95% (t de Student; indefinido com um único rating)
+    ci95 = stats.t.ppf(0.975, mos_df['count'] - 1) * mos_df['std'] / np.sqrt(mos_df['count'])
+    
+    defaults = {
+        'nome_do_teste': default_test_name,
+        'reference_filename': os.path.basename(reference_path),
+        'trial_index': 0,
+    }
+    first = grouped[[column for column in defaults if column in ratings_df]].first()
+    
+    result_df = pd.DataFrame({
+        column: first[column].fillna(default) if column in first else default
+        for column, default in defaults.items()
+    }, index=mos_df.index)
+    result_df['rating_0_10'] = mos_df['mean']  # Média
+    result_df['num_ratings'] = mos_df['count']
+    result_df['rating_std'] = mos_df['std']
+    result_df['rating_ci95'] = ci95
+    result_df['timestamp'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    
+    result_df = result_df.reset_index()
+    return result_df[['nome_do_teste', 'reference_filename', 'distorted_filename', 'trial_index',
+                      'rating_0_10', 'num_ratings', 'rating_std', 'rating_ci95', 'timestamp']]
+
+
+# Estatísticas do MOS levadas dos ratings agregados para as métricas (ratings -> resultado)
+MOS_STAT_COLUMNS = {'num_ratings': 'num_ratings', 'rating_std': 'MOS_std', 'rating_ci95': 'MOS_ci95'}
+
+
+def _json_number(value, cast=float):
+    """Número para JSON (None em vez de NaN)"""
+    return None if pd.isna(value) else cast(value)
+
+
+class AnalysisResult:
+    """Resultado estruturado de uma análise: métricas por vídeo, modelos e ficheiros gerados"""
+    
+    def __init__(self, test_name, reference_path, sampling, metrics_df, frames_used, errors,
+                 correlations, regressions, files=None):
+        self.test_name = test_name
+        self.reference_path = reference_path
+        self.sampling = sampling
+        self.metrics_df = metrics_df          # colunas distorted_filename, MOS, PSNR, SSIM (+ MOS_ci95, ...)
+        self.frames_used = frames_used        # índices dos frames comparados, por vídeo
+        self.errors = errors                  # {nome do vídeo: mensagem de erro}
+        self.correlations = correlations      # {métrica: {'pearson': ..., 'spearman': ...}}
+        self.regressions = regressions        # {métrica: {'slope', 'intercept', 'r', 'p', 'poly'}}
+        self.files = files or {}              # {'markdown', 'pdf', 'figures', 'results_dir'}
+    
+    @property
+    def pdf_file(self):
+        return self.files.get('pdf')
+    
+    def to_dict(self):
+        """Representação serializável em JSON"""
+        return {
+            'test_name': self.test_name,
+            'reference': os.path.basename(self.reference_path),
+            'sampling': self.sampling.to_dict(),
+            'videos': [dict({'distorted_filename': row.distorted_filename, 'MOS': float(row.MOS),
+                             'PSNR': float(row.PSNR), 'SSIM': float(row.SSIM), 'frames': len(indices)},
+                            **{column: _json_number(getattr(row, column),
+                                                    int if column == 'num_ratings' else float)
+                               for column in MOS_STAT_COLUMNS.values() if column in self.metrics_df})
+                       for row, indices in zip(self.metrics_df.itertuples(), self.frames_used)],
+            'errors': self.errors,
+            'correlations': {metric: {name: float(value) for name, value in values.items()}
+                             for metric, values in self.correlations.items()},
+            'regressions': {metric: {'slope': float(model['slope']), 'intercept': float(model['intercept']),
+                                     'r2': float(model['r'] ** 2), 'p': float(model['p']),
+                                     'poly2': [float(c) for c in model['poly']]}
+                            for metric, model in self.regressions.items()},
+            'files': self.files,
+        }
+
+
+def format_eta(seconds):
+    """Tempo restante no formato m:ss (ou h:mm:ss)"""
+    seconds = int(round(seconds))
+    hours, rest = divmod(seconds, 3600)
+    if hours:
+        return f"{hours}:{rest // 60:02d}:{rest % 60:02d}"
+    return f"{rest // 60}:{rest % 60:02d}"
+
+
+class MetricsProgress(threading.Thread):
+    """Envia periodicamente o progresso do cálculo das métricas
+    
+    O callback recebe um dicionário com 'stage', 'message', 'fraction' (0 a 1,
+    ou None), 'done'/'total' (pares), 'fps', 'current' (vídeos em curso) e
+    'eta' (segundos, ou None se ainda não for possível estimar).
+    """
+    
+    def __init__(self, jobs, sampling, control, callback, interval=0.5):
+        super().__init__(daemon=True)
+        self.jobs = jobs
+        self.sampling = sampling
+        self.control = control
+        self.callback = callback
+        self.interval = interval
+        self._expected = [self._expected_frames(ref_path, dist_path) for ref_path, dist_path in jobs]
+        self._done = {}
+        self._lock = threading.Lock()
+        self._finished = threading.Event()
+        self._start_time = time.monotonic()
+    
+    def pair_done(self, index, pair_metrics):
+        """Regista um par concluído (pair_metrics é None se falhou)"""
+        with self._lock:
+            self._done[index] = pair_metrics
+        self.report()
+    
+    def stop(self):
+        self._finished.set()
+        self.join()
+    
+    def _expected_frames(self, ref_path, dist_path):
+        """Frames previstos de um par, ou None se os vídeos não puderem ser abertos
+        
+        Calculado na criação do monitor, antes de o pool de processos arrancar:
+        abrir vídeos numa thread enquanto o pool cria os processos pode bloqueá-los.
+        """
+        try:
+            return self.sampling.expected_frames(ref_path, dist_path)
+        except Exception:
+            return None
+    
+    def run(self):
+        while not self._finished.wait(self.interval):
+            self.report()
+    
+    def snapshot(self):
+        """Estado atual do progresso (ver docstring da classe)"""
+        with self._lock:
+            done = dict(self._done)
+        elapsed = max(1e-6, time.monotonic() - self._start_time)
+        frames = self.control.frames
+        fps = frames / elapsed
+        total = len(self.jobs)
+        pending = [i for i in range(total) if i not in done]
+        
+        # Frames já contados dos pares em curso (os pares da cache não são contados)
+        computed_frames = sum(len(pair.frame_indices) for pair in done.values()
+                              if pair is not None and not pair.cached)
+        in_flight = max(0, frames - computed_frames)
+        expected = [self._expected[i] for i in pending]
+        
+        eta = None
+        fraction = len(done) / total if total else 1.0
+        if None not in expected:
+            remaining = max(0, sum(expected) - in_flight)
+            if fps > 0:
+                eta = remaining / fps
+            total_expected = sum(self._expected) if None not in self._expected else None
+            if total_expected:
+                fraction = min(1.0, 1 - remaining / total_expected)
+        elif done:
+            eta = elapsed / len(done) * len(pending)
+        
+        current = [os.path.basename(path) for path in list(self.control.running.values())]
+        message = f"Métricas: {len(done)}/{total} vídeo(s) · {fps:.1f} frames/s"
+        if current:
+            message += f" · {', '.join(current[:3])}" + (" ..." if len(current) > 3 else "")
+        if eta is not None and pending:
+            message += f" · ETA {format_eta(eta)}"
+        return {'stage': 'metrics', 'message': message, 'fraction': fraction, 'done': len(done),
+                'total': total, 'fps': fps, 'current': current, 'eta': eta}
+    
+    def report(self):
+        self.callback(self.snapshot())
+
+
+def _list_files(directory):
+    """Ficheiros e pastas existentes em `directory` (recursivo): {caminho: mtime_ns}"""
+    paths = {}
+    for root, dirs, files in os.walk(directory):
+        for name in dirs + files:
+            path = os.path.join(root, name)
+            try:
+                paths[path] = os.stat(path).st_mtime_ns
+            except OSError:
+                pass
+    return paths
+
+
+def _modified_files(existing):
+    """Ficheiros de `existing` (ver _list_files) alterados ou removidos desde então"""
+    modified = []
+    for path, mtime_ns in existing.items():
+        try:
+            if os.path.isfile(path) and os.stat(path).st_mtime_ns != mtime_ns:
+                modified.append(path)
+        except OSError:
+            modified.append(path)
+    return modified
+
+
+def remove_new_files(directory, existing):
+    """Remove os ficheiros e pastas de `directory` que não estão em `existing`"""
+    for root, dirs, files in os.walk(directory, topdown=False):
+        for name in files:
+            path = os.path.join(root, name)
+            if path not in existing:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        for name in dirs:
+            path = os.path.join(root, name)
+            if path not in existing:
+                try:
+                    os.rmdir(path)
+                except OSError:
+                    pass
+
+
+def distorted_path_index(distorted_videos):
+    """Dicionário nome do ficheiro / caminho -> caminho completo (o primeiro vídeo com cada nome ganha)"""
+    index = {}
+    for video_path in distorted_videos:
+        # Procurar tanto pelo nome do ficheiro quanto pelo caminho completo
+        index.setdefault(video_path, video_path)
+        index.setdefault(os.path.basename(video_path), video_path)
+    return index
+
+
+def resolve_distorted_path(dist_filename, distorted_videos):
+    """Caminho completo de um vídeo distorcido (pelo nome do ficheiro ou caminho), ou None"""
+    return distorted_path_index(distorted_videos).get(dist_filename)
+
+
+def compute_objective_metrics(ratings_df, reference_path, distorted_videos, results_dir=None, workers=1,
+                              max_concurrent=None, sampling=None, use_cache=True, progress=None, control=None,
+                              manifest=None, cache_path=DEFAULT_CACHE_PATH):
+    """Calcula PSNR e SSIM de cada vídeo distorcido com rating
+    
+    `ratings_df` tem uma linha por vídeo distorcido (MOS em 'rating_0_10' e,
+    opcionalmente, as estatísticas de summarize_ratings). Com `results_dir` as
+    séries por frame são guardadas à medida que cada par termina.
+    `progress` recebe periodicamente o progresso (ver MetricsProgress); `control`
+    (JobControl) permite cancelar o cálculo, que lança MetricsCancelled.
+    Com `use_cache` as métricas já calculadas são lidas da cache `cache_path`.
+    Com `manifest` (AnalysisManifest de `results_dir`) e `use_cache`, os
+    resultados da análise anterior são reutilizados se os vídeos e a
+    amostragem não mudaram.
+    Devolve (DataFrame com distorted_filename/MOS/PSNR/SSIM, frames usados por
+    vídeo, {vídeo: erro} dos pares que não puderam ser comparados).
+    """
+    sampling = sampling or SamplingPolicy()
+    print("Calculando métricas objetivas...")
+    errors = {}
+    
+    # Resolver o caminho completo de cada vídeo distorcido (consulta a um dicionário)
+    path_index = distorted_path_index(distorted_videos)
+    rows = []
+    jobs = []
+    for idx, row in ratings_df.iterrows():
+        dist_filename = row['distorted_filename']
+        dist_path = path_index.get(dist_filename)
+        if dist_path and os.path.exists(dist_path):
+            rows.append(row)
+            jobs.append((reference_path, dist_path))
+        else:
+            errors[dist_filename] = "Vídeo distorcido não encontrado"
+            print(f"⚠ Aviso: Vídeo distorcido não encontrado: {dist_filename}")
+    
+    # Etapa reutilizável se a referência, os vídeos com rating e a amostragem não mudaram
+    previous = None
+    if manifest is not None:
+        videos = {row['distorted_filename']: file_fingerprint(dist_path)
+                  for row, (_, dist_path) in zip(rows, jobs)}
+        manifest.inputs.update({'reference': file_fingerprint(reference_path), 'videos': videos,
+                                'sampling': sampling.to_dict(), 'metrics_version': METRICS_VERSION})
+        metrics_key = stage_key('metrics', METRICS_VERSION, sampling.to_dict(), manifest.inputs['reference'],
+                                sorted(videos.items()))
+        if use_cache:
+            previous = manifest.lookup('metrics', metrics_key)
+    
+    # Pares reutilizados da análise anterior; os que falharam são sempre recalculados
+    job_results = [None] * len(jobs)
+    if previous is not None:
+        for index, result in _previous_metric_results(previous, rows, jobs, results_dir, sampling).items():
+            job_results[index] = result
+    pending = [index for index, result in enumerate(job_results) if result is None]
+    
+    if not pending:
+        print(f"✓ Métricas inalteradas desde a última análise ({len(jobs)} vídeo(s))")
+        if progress is not None:
+            progress({'stage': 'report', 'message': "Métricas inalteradas desde a última análise",
+                      'fraction': 1.0})
+        return _metrics_table(ratings_df, rows, job_results) + (errors,)
+    if len(pending) < len(jobs):
+        print(f"✓ {len(jobs) - len(pending)} vídeo(s) inalterado(s) desde a última análise")
+    pending_jobs = [jobs[index] for index in pending]
+    
+    if progress is not None:
+        control = control or JobControl()
+        monitor = MetricsProgress(pending_jobs, sampling, control, progress)
+    
+    def on_result(index, metrics, error):
+        if progress is not None:
+            monitor.pair_done(index, metrics)
+        index = pending[index]
+        dist_filename = rows[index]['distorted_filename']
+        if error:
+            errors[dist_filename] = error
+            print(f"⚠ Aviso: Falha ao processar {dist_filename}: {error}")
+        else:
+            # Séries por frame guardadas assim que o par termina
+            if results_dir:
+                write_frame_series(results_dir, reference_path, jobs[index][1], metrics)
+            print(f"✓ Processado {dist_filename}")
+    
+    # Uma única descodificação por par; a referência é descodificada uma vez
+    # (ou uma vez por processo quando workers > 1)
+    print(f"Processando {len(pending_jobs)} vídeo(s) com {max(1, workers)} processo(s)...")
+    print(f"Amostragem: {sampling.describe()}")
+    if progress is not None:
+        monitor.start()
+    try:
+        if use_cache:
+            with MetricsCache(cache_path) as cache:
+                pending_results = run_cached_metric_jobs(pending_jobs, cache, sampling=sampling, workers=workers,
+                                                         max_concurrent=max_concurrent, on_result=on_result,
+                                                         control=control)
+        else:
+            pending_results = run_metric_jobs(pending_jobs, sampling=sampling, workers=workers,
+                                              max_concurrent=max_concurrent, on_result=on_result, control=control)
+    finally:
+        if progress is not None:
+            monitor.stop()
+    for index, result in zip(pending, pending_results):
+        job_results[index] = result
+    
+    if manifest is not None:
+        # Só os pares bem-sucedidos: uma falha (ex.: falta de memória) não fica registada
+        pairs = {row['distorted_filename']: {'means': {name: float(value) for name, value in metrics.means.items()}}
+                 for row, (metrics, error) in zip(rows, job_results) if not error}
+        artifacts = [series_path(results_dir, dist_path)
+                     for (_, dist_path), (metrics, error) in zip(jobs, job_results) if not error]
+        manifest.record('metrics', metrics_key, artifacts, {'pairs': pairs})
+    
+    return _metrics_table(ratings_df, rows, job_results) + (errors,)
+
+
+def _previous_metric_results(previous, rows, jobs, results_dir, sampling):
+    """Resultados {índice: (PairMetrics, None)} dos pares calculados com sucesso na análise anterior
+    
+    As médias vêm do manifesto e os frames usados das séries por frame.
+    """
+    job_results = {}
+    for index, (row, (_, dist_path)) in enumerate(zip(rows, jobs)):
+        pair = previous['pairs'].get(row['distorted_filename'])
+        path = series_path(results_dir, dist_path)
+        # Séries com outro nome (ex.: resultados de versões anteriores) obrigam a recalcular o par
+        if pair is None or 'means' not in pair or not os.path.exists(path):
+            continue
+        series = FrameSeries(path)
+        try:
+            frame_indices = series.frame_index.tolist()
+        finally:
+            series.close()
+        job_results[index] = (PairMetrics(pair['means'], None, frame_indices, sampling, cached=True), None)
+    return job_results
+
+
+def _metrics_table(ratings_df, rows, job_results):
+    """DataFrame distorted_filename/MOS/PSNR/SSIM (+ estatísticas do MOS) e frames usados por vídeo"""
+    # Resultados na ordem original do CSV (pares com erro são ignorados)
+    records = []
+    frames_used = []
+    for row, (metrics, error) in zip(rows, job_results):
+        if error:
+            continue
+        records.append({
+            'distorted_filename': row['distorted_filename'],
+            'MOS': row['rating_0_10'],
+            'PSNR': metrics['PSNR'],
+            'SSIM': metrics['SSIM']
+        })
+        frames_used.append(metrics.frame_indices)
+    
+    metrics_df = pd.DataFrame(records, columns=['distorted_filename', 'MOS', 'PSNR', 'SSIM'])
+    
+    # Estatísticas do MOS (número de ratings, desvio padrão, IC 95%), quando disponíveis
+    stat_columns = [column for column in MOS_STAT_COLUMNS if column in ratings_df]
+    if stat_columns:
+        mos_stats = ratings_df[['distorted_filename'] + stat_columns].rename(columns=MOS_STAT_COLUMNS)
+        metrics_df = metrics_df.merge(mos_stats.drop_duplicates('distorted_filename'),
+                                      on='distorted_filename', how='left')
+    return metrics_df, frames_used
+
+
+def fit_quality_models(metrics_df, metrics=('PSNR', 'SSIM')):
+    """Correlações e regressões (linear e polinomial de grau 2) de cada métrica com o MOS
+    
+    Devolve (correlações, regressões), indexadas pelo nome da métrica.
+    """
+    mos_values = metrics_df['MOS'].tolist()
+    correlations = {}
+    regressions = {}
+    
+    # Verificar se arrays têm variância antes de calcular correlação
+    def safe_correlation(x, y, corr_func):
+        if len(x) < 2 or np.std(x) == 0 or np.std(y) == 0:
+            return 0.0
+        try:
+            return corr_func(x, y)[0]
+        except (ValueError, TypeError):
+            return 0.0
+    
+    for metric in metrics:
+        values = metrics_df[metric].tolist()
+        
+        # Calcular correlações (com tratamento de arrays constantes)
+        with warnings.catch_warnings():
+            warnings.filterwarnings('ignore', category=stats.ConstantInputWarning)
+            correlations[metric] = {
+                'pearson': safe_correlation(mos_values, values, stats.pearsonr),
+                'spearman': safe_correlation(mos_values, values, stats.spearmanr),
+            }
+        
+        # Regressão linear métrica -> MOS
+        try:
+            slope, intercept, r, p, _ = stats.linregress(values, mos_values)
+        except ValueError:
+            slope, intercept, r, p = 0.0, 0.0, 0.0, 1.0
+        
+        # Regressão polinomial (grau 2) métrica -> MOS
+        try:
+            poly = np.polyfit(values, mos_values, 2)
+        except (np.linalg.LinAlgError, ValueError):
+            # Se falhar, usar regressão linear como fallback
+            poly = [0.0, slope, intercept]
+        
+        regressions[metric] = {'slope': slope, 'intercept': intercept, 'r': r, 'p': p, 'poly': poly}
+    
+    return correlations, regressions
+
+
+def plot_analysis_figures(metrics_df, correlations, regressions, fig_dir):
+    """Gera os gráficos da análise em `fig_dir`; devolve os caminhos dos ficheiros"""
+    os.makedirs(fig_dir, exist_ok=True)
+    figure_files = []
+    mos_values = metrics_df['MOS'].tolist()
+    
+    # Gráficos 1 e 2: Scatter métrica vs MOS com regressão
+    for metric, xlabel, filename in (('PSNR', 'PSNR (dB)', 'psnr_vs_mos.png'),
+                                     ('SSIM', 'SSIM', 'ssim_vs_mos.png')):
+        values = metrics_df[metric].tolist()
+        model = regressions[metric]
+        plt.figure(figsize=(10, 6))
+        plt.scatter(values, mos_values, alpha=0.6, s=100)
+        values_sorted = np.sort(values)
+        plt.plot(values_sorted, model['slope'] * values_sorted + model['intercept'], 
+                'r--', label=f"Linear (R²={model['r']**2:.3f})", linewidth=2)
+        plt.plot(values_sorted, np.poly1d(model['poly'])(values_sorted), 
+                'g--', label='Polinomial (grau 2)', linewidth=2)
+        plt.xlabel(xlabel, fontsize=12)
+        plt.ylabel('MOS (Mean Opinion Score)', fontsize=12)
+        plt.title(f"{metric} vs MOS - Correlação Pearson: {correlations[metric]['pearson']:.3f}", fontsize=14)
+        plt.legend()
+        plt.grid(True, alpha=0.3)
+        plt.tight_layout()
+        plt.savefig(os.path.join(fig_dir, filename), dpi=300, bbox_inches='tight')
+        plt.close()
+        figure_files.append(os.path.join(fig_dir, filename))
+    
+    # Gráfico 3: Comparação de métricas
+    psnr_values = metrics_df['PSNR'].tolist()
+    plt.figure(figsize=(12, 6))
+    x = np.arange(len(metrics_df))
+    width = 0.35
+    
+    # Normalizar PSNR para escala 0-10
+    psnr_norm = (np.array(psnr_values) - np.min(psnr_values)) / (np.max(psnr_values) - np.min(psnr_values)) * 10
+    
+    plt.bar(x - width/2, mos_values, width, label='MOS (Subjetivo)', alpha=0.8)
+    plt.bar(x + width/2, psnr_norm, width, label='PSNR (Normalizado)', alpha=0.8)
+    plt.xlabel('Vídeo Distorcido', fontsize=12)
+    plt.ylabel('Score (0-10)', fontsize=12)
+    plt.title('Comparação: MOS vs PSNR Normalizado', fontsize=14)
+    plt.xticks(x, [f"V{i+1}" for i in range(len(metrics_df))], rotation=45)
+    plt.legend()
+    plt.grid(True, alpha=0.3, axis='y')
+    plt.tight_layout()
+    plt.savefig(os.path.join(fig_dir, 'mos_vs_psnr_comparison.png'), dpi=300, bbox_inches='tight')
+    plt.close()
+    figure_files.append(os.path.join(fig_dir, 'mos_vs_psnr_comparison.png'))
+    return figure_files
+
+
+def write_analysis_markdown(md_filename, result):
+    """Escreve o relatório Markdown de um AnalysisResult"""
+    correlations = result.correlations
+    psnr_model = result.regressions['PSNR']
+    ssim_model = result.regressions['SSIM']
+    
+    with open(md_filename, 'w', encoding='utf-8') as f:
+        f.write(f"# Análise de Qualidade de Vídeo\n\n")
+        f.write(f"**Nome do Teste:** {result.test_name}\n\n")
+        f.write(f"**Data:** {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
+        f.write("---\n\n")
+        
+        # Tabela de métricas
+        f.write("## Métricas Objetivas e Subjetivas\n\n")
+        f.write("| Vídeo | MOS | PSNR (dB) | SSIM |\n")
+        f.write("|-------|-----|-----------|------|\n")
+        for i, row in result.metrics_df.iterrows():
+            f.write(f"| {row['distorted_filename']} | {row['MOS']:.1f} | {row['PSNR']:.2f} | {row['SSIM']:.3f} |\n")
+        f.write("\n")
+        
+        # Amostragem temporal usada nas métricas objetivas
+        f.write("## Amostragem Temporal\n\n")
+        f.write(f"**Política:** {result.sampling.describe()}\n\n")
+        f.write("| Vídeo | Frames | Índices |\n")
+        f.write("|-------|--------|---------|\n")
+        for dist_filename, indices in zip(result.metrics_df['distorted_filename'], result.frames_used):
+            f.write(f"| {dist_filename} | {len(indices)} | {format_frame_indices(indices)} |\n")
+        f.write("\n")
+        f.write(f"Valores por frame de cada vídeo em `{FRAME_SERIES_DIRNAME}/<vídeo>.<hash>.npz` "
+                f"(curvas temporais: `python frame_series.py <pasta do resultado>`).\n\n")
+        
+        # Correlações
+        f.write("## Correlações\n\n")
+        f.write("| Métrica | Pearson | Spearman |\n")
+        f.write("|---------|---------|----------|\n")
+        f.write(f"| PSNR | {correlations['PSNR']['pearson']:.3f} | {correlations['PSNR']['spearman']:.3f} |\n")
+        f.write(f"| SSIM | {correlations['SSIM']['pearson']:.3f} | {correlations['SSIM']['spearman']:.3f} |\n")
+        f.write("\n")
+        
+        # Regressões
+        f.write("## Modelos de Regressão\n\n")
+        f.write("### PSNR → MOS\n\n")
+        f.write(f"- **Linear:** MOS = {psnr_model['slope']:.3f} × PSNR + {psnr_model['intercept']:.3f}\n")
+        f.write(f"- **R² Linear:** {psnr_model['r']**2:.3f}\n")
+        f.write(f"- **Polinomial (grau 2):** MOS = {psnr_model['poly'][0]:.3f} × PSNR² + {psnr_model['poly'][1]:.3f} × PSNR + {psnr_model['poly'][2]:.3f}\n")
+        f.write("\n")
+        
+        f.write("### SSIM → MOS\n\n")
+        f.write(f"- **Linear:** MOS = {ssim_model['slope']:.3f} × SSIM + {ssim_model['intercept']:.3f}\n")
+        f.write(f"- **R² Linear:** {ssim_model['r']**2:.3f}\n")
+        f.write(f"- **Polinomial (grau 2):** MOS = {ssim_model['poly'][0]:.3f} × SSIM² + {ssim_model['poly'][1]:.3f} × SSIM + {ssim_model['poly'][2]:.3f}\n")
+        f.write("\n")
+        
+        # Gráficos (usar caminhos relativos - tudo na mesma pasta)
+        f.write("## Gráficos\n\n")
+        f.write(f"![PSNR vs MOS](figures/psnr_vs_mos.png)\n\n")
+        f.write(f"![SSIM vs MOS](figures/ssim_vs_mos.png)\n\n")
+        f.write(f"![Comparação MOS vs PSNR](figures/mos_vs_psnr_comparison.png)\n\n")
+
+
+def generate_analysis(ratings, timestamp_str, results_dir, reference_path, distorted_videos, test_name,
+                      workers=1, max_concurrent=None, sampling=None, use_cache=True, gemini=True,
+                      progress=None, control=None, incremental=True, cache_path=DEFAULT_CACHE_PATH):
+    """Gera análise completa: PSNR, SSIM, correlações e regressões
+    
+    `ratings` é o DataFrame de aggregate_ratings (ou o caminho de um CSV com o
+    mesmo formato), com uma linha por vídeo distorcido (MOS em 'rating_0_10');
+    `distorted_videos` são os caminhos onde procurar cada vídeo pelo nome.
+    `workers` > 1 distribui os vídeos distorcidos por vários processos;
+    `max_concurrent` limita as descodificações simultâneas;
+    `sampling` é a SamplingPolicy usada (por omissão, os primeiros 100 frames);
+    com `use_cache` as métricas já calculadas são lidas da cache persistente
+    `cache_path` (por omissão results/metrics_cache.sqlite na pasta atual);
+    com `gemini` é pedida a análise automática ao Gemini depois do PDF de dados.
+    Com `incremental`, as etapas cujas entradas não mudaram desde a última
+    análise na mesma pasta (ver analysis_manifest) não são refeitas; sem
+    `use_cache` as métricas são sempre recalculadas.
+    `progress` recebe dicionários de progresso ('stage', 'message', 'fraction', ...)
+    e `control` (JobControl) permite cancelar: a análise lança MetricsCancelled,
+    os ficheiros criados por esta execução são removidos e as etapas do
+    manifesto cujos ficheiros foram reescritos deixam de ser reutilizadas.
+    
+    Devolve um AnalysisResult (o PDF de dados fica em result.pdf_file, None se não foi gerado).
+    """
+    sampling = sampling or SamplingPolicy()
+    # Usar o diretório de resultados fornecido
+    base_dir = results_dir
+    existing_files = _list_files(base_dir)
+    
+    try:
+        return _generate_analysis(ratings, timestamp_str, base_dir, reference_path, distorted_videos,
+                                  test_name, workers, max_concurrent, sampling, use_cache, gemini,
+                                  progress, control, incremental, cache_path)
+    except MetricsCancelled:
+        remove_new_files(base_dir, existing_files)
+        # Ficheiros de etapas anteriores já reescritos (séries por frame, gráficos)
+        # já não correspondem às chaves guardadas no manifesto
+        modified = _modified_files(existing_files)
+        if modified:
+            manifest = AnalysisManifest(base_dir)
+            if manifest.invalidate(modified):
+                manifest.save()
+        print("⚠ Análise cancelada; ficheiros parciais removidos")
+        raise
+
+
+def _generate_analysis(ratings, timestamp_str, base_dir, reference_path, distorted_videos, test_name,
+                       workers, max_concurrent, sampling, use_cache, gemini, progress, control, incremental,
+                       cache_path):
+    """Etapas de generate_analysis (sem a limpeza em caso de cancelamento)"""
+    def report(message, fraction=None):
+        if control is not None:
+            control.check()
+        if progress is not None:
+            progress({'stage': 'report', 'message': message, 'fraction': fraction})
+    
+    # Ratings agregados (DataFrame em memória ou CSV)
+    df = ratings if isinstance(ratings, pd.DataFrame) else pd.read_csv(ratings)
+    base_name = f"analysis_{timestamp_str}"
+    
+    # Manifesto da pasta de resultados (etapas já feitas com as mesmas entradas)
+    manifest = AnalysisManifest(base_dir) if incremental else None
+    if manifest is not None:
+        manifest.inputs['ratings'] = dataframe_hash(df, exclude=('timestamp',))
+    
+    # Calcular métricas objetivas
+    metrics_df, frames_used, errors = compute_objective_metrics(
+        df, reference_path, distorted_videos, base_dir, workers=workers, max_concurrent=max_concurrent,
+        sampling=sampling, use_cache=use_cache, progress=progress, control=control, manifest=manifest,
+        cache_path=cache_path)
+    
+    # Calcular correlações e regressões
+    report("Calculando correlações e regressões...", 1.0)
+    correlations, regressions = fit_quality_models(metrics_df)
+    result = AnalysisResult(test_name, reference_path, sampling, metrics_df, frames_used, errors,
+                            correlations, regressions)
+    
+    # Gerar gráficos (dentro da pasta do teste); dependem apenas da tabela de métricas
+    fig_dir = os.path.join(base_dir, "figures")
+    figures_key = stage_key('figures', metrics_df[['distorted_filename', 'MOS', 'PSNR', 'SSIM']].values.tolist())
+    if manifest is not None and manifest.lookup('figures', figures_key) is not None:
+        print("✓ Gráficos inalterados desde a última análise")
+    else:
+        report("Gerando gráficos...", 1.0)
+        figure_files = plot_analysis_figures(metrics_df, correlations, regressions, fig_dir)
+        if manifest is not None:
+            manifest.record('figures', figures_key, figure_files)
+    
+    # Relatório (Markdown e PDF de dados): reutilizado se os resultados não mudaram
+    # (e o reportlab, necessário para o PDF, continua instalado ou em falta)
+    report_key = stage_key('report', figures_key, result.to_dict(),
+                           [format_frame_indices(indices) for indices in frames_used],
+                           importlib.util.find_spec('reportlab') is not None)
+    previous_report = manifest.lookup('report', report_key) if manifest is not None else None
+    if previous_report is not None:
+        print("✓ Relatório inalterado desde a última análise")
+        report_timestamp = previous_report['timestamp']
+        md_filename = manifest.artifact_path(previous_report['markdown'])
+        pdf_file = manifest.artifact_path(previous_report['pdf'])
+    else:
+        report_timestamp = timestamp_str
+        
+        # Gerar documento Markdown
+        md_filename = os.path.join(base_dir, f"{base_name}_analysis.md")
+        write_analysis_markdown(md_filename, result)
+        
+        # Converter MD para PDF e renomear para 'dados_...'
+        report("Gerando PDF...", 1.0)
+        pdf_file = md_to_pdf(md_filename, fig_dir)
+        
+        if pdf_file:
+            # Renomear PDF para 'dados_...'
+            dados_pdf = os.path.join(base_dir, f"dados_{timestamp_str}.pdf")
+            if os.path.exists(pdf_file):
+                os.rename(pdf_file, dados_pdf)
+                pdf_file = dados_pdf
+        
+        if manifest is not None:
+            manifest.record('report', report_key, [md_filename] + ([pdf_file] if pdf_file else []),
+                            {'timestamp': timestamp_str, 'markdown': os.path.basename(md_filename),
+                             'pdf': os.path.basename(pdf_file) if pdf_file else None})
+    
+    # Gerar análise com Gemini (a partir do relatório; refeita apenas se este mudou)
+    if pdf_file and gemini:
+        gemini_key = stage_key('gemini', report_key)
+        if manifest is not None and manifest.lookup('gemini', gemini_key) is not None:
+            print("✓ Análise com Gemini inalterada desde a última análise")
+        else:
+            report("Gerando análise com Gemini...", 1.0)
+            try:
+                generate_gemini_analysis(pdf_file, md_filename, report_timestamp, base_dir, fig_dir, test_name)
+                analysis_md = os.path.join(base_dir, f"analise_{report_timestamp}.md")
+                if manifest is not None and os.path.exists(analysis_md):
+                    manifest.record('gemini', gemini_key, [analysis_md])
+            except Exception as e:
+                print(f"⚠ Erro ao gerar análise com Gemini: {e}")
+                print("Os dados foram gerados com sucesso, mas a análise automática falhou.")
+    
+    if manifest is not None:
+        manifest.save()
+    
+    result.files = {'results_dir': base_dir, 'markdown': md_filename, 'pdf': pdf_file, 'figures': fig_dir}
+    return result
+
+
+def generate_gemini_analysis(dados_pdf, md_filename, timestamp_str, base_dir, fig_dir, test_name):
+    """Gera análise com Gemini AI baseada nos dados"""
+    from dotenv import load_dotenv
+    
+    # Carregar variáveis de ambiente
+    load_dotenv()
+    gemini_key = os.getenv('GEMINI_API_KEY')
+    
+    if not gemini_key:
+        print("⚠ GEMINI_API_KEY não encontrada no .env")
+        return None
+    
+    try:
+        import google.generativeai as genai
+        
+        # Configurar Gemini
+        genai.configure(api_key=gemini_key)
+        model = genai.GenerativeModel('gemini-2.5-flash')
+        
+        print("Enviando dados ao Gemini para análise...")
+        
+        # Ler conteúdo do Markdown para contexto
+        with open(md_filename, 'r', encoding='utf-8') as f:
+            md_content = f.read()
+        
+        # Preparar prompt com dados do Markdown
+        prompt = f"""
+Analisa os seguintes dados de um teste subjetivo de qualidade de vídeo e fornece uma análise detalhada com conclusões.
+
+Dados do teste:
+{md_content}
+
+Por favor, fornece:
+1. Uma análise geral dos resultados
+2. Interpretação das correlações entre métricas objetivas (PSNR, SSIM) e subjetivas (MOS)
+3. Avaliação da qualidade dos modelos de regressão
+4. Conclusões sobre que métricas objetivas melhor prevêem a qualidade percebida
+
+Formata a resposta em Markdown com títulos, parágrafos e listas quando apropriado.
+"""
+        
+        # Enviar prompt ao Gemini (usando apenas texto)
+        response = model.generate_content(prompt)
+        
+        # Obter texto da resposta
+        analysis_text = response.text
+        
+        # Gerar ficheiro Markdown com análise
+        analysis_md = os.path.join(base_dir, f"analise_{timestamp_str}.md")
+        with open(analysis_md, 'w', encoding='utf-8') as f:
+            f.write(f"# Análise de Qualidade de Vídeo - Conclusões\n\n")
+            f.write(f"**Nome do Teste:** {test_name}\n\n")
+            f.write(f"**Data:** {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
+            f.write("---\n\n")
+            f.write(analysis_text)
+        
+        print(f"✓ Análise gerada: {analysis_md}")
+        
+        # Converter para PDF
+        analysis_pdf = md_to_pdf(analysis_md, fig_dir)
+        if analysis_pdf:
+            # Renomear para analise_...
+            final_analysis_pdf = os.path.join(base_dir, f"analise_{timestamp_str}.pdf")
+            if os.path.exists(analysis_pdf):
+                os.rename(analysis_pdf, final_analysis_pdf)
+            print(f"✓ PDF de análise gerado: {final_analysis_pdf}")
+        
+    except Exception as e:
+        print(f"Erro ao gerar análise com Gemini: {e}")
+        import traceback
+        traceback.print_exc()
+        raise
+
+def md_to_pdf(md_file, fig_dir):
+    """Converte Markdown para PDF usando reportlab"""
+    pdf_file = md_file.replace('.md', '.pdf')
+    
+    try:
+        from reportlab.lib.pagesizes import A4
+        from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+        from reportlab.lib.units import cm
+        from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image, PageBreak
+        from reportlab.lib import colors
+        from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_JUSTIFY
+        import re
+        
+        # Ler conteúdo do Markdown
+        with open(md_file, 'r', encoding='utf-8') as f:
+            md_content = f.read()
+        
+        # Criar documento PDF
+        doc = SimpleDocTemplate(
+            pdf_file,
+            pagesize=A4,
+            rightMargin=2*cm,
+            leftMargin=2*cm,
+            topMargin=2.5*cm,
+            bottomMargin=2.5*cm
+        )
+        
+        # Estilos
+        styles = getSampleStyleSheet()
+        title_style = ParagraphStyle(
+            'CustomTitle',
+            parent=styles['Heading1'],
+            fontSize=24,
+            textColor=colors.HexColor('#2c3e50'),
+            spaceAfter=20,
+            alignment=TA_LEFT
+        )
+        heading2_style = ParagraphStyle(
+            'CustomHeading2',
+            parent=styles['Heading2'],
+            fontSize=18,
+            textColor=colors.HexColor('#34495e'),
+            spaceAfter=15,
+            spaceBefore=25
+        )
+        heading3_style = ParagraphStyle(
+            'CustomHeading3',
+            parent=styles['Heading3'],
+            fontSize=14,
+            textColor=colors.HexColor('#555'),
+            spaceAfter=10,
+            spaceBefore=20
+        )
+        normal_style = ParagraphStyle(
+            'CustomNormal',
+            parent=styles['Normal'],
+            fontSize=11,
+            leading=16,
+            alignment=TA_JUSTIFY
+        )
+        
+        # Elementos do PDF
+        story = []
+        
+        # Parsear Markdown linha por linha
+        lines = md_content.split('\n')
+        i = 0
+        current_table_rows = []
+        in_table = False
+        
+        while i < len(lines):
+            line = lines[i].strip()
+            
+            # Título H1
+            if line.startswith('# ') and not line.startswith('##'):
+                text = line[2:].strip()
+                story.append(Paragraph(text, title_style))
+                story.append(Spacer(1, 12))
+            
+            # Título H2
+            elif line.startswith('## ') and not line.startswith('###'):
+                text = line[3:].strip()
+                story.append(Spacer(1, 12))
+                story.append(Paragraph(text, heading2_style))
+                story.append(Spacer(1, 12))
+            
+            # Título H3
+            elif line.startswith('### '):
+                text = line[4:].strip()
+                story.append(Spacer(1, 10))
+                story.append(Paragraph(text, heading3_style))
+                story.append(Spacer(1, 10))
+            
+            # Tabela
+            elif line.startswith('|'):
+                if not in_table:
+                    in_table = True
+                    current_table_rows = []
+                # Parsear linha da tabela
+                cells = [cell.strip() for cell in line.split('|')[1:-1]]
+                current_table_rows.append(cells)
+            
+            # Linha separadora de tabela
+            elif line.startswith('|---') and in_table:
+                i += 1
+                continue
+            
+            # Fim da tabela ou processar tabela
+            elif in_table and line == '':
+                if current_table_rows:
+                    # Criar tabela
+                    table_data = current_table_rows
+                    table = Table(table_data)
+                    table.setStyle(TableStyle([
+                        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#3498db')),
+                        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+                        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+                        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+                        ('FONTSIZE', (0, 0), (-1, 0), 10),
+                        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+                        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+                        ('GRID', (0, 0), (-1, -1), 1, colors.grey),
+                        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f9f9f9')]),
+                        ('FONTSIZE', (0, 1), (-1, -1), 9),
+                        ('TOPPADDING', (0, 1), (-1, -1), 8),
+                        ('BOTTOMPADDING', (0, 1), (-1, -1), 8),
+                    ]))
+                    story.append(table)
+                    story.append(Spacer(1, 12))
+                    current_table_rows = []
+                    in_table = False
+            
+            # Imagem
+            elif '![' in line and '](' in line:
+                # Extrair caminho da imagem
+                match = re.search(r'!\[.*?\]\((.*?)\)', line)
+                if match:
+                    img_path = match.group(1)
+                    # Se for caminho relativo, tornar absoluto
+                    if not os.path.isabs(img_path):
+                        img_path = os.path.join(os.path.dirname(md_file), img_path)
+                    
+                    if os.path.exists(img_path):
+                        try:
+                            img = Image(img_path, width=16*cm, height=12*cm, kind='proportional')
+                            story.append(Spacer(1, 12))
+                            story.append(img)
+                            story.append(Spacer(1, 12))
+                        except:
+                            story.append(Paragraph(f"[Imagem: {os.path.basename(img_path)}]", normal_style))
+            
+            # Lista
+            elif line.startswith('- ') or line.startswith('* '):
+                text = line[2:].strip()
+                # Remover formatação markdown básica
+                text = re.sub(r'\*\*(.*?)\*\*', r'<b>\1</b>', text)
+                story.append(Paragraph(f"• {text}", normal_style))
+            
+            # Parágrafo normal
+            elif line and not line.startswith('---'):
+                # Remover formatação markdown básica
+                text = line
+                text = re.sub(r'\*\*(.*?)\*\*', r'<b>\1</b>', text)
+                text = re.sub(r'\*(.*?)\*', r'<i>\1</i>', text)
+                text = re.sub(r'`(.*?)`', r'<font name="Courier">\1</font>', text)
+                story.append(Paragraph(text, normal_style))
+                story.append(Spacer(1, 6))
+            
+            # Separador
+            elif line.startswith('---'):
+                story.append(Spacer(1, 20))
+            
+            i += 1
+        
+        # Construir PDF
+        doc.build(story)
+        print(f"✓ PDF gerado com sucesso usando reportlab: {pdf_file}")
+        return pdf_file
+        
+    except ImportError:
+        print("\n⚠ reportlab não está instalado.")
+        print("Instale com: pip install reportlab")
+        print(f"\nO ficheiro Markdown foi gerado: {os.path.abspath(md_file)}")
+        return None
+    except Exception as e:
+        print(f"\n⚠ Erro ao gerar PDF: {str(e)}")
+        print(f"O ficheiro Markdown foi gerado: {os.path.abspath(md_file)}")
+        import traceback
+        traceback.print_exc()
+        return None
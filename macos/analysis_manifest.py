@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Manifesto das entradas e dos artefactos de uma pasta de resultados
+Cada etapa da análise (métricas, gráficos, relatório, Gemini) fica registada
+com uma chave calculada a partir das suas entradas e com os ficheiros que
+produziu; ao repetir a análise, as etapas cuja chave não mudou (e cujos
+ficheiros ainda existem) são reutilizadas em vez de refeitas
+"""
+
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+
+# Nome do manifesto dentro de cada pasta de resultados
+MANIFEST_FILENAME = 'analysis_manifest.json'
+
+# Versão do formato do manifesto (alterar invalida os manifestos existentes)
+MANIFEST_VERSION = 1
+
+
+def stage_key(*parts):
+    """Chave de uma etapa a partir das suas entradas (qualquer estrutura serializável em JSON)"""
+    raw = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def dataframe_hash(df, exclude=()):
+    """Hash do conteúdo de um DataFrame (sem o índice e sem as colunas `exclude`)"""
+    df = df.drop(columns=[column for column in exclude if column in df])
+    digest = hashlib.sha256(json.dumps(list(df.columns)).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    return digest.hexdigest()
+
+
+class AnalysisManifest:
+    """Manifesto (JSON) das etapas de análise de uma pasta de resultados"""
+
+    def __init__(self, results_dir):
+        self.results_dir = results_dir
+        self.path = os.path.join(results_dir, MANIFEST_FILENAME)
+        self.inputs = {}
+        self.stages = {}
+
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return
+        if manifest.get('version') == MANIFEST_VERSION:
+            self.inputs = manifest.get('inputs', {})
+            self.stages = manifest.get('stages', {})
+
+    def lookup(self, stage, key):
+        """Dados guardados da etapa se a chave coincidir e os artefactos existirem, senão None"""
+        entry = self.stages.get(stage)
+        if entry is None or entry['key'] != key:
+            return None
+        if not all(os.path.exists(os.path.join(self.results_dir, path)) for path in entry['artifacts']):
+            return None
+        return entry['data']
+
+    def record(self, stage, key, artifacts=(), data=None):
+        """Regista a etapa com a chave das entradas e os ficheiros que produziu"""
+        self.stages[stage] = {
+            'key': key,
+            'artifacts': [os.path.relpath(path, self.results_dir) for path in artifacts],
+            'data': data if data is not None else {},
+        }
+
+    def invalidate(self, paths):
+        """Esquece as etapas que produziram algum dos ficheiros `paths`; devolve os seus nomes"""
+        paths = {os.path.relpath(path, self.results_dir) for path in paths}
+        stale = [stage for stage, entry in self.stages.items() if paths.intersection(entry['artifacts'])]
+        for stage in stale:
+            del self.stages[stage]
+        return stale
+
+    def artifact_path(self, path):
+        """Caminho de um artefacto registado (relativo à pasta de resultados)"""
+        return os.path.join(self.results_dir, path) if path else None
+
+    def save(self):
+        """Escreve o manifesto (escrita atómica)"""
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': MANIFEST_VERSION, 'inputs': self.inputs, 'stages': self.stages},
+                      f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
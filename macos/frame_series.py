@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Séries temporais das métricas por frame
+Guarda os valores por frame de cada par num ficheiro .npz compacto (pasta
+frame_metrics/ ao lado de figures/) e permite lê-los de forma preguiçosa
+para desenhar curvas de qualidade ao longo do tempo
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+
+import numpy as np
+
+
+# Pasta (dentro do diretório de resultados) com as séries por frame
+FRAME_SERIES_DIRNAME = 'frame_metrics'
+
+
+def series_path(results_dir, dist_path):
+    """Caminho do ficheiro .npz com as séries de um vídeo distorcido
+
+    O nome leva um hash do caminho completo do vídeo: vídeos com o mesmo nome
+    em pastas diferentes não partilham o ficheiro.
+    """
+    path_hash = hashlib.sha1(os.path.abspath(dist_path).encode()).hexdigest()[:8]
+    return os.path.join(results_dir, FRAME_SERIES_DIRNAME, f"{os.path.basename(dist_path)}.{path_hash}.npz")
+
+
+def _series_name(filename):
+    """Nome do vídeo distorcido a partir do nome do ficheiro .npz (com ou sem hash do caminho)"""
+    stem = filename[:-len('.npz')]
+    name, _, path_hash = stem.rpartition('.')
+    if len(path_hash) == 8 and all(c in '0123456789abcdef' for c in path_hash):
+        return name
+    return stem
+
+
+def write_frame_series(results_dir, ref_path, dist_path, pair_metrics):
+    """Escreve as séries por frame de um par (índices dos frames + uma coluna por métrica)"""
+    path = series_path(results_dir, dist_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    columns = {name: np.asarray(values, dtype=np.float64) for name, values in pair_metrics.per_frame.items()}
+    meta = {
+        'reference': os.path.basename(ref_path),
+        'distorted': os.path.basename(dist_path),
+        'sampling': pair_metrics.sampling.to_dict() if pair_metrics.sampling else None,
+        'metrics': sorted(columns),
+    }
+
+    # Escrita atómica: um leitor nunca vê um ficheiro incompleto
+    tmp_path = path + '.tmp.npz'
+    np.savez_compressed(tmp_path, frame_index=np.asarray(pair_metrics.frame_indices, dtype=np.int64),
+                        meta=np.array(json.dumps(meta)), **columns)
+    os.replace(tmp_path, path)
+    return path
+
+
+class FrameSeries:
+    """Séries de um par, lidas do .npz apenas quando cada coluna é pedida"""
+
+    def __init__(self, path):
+        self.path = path
+        self._npz = None
+
+    def _data(self):
+        if self._npz is None:
+            self._npz = np.load(self.path)
+        return self._npz
+
+    @property
+    def meta(self):
+        return json.loads(str(self._data()['meta']))
+
+    @property
+    def metrics(self):
+        return self.meta['metrics']
+
+    @property
+    def frame_index(self):
+        return self._data()['frame_index']
+
+    def __getitem__(self, metric):
+        return self._data()[metric]
+
+    def close(self):
+        if self._npz is not None:
+            self._npz.close()
+            self._npz = None
+
+
+class FrameSeriesStore:
+    """Acesso preguiçoso às séries por frame de um diretório de resultados"""
+
+    def __init__(self, results_dir):
+        self.series_dir = os.path.join(results_dir, FRAME_SERIES_DIRNAME)
+
+    def _files(self):
+        if not os.path.isdir(self.series_dir):
+            return []
+        return [name for name in os.listdir(self.series_dir)
+                if name.endswith('.npz') and not name.endswith('.tmp.npz')]
+
+    def names(self):
+        """Nomes dos vídeos distorcidos com séries guardadas"""
+        return sorted({_series_name(name) for name in self._files()})
+
+    def _path(self, dist_filename):
+        """Ficheiro de um vídeo: pelo caminho completo ou, só com o nome, o mais recente com esse nome"""
+        exact = series_path(os.path.dirname(self.series_dir), dist_filename)
+        if os.path.exists(exact):
+            return exact
+        name = os.path.basename(dist_filename)
+        paths = [os.path.join(self.series_dir, filename) for filename in self._files()
+                 if _series_name(filename) == name]
+        return max(paths, key=os.path.getmtime) if paths else None
+
+    def __contains__(self, dist_filename):
+        return self._path(dist_filename) is not None
+
+    def __getitem__(self, dist_filename):
+        path = self._path(dist_filename)
+        if path is None:
+            raise KeyError(dist_filename)
+        return FrameSeries(path)
+
+
+def plot_temporal_curves(results_dir, metric='PSNR', names=None, output_path=None):
+    """Desenha a curva temporal de uma métrica para os vídeos indicados (ou todos)"""
+    import matplotlib
+    matplotlib.use('Agg')  # Usar backend não-interativo
+    import matplotlib.pyplot as plt
+
+    store = FrameSeriesStore(results_dir)
+    names = names or store.names()
+    if output_path is None:
+        output_path = os.path.join(results_dir, 'figures', f"{metric.lower()}_temporal.png")
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+
+    plt.figure(figsize=(12, 6))
+    for name in names:
+        series = store[name]
+        plt.plot(series.frame_index, series[metric], label=name, linewidth=1)
+        series.close()
+    plt.xlabel('Frame', fontsize=12)
+    plt.ylabel(metric, fontsize=12)
+    plt.title(f'{metric} ao longo do tempo', fontsize=14)
+    plt.legend()
+    plt.grid(True, alpha=0.3)
+    plt.tight_layout()
+    plt.savefig(output_path, dpi=300, bbox_inches='tight')
+    plt.close()
+    return output_path
+
+
+def main():
+    """Linha de comandos para listar e desenhar as séries por frame de um resultado"""
+    parser = argparse.ArgumentParser(description="Séries temporais das métricas por frame")
+    parser.add_argument('results_dir', help="diretório do resultado (ex.: results/nomeresultado)")
+    parser.add_argument('--metric', default='PSNR', help="métrica a desenhar (PSNR, SSIM)")
+    parser.add_argument('--video', action='append', help="vídeo distorcido a incluir (pode repetir)")
+    parser.add_argument('--list', action='store_true', help="apenas listar os vídeos disponíveis")
+    args = parser.parse_args()
+
+    if args.list:
+        for name in FrameSeriesStore(args.results_dir).names():
+            print(name)
+        return
+
+    output_path = plot_temporal_curves(args.results_dir, args.metric, args.video)
+    print(f"✓ Gráfico gerado: {output_path}")
+
+
+if __name__ == "__main__":
+    main()
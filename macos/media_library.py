@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""
+Índice persistente (SQLite) dos vídeos das pastas da biblioteca
+Cada vídeo fica registado pelo nome do ficheiro e pela impressão digital do
+conteúdo, com caminho, duração, FPS e resolução. O índice é construído em
+paralelo e atualizado de forma incremental: só as pastas cuja data de
+modificação mudou são relidas. Resolver o nome de um vídeo distorcido passa a
+ser uma consulta ao índice, sem selecionar os ficheiros à mão
+"""
+
+import argparse
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+from metrics_cache import file_fingerprint
+
+
+# Localização por omissão do índice da biblioteca
+DEFAULT_LIBRARY_PATH = os.path.join('.', 'results', 'media_library.sqlite')
+
+# mtime guardado para uma pasta com vídeos que não foi possível analisar (relida na próxima atualização)
+FAILED_DIR_MTIME = -1
+
+# Extensões indexadas (as mesmas dos diálogos de seleção de vídeos)
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv', '.flv', '.wmv')
+
+
+def probe_video(path):
+    """Informação de um vídeo: tamanho, mtime, impressão digital, duração, FPS e resolução"""
+    stat = os.stat(path)
+    cap = cv2.VideoCapture(path)
+    try:
+        # Vídeos que o OpenCV não consegue abrir devolvem 0 ou -1
+        fps = max(0.0, cap.get(cv2.CAP_PROP_FPS))
+        frames = max(0, int(cap.get(cv2.CAP_PROP_FRAME_COUNT)))
+        width = max(0, int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)))
+        height = max(0, int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+    finally:
+        cap.release()
+
+    return {
+        'path': path,
+        'dir': os.path.dirname(path),
+        'filename': os.path.basename(path),
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'fingerprint': file_fingerprint(path),
+        'duration': frames / fps if fps else None,
+        'fps': fps or None,
+        'width': width or None,
+        'height': height or None,
+        'frames': frames,
+    }
+
+
+def _is_under(path, directories):
+    """Indica se `path` é uma das pastas `directories` ou está dentro de alguma delas"""
+    return any(path == directory or path.startswith(os.path.join(directory, '')) for directory in directories)
+
+
+class MediaLibrary:
+    """Índice SQLite dos vídeos das pastas da biblioteca"""
+
+    def __init__(self, db_path=DEFAULT_LIBRARY_PATH):
+        self.db_path = db_path
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+
+        self._conn = sqlite3.connect(db_path)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS roots (path TEXT PRIMARY KEY)")
+        # Pastas já lidas e a sua data de modificação (muda quando um ficheiro é criado/removido)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS directories (
+                path TEXT PRIMARY KEY,
+                mtime_ns INTEGER NOT NULL
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS media (
+                path TEXT PRIMARY KEY,
+                dir TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                fingerprint TEXT NOT NULL,
+                duration REAL,
+                fps REAL,
+                width INTEGER,
+                height INTEGER,
+                frames INTEGER
+            )
+        """)
+        for column in ('filename', 'fingerprint', 'dir'):
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_media_{column} ON media ({column})")
+        self._conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self._conn.close()
+
+    def roots(self):
+        """Pastas da biblioteca"""
+        return [row[0] for row in self._conn.execute("SELECT path FROM roots ORDER BY path")]
+
+    def add_root(self, path):
+        """Acrescenta uma pasta à biblioteca (indexada na próxima atualização)"""
+        self._conn.execute("INSERT OR IGNORE INTO roots VALUES (?)", (os.path.abspath(path),))
+        self._conn.commit()
+
+    def remove_root(self, path):
+        """Retira uma pasta da biblioteca e os seus vídeos do índice"""
+        path = os.path.abspath(path)
+        prefix = os.path.join(path, '')
+        self._conn.execute("DELETE FROM roots WHERE path = ?", (path,))
+        for table, column in (('directories', 'path'), ('media', 'dir')):
+            self._conn.execute(f"DELETE FROM {table} WHERE {column} = ? OR substr({column}, 1, ?) = ?",
+                               (path, len(prefix), prefix))
+        self._conn.commit()
+
+    def update(self, workers=None, progress=None, full=False):
+        """Atualiza o índice; devolve contagens (vídeos novos/alterados/removidos, pastas relidas)
+
+        Percorre as pastas da biblioteca e relê apenas as pastas cuja data de
+        modificação mudou; os vídeos novos ou alterados (tamanho/mtime) são
+        analisados em paralelo por `workers` threads. `progress(feitos, total)`
+        é chamado à medida que os vídeos são analisados. Com `full`, relê
+        todas as pastas (ex.: vídeos editados sem mudar a pasta).
+        """
+        known_dirs = dict(self._conn.execute("SELECT path, mtime_ns FROM directories"))
+        changed_dirs = {}
+        seen_dirs = set()
+        walked_roots = []
+        unreadable_dirs = []
+        for root in self.roots():
+            # Pasta indisponível (ex.: disco de rede desligado): o seu índice é mantido
+            if not os.path.isdir(root) or not os.access(root, os.R_OK | os.X_OK):
+                print(f"⚠ Aviso: Pasta da biblioteca indisponível (índice mantido): {root}")
+                continue
+            walked_roots.append(root)
+            for dirpath, dirnames, _ in os.walk(root, onerror=lambda e: unreadable_dirs.append(e.filename)):
+                seen_dirs.add(dirpath)
+                try:
+                    mtime_ns = os.stat(dirpath).st_mtime_ns
+                except OSError:
+                    continue
+                if full or known_dirs.get(dirpath) != mtime_ns:
+                    changed_dirs[dirpath] = mtime_ns
+
+        # Vídeos das pastas modificadas: novos ou alterados são analisados, os restantes mantidos
+        to_probe = []
+        removed = []
+        for dirpath in list(changed_dirs):
+            indexed = {path: (size, mtime_ns) for path, size, mtime_ns in self._conn.execute(
+                "SELECT path, size, mtime_ns FROM media WHERE dir = ?", (dirpath,))}
+            try:
+                entries = list(os.scandir(dirpath))
+            except OSError:
+                # Pasta ilegível: mantida como estava e relida na próxima atualização
+                del changed_dirs[dirpath]
+                continue
+            present = set()
+            for entry in entries:
+                try:
+                    if not entry.is_file() or not entry.name.lower().endswith(VIDEO_EXTENSIONS):
+                        continue
+                    stat = entry.stat()
+                except OSError:
+                    continue  # Ficheiro removido entretanto
+                present.add(entry.path)
+                if indexed.get(entry.path) != (stat.st_size, stat.st_mtime_ns):
+                    to_probe.append(entry.path)
+            removed += [path for path in indexed if path not in present]
+
+        # Pastas que deixaram de existir (apenas dentro das pastas percorridas e legíveis)
+        vanished_dirs = [path for path in known_dirs if path not in seen_dirs
+                         and _is_under(path, walked_roots) and not _is_under(path, unreadable_dirs)]
+        for dirpath in vanished_dirs:
+            removed += [row[0] for row in self._conn.execute("SELECT path FROM media WHERE dir = ?", (dirpath,))]
+
+        # Análise dos vídeos em paralelo (abrir o contentor e ler o ficheiro não retém o GIL)
+        probed = []
+        failed = 0
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+            futures = [executor.submit(probe_video, path) for path in to_probe]
+            for done, future in enumerate(futures, start=1):
+                try:
+                    probed.append(future.result())
+                except OSError as e:
+                    failed += 1
+                    print(f"⚠ Aviso: Falha ao indexar {to_probe[done - 1]}: {e}")
+                    # mtime impossível: a pasta é relida (e o vídeo tentado de novo) na próxima atualização
+                    changed_dirs[os.path.dirname(to_probe[done - 1])] = FAILED_DIR_MTIME
+                if progress:
+                    progress(done, len(futures))
+
+        columns = ('path', 'dir', 'filename', 'size', 'mtime_ns', 'fingerprint', 'duration', 'fps',
+                   'width', 'height', 'frames')
+        self._conn.executemany("DELETE FROM media WHERE path = ?", [(path,) for path in removed])
+        self._conn.executemany(f"INSERT OR REPLACE INTO media VALUES ({', '.join('?' * len(columns))})",
+                               [tuple(info[column] for column in columns) for info in probed])
+        self._conn.executemany("DELETE FROM directories WHERE path = ?", [(path,) for path in vanished_dirs])
+        self._conn.executemany("INSERT OR REPLACE INTO directories VALUES (?, ?)", list(changed_dirs.items()))
+        self._conn.commit()
+
+        return {'indexed': len(probed), 'removed': len(removed), 'failed': failed,
+                'changed_dirs': len(changed_dirs), 'dirs': len(seen_dirs)}
+
+    def resolve(self, filenames, near=None):
+        """Caminhos dos vídeos com os nomes indicados: {nome: caminho} (nomes em falta são omitidos)
+
+        Um nome presente em várias pastas com conteúdo diferente é resolvido
+        para a cópia na pasta `near` (ex.: a do vídeo de referência), se
+        existir, ou para a modificada mais recentemente.
+        """
+        near = os.path.abspath(near) if near else None
+        names = sorted({os.path.basename(filename) for filename in filenames})
+        candidates = {}
+        # Consulta pelo índice de nomes, em blocos (limite de parâmetros do SQLite)
+        for start in range(0, len(names), 500):
+            chunk = names[start:start + 500]
+            for path, filename, directory, fingerprint in self._conn.execute(
+                    f"SELECT path, filename, dir, fingerprint FROM media "
+                    f"WHERE filename IN ({', '.join('?' * len(chunk))}) ORDER BY mtime_ns DESC", chunk):
+                candidates.setdefault(filename, []).append((path, directory, fingerprint))
+
+        resolved = {}
+        for filename in filenames:
+            existing = [candidate for candidate in candidates.get(os.path.basename(filename), [])
+                        if os.path.exists(candidate[0])]
+            if not existing:
+                continue
+            chosen = next((candidate for candidate in existing if candidate[1] == near), existing[0])
+            if len({fingerprint for _, _, fingerprint in existing}) > 1 and chosen[1] != near:
+                print(f"⚠ Aviso: {filename} existe com conteúdo diferente em {len(existing)} pastas; "
+                      f"usado {chosen[0]}")
+            resolved[filename] = chosen[0]
+        return resolved
+
+    def info(self, path):
+        """Informação indexada de um vídeo (dict), ou None"""
+        cursor = self._conn.execute("SELECT * FROM media WHERE path = ?", (os.path.abspath(path),))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        return dict(zip([column[0] for column in cursor.description], row))
+
+    def find_fingerprint(self, fingerprint):
+        """Caminhos dos vídeos com esta impressão digital (cópias do mesmo conteúdo)"""
+        return [row[0] for row in self._conn.execute("SELECT path FROM media WHERE fingerprint = ?",
+                                                     (fingerprint,))]
+
+    def stats(self):
+        """Número de pastas da biblioteca e de vídeos indexados, e tamanho do índice"""
+        videos = self._conn.execute("SELECT COUNT(*) FROM media").fetchone()[0]
+        size = os.path.getsize(self.db_path) if os.path.exists(self.db_path) else 0
+        return {'roots': len(self.roots()), 'videos': videos, 'bytes': size}
+
+
+def main():
+    """Linha de comandos para gerir a biblioteca de vídeos"""
+    parser = argparse.ArgumentParser(description="Gestão do índice da biblioteca de vídeos")
+    parser.add_argument('--db', default=DEFAULT_LIBRARY_PATH, help="caminho do índice da biblioteca")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    add_parser = subparsers.add_parser('add', help="acrescenta pastas à biblioteca e atualiza o índice")
+    add_parser.add_argument('paths', nargs='+', help="pastas com vídeos")
+
+    remove_parser = subparsers.add_parser('remove', help="retira pastas da biblioteca")
+    remove_parser.add_argument('paths', nargs='+', help="pastas a retirar")
+
+    update_parser = subparsers.add_parser('update', help="atualiza o índice (apenas pastas modificadas)")
+    update_parser.add_argument('--workers', type=int, help="threads para analisar os vídeos")
+    update_parser.add_argument('--full', action='store_true', help="relê todas as pastas")
+
+    find_parser = subparsers.add_parser('find', help="procura vídeos pelo nome do ficheiro")
+    find_parser.add_argument('names', nargs='+', help="nomes dos ficheiros")
+
+    subparsers.add_parser('stats', help="mostra o número de pastas e de vídeos indexados")
+
+    args = parser.parse_args()
+
+    with MediaLibrary(args.db) as library:
+        if args.command in ('add', 'update'):
+            for path in getattr(args, 'paths', []):
+                library.add_root(path)
+            result = library.update(workers=getattr(args, 'workers', None), full=getattr(args, 'full', False))
+            print(f"✓ {result['indexed']} vídeo(s) indexado(s), {result['removed']} removido(s) "
+                  f"({result['changed_dirs']}/{result['dirs']} pasta(s) relida(s))")
+        elif args.command == 'remove':
+            for path in args.paths:
+                library.remove_root(path)
+            print(f"✓ {len(args.paths)} pasta(s) retirada(s)")
+        elif args.command == 'find':
+            resolved = library.resolve(args.names)
+            for name in args.names:
+                path = resolved.get(name)
+                info = library.info(path) if path else None
+                if info:
+                    print(f"{name}: {path} ({info['width'] or '?'}x{info['height'] or '?'}, "
+                          f"{info['fps'] or 0:.2f} fps, {info['duration'] or 0:.1f} s)")
+                else:
+                    print(f"{name}: não encontrado")
+        else:
+            stats = library.stats()
+            print(f"Pastas: {stats['roots']}")
+            print(f"Vídeos: {stats['videos']}")
+            print(f"Tamanho: {stats['bytes'] / 1024:.1f} KiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+Cache persistente de resultados de métricas objetivas
+Os resultados são indexados pela impressão digital do conteúdo dos vídeos,
+pela métrica, pelos seus parâmetros e pela política de amostragem
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+import numpy as np
+
+from quality_metrics import (DEFAULT_METRICS, PairMetrics, SamplingPolicy, create_accumulators,
+                             run_metric_jobs)
+
+
+# Localização por omissão da base de dados da cache
+DEFAULT_CACHE_PATH = os.path.join('.', 'results', 'metrics_cache.sqlite')
+
+# Número máximo de entradas mantidas (as menos usadas recentemente são removidas)
+DEFAULT_MAX_ENTRIES = 20000
+
+# Versão dos algoritmos das métricas (alterar invalida todos os resultados em cache)
+METRICS_VERSION = 2
+
+# Tamanho de cada bloco lido para a impressão digital de um ficheiro
+FINGERPRINT_CHUNK_SIZE = 1024 * 1024
+
+# Impressões digitais já calculadas neste processo: (caminho, tamanho, mtime) -> hash
+_fingerprint_memo = {}
+
+
+def file_fingerprint(path):
+    """Impressão digital rápida do conteúdo de um ficheiro
+
+    Combina o tamanho com o hash BLAKE2 do início, meio e fim do ficheiro
+    (1 MiB cada), evitando ler vídeos inteiros.
+    """
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if memo_key in _fingerprint_memo:
+        return _fingerprint_memo[memo_key]
+
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(str(stat.st_size).encode())
+    with open(path, 'rb') as f:
+        for offset in (0, stat.st_size // 2, max(0, stat.st_size - FINGERPRINT_CHUNK_SIZE)):
+            f.seek(offset)
+            digest.update(f.read(FINGERPRINT_CHUNK_SIZE))
+
+    fingerprint = digest.hexdigest()
+    _fingerprint_memo[memo_key] = fingerprint
+    return fingerprint
+
+
+def effective_metric_params(metrics, metric_params=None):
+    """Parâmetros efetivos de cada métrica (inclui os valores por omissão)"""
+    return {accumulator.name: accumulator.params()
+            for accumulator in create_accumulators(metrics, metric_params)}
+
+
+class MetricsCache:
+    """Cache SQLite de resultados de métricas com remoção LRU"""
+
+    def __init__(self, db_path=DEFAULT_CACHE_PATH, max_entries=DEFAULT_MAX_ENTRIES):
+        self.db_path = db_path
+        self.max_entries = max_entries
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+
+        self._conn = sqlite3.connect(db_path)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS metric_results (
+                key TEXT PRIMARY KEY,
+                ref_fingerprint TEXT NOT NULL,
+                dist_fingerprint TEXT NOT NULL,
+                dist_filename TEXT,
+                metric TEXT NOT NULL,
+                params TEXT NOT NULL,
+                sampling TEXT NOT NULL,
+                value REAL NOT NULL,
+                frame_indices TEXT NOT NULL,
+                created REAL NOT NULL,
+                last_access REAL NOT NULL,
+                frame_values BLOB
+            )
+        """)
+        # Bases de dados antigas não têm os valores por frame
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(metric_results)")]
+        if 'frame_values' not in columns:
+            self._conn.execute("ALTER TABLE metric_results ADD COLUMN frame_values BLOB")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_metric_results_access "
+                           "ON metric_results (last_access)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_metric_results_dist "
+                           "ON metric_results (dist_fingerprint)")
+        self._conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self._conn.close()
+
+    @staticmethod
+    def _key(ref_fingerprint, dist_fingerprint, metric, params_json, sampling_json):
+        raw = json.dumps([METRICS_VERSION, ref_fingerprint, dist_fingerprint, metric, params_json,
+                          sampling_json])
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def _keys(self, ref_path, dist_path, metrics, metric_params, sampling):
+        """Chaves de cache de cada métrica de um par"""
+        ref_fingerprint = file_fingerprint(ref_path)
+        dist_fingerprint = file_fingerprint(dist_path)
+        sampling_json = json.dumps(sampling.to_dict(), sort_keys=True)
+        params = effective_metric_params(metrics, metric_params)
+
+        keys = {}
+        for metric in metrics:
+            params_json = json.dumps(params[metric], sort_keys=True)
+            keys[metric] = (self._key(ref_fingerprint, dist_fingerprint, metric, params_json, sampling_json),
+                            ref_fingerprint, dist_fingerprint, params_json, sampling_json)
+        return keys
+
+    def get(self, ref_path, dist_path, metrics=DEFAULT_METRICS, sampling=None, metric_params=None):
+        """Devolve o PairMetrics em cache para o par, ou None se faltar alguma métrica
+
+        Entradas sem valores por frame (anteriores à exportação das séries)
+        contam como em falta.
+        """
+        sampling = sampling or SamplingPolicy()
+        keys = self._keys(ref_path, dist_path, metrics, metric_params, sampling)
+
+        means = {}
+        per_frame = {}
+        frame_indices = None
+        for metric, (key, *_) in keys.items():
+            row = self._conn.execute("SELECT value, frame_indices, frame_values FROM metric_results "
+                                     "WHERE key = ?", (key,)).fetchone()
+            if row is None or row[2] is None:
+                return None
+            means[metric] = row[0]
+            frame_indices = json.loads(row[1])
+            per_frame[metric] = np.frombuffer(row[2], dtype=np.float64).tolist()
+
+        now = time.time()
+        self._conn.executemany("UPDATE metric_results SET last_access = ? WHERE key = ?",
+                               [(now, key) for key, *_ in keys.values()])
+        self._conn.commit()
+        return PairMetrics(means, per_frame, frame_indices, sampling, cached=True)
+
+    def put(self, ref_path, dist_path, pair_metrics, metrics=DEFAULT_METRICS, sampling=None,
+            metric_params=None):
+        """Guarda o resultado de um par e aplica o limite de entradas"""
+        sampling = sampling or SamplingPolicy()
+        keys = self._keys(ref_path, dist_path, metrics, metric_params, sampling)
+        frame_indices_json = json.dumps([int(i) for i in pair_metrics.frame_indices])
+
+        now = time.time()
+        rows = []
+        for metric, (key, ref_fingerprint, dist_fingerprint, params_json, sampling_json) in keys.items():
+            frame_values = np.asarray(pair_metrics.per_frame[metric], dtype=np.float64).tobytes()
+            rows.append((key, ref_fingerprint, dist_fingerprint, os.path.basename(dist_path), metric,
+                         params_json, sampling_json, float(pair_metrics[metric]), frame_indices_json,
+                         now, now, frame_values))
+        self._conn.executemany("INSERT OR REPLACE INTO metric_results "
+                               "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        self._evict()
+        self._conn.commit()
+
+    def _evict(self):
+        """Remove as entradas menos usadas recentemente acima de max_entries"""
+        self._conn.execute("""
+            DELETE FROM metric_results WHERE key NOT IN (
+                SELECT key FROM metric_results ORDER BY last_access DESC LIMIT ?
+            )
+        """, (self.max_entries,))
+
+    def invalidate(self, video_path=None, metric=None):
+        """Remove entradas (todas, de um vídeo e/ou de uma métrica); devolve quantas foram removidas"""
+        conditions = []
+        args = []
+        if video_path:
+            fingerprint = file_fingerprint(video_path)
+            conditions.append("(ref_fingerprint = ? OR dist_fingerprint = ?)")
+            args += [fingerprint, fingerprint]
+        if metric:
+            conditions.append("metric = ?")
+            args.append(metric)
+
+        query = "DELETE FROM metric_results"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        removed = self._conn.execute(query, args).rowcount
+        self._conn.commit()
+        return removed
+
+    def stats(self):
+        """Número de entradas e tamanho da base de dados"""
+        entries = self._conn.execute("SELECT COUNT(*) FROM metric_results").fetchone()[0]
+        size = os.path.getsize(self.db_path) if os.path.exists(self.db_path) else 0
+        return {'entries': entries, 'max_entries': self.max_entries, 'bytes': size}
+
+
+def run_cached_metric_jobs(jobs, cache, metrics=DEFAULT_METRICS, sampling=None, metric_params=None,
+                           on_result=None, **run_options):
+    """Como run_metric_jobs, mas lê da cache e só calcula os pares em falta
+
+    Os resultados calculados são guardados na cache. `run_options` são
+    passadas a run_metric_jobs (workers, max_concurrent, control).
+    """
+    sampling = sampling or SamplingPolicy()
+    jobs = list(jobs)
+    results = [None] * len(jobs)
+
+    misses = []
+    for index, (ref_path, dist_path) in enumerate(jobs):
+        cached = None
+        if os.path.exists(ref_path) and os.path.exists(dist_path):
+            cached = cache.get(ref_path, dist_path, metrics, sampling, metric_params)
+        if cached is None:
+            misses.append(index)
+        else:
+            results[index] = (cached, None)
+
+    print(f"Cache de métricas: {len(jobs) - len(misses)} par(es) em cache, {len(misses)} a calcular")
+    if on_result:
+        for index, result in enumerate(results):
+            if result is not None:
+                on_result(index, *result)
+
+    if misses:
+        def on_miss_result(miss_index, pair_metrics, error):
+            index = misses[miss_index]
+            if pair_metrics is not None:
+                ref_path, dist_path = jobs[index]
+                cache.put(ref_path, dist_path, pair_metrics, metrics, sampling, metric_params)
+            if on_result:
+                on_result(index, pair_metrics, error)
+
+        computed = run_metric_jobs([jobs[i] for i in misses], metrics=metrics, sampling=sampling,
+                                   metric_params=metric_params, on_result=on_miss_result, **run_options)
+        for index, result in zip(misses, computed):
+            results[index] = result
+
+    return results
+
+
+def main():
+    """Linha de comandos para consultar e invalidar a cache"""
+    parser = argparse.ArgumentParser(description="Gestão da cache de métricas objetivas")
+    parser.add_argument('--db', default=DEFAULT_CACHE_PATH, help="caminho da base de dados da cache")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    subparsers.add_parser('stats', help="mostra o número de entradas e o tamanho da cache")
+
+    invalidate_parser = subparsers.add_parser('invalidate', help="remove entradas da cache")
+    invalidate_parser.add_argument('--video', help="remove apenas os resultados que envolvem este vídeo")
+    invalidate_parser.add_argument('--metric', help="remove apenas os resultados desta métrica")
+    invalidate_parser.add_argument('--all', action='store_true', help="remove todas as entradas")
+
+    args = parser.parse_args()
+
+    with MetricsCache(args.db) as cache:
+        if args.command == 'stats':
+            stats = cache.stats()
+            print(f"Entradas: {stats['entries']} (máx. {stats['max_entries']})")
+            print(f"Tamanho: {stats['bytes'] / 1024:.1f} KiB")
+        else:
+            if not (args.all or args.video or args.metric):
+                parser.error("indique --all, --video ou --metric")
+            removed = cache.invalidate(video_path=args.video, metric=args.metric)
+            print(f"✓ {removed} entrada(s) removida(s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+"""
+Reprodução lado a lado com descodificação antecipada
+Cada vídeo é descodificado e preparado para apresentação (redimensionado e
+convertido) por uma thread própria, para um buffer circular limitado; o loop
+de apresentação apenas retira pares de frames já prontos. Os frames são
+desenhados em canvases pré-alocados e reutilizados, sem alocações por frame.
+Os dois vídeos são emparelhados pelo instante de apresentação (CAP_PROP_POS_MSEC),
+o que mantém a sincronização mesmo com frame rates diferentes
+"""
+
+import collections
+import queue
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from quality_metrics import capture_timestamp_ms, timestamp_to_index
+
+
+# Frames prontos a apresentar guardados à frente por vídeo (mais = mais tolerância
+# a picos de descodificação, à custa de memória: ~0,6 MB por frame a 500x400)
+PLAYBACK_BUFFER_DEPTH = 8
+
+# Segundos do início do próximo ensaio descodificados enquanto o atual é avaliado
+PRELOAD_SECONDS = 2.0
+
+# Separação (píxeis) entre referência e distorcido na imagem composta
+COMPOSITE_GAP = 10
+
+# Atraso (em frames) a partir do qual um frame mostrado conta como atrasado
+LATE_FRAME_THRESHOLD = 0.5
+
+
+def letterbox_rect(frame_width, frame_height, width, height):
+    """Retângulo (x, y, largura, altura) do frame centrado num canvas mantendo o aspect ratio"""
+    aspect_ratio = frame_width / frame_height
+    if width / height > aspect_ratio:
+        new_height = height
+        new_width = int(new_height * aspect_ratio)
+    else:
+        new_width = width
+        new_height = int(new_width / aspect_ratio)
+
+    # Garantir que os tamanhos são válidos
+    new_width = max(1, min(new_width, width))
+    new_height = max(1, min(new_height, height))
+    return (width - new_width) // 2, (height - new_height) // 2, new_width, new_height
+
+
+class PlaybackTelemetry:
+    """Medições da reprodução de um ensaio, tal como vista pelo avaliador
+
+    frame_shown() é chamado na thread principal sempre que um par de frames
+    chega ao ecrã. `segment` identifica cada troço contínuo de reprodução: os
+    intervalos só são medidos dentro do mesmo troço (pausas e reinícios não
+    contam como falhas). to_row() devolve as colunas escritas no CSV.
+    """
+
+    COLUMNS = ('playback_fps', 'nominal_fps', 'dropped_frames', 'late_frames',
+               'max_frame_gap_ms', 'max_desync_ms', 'buffer_underruns')
+
+    def __init__(self, nominal_fps):
+        self.nominal_fps = nominal_fps
+        self.frames_shown = 0
+        self.late_frames = 0
+        self.max_gap = 0.0
+        self.max_desync_ms = 0.0
+        self._intervals = 0
+        self._interval_time = 0.0
+        self._last_shown = None
+        self._last_segment = None
+
+    def frame_shown(self, shown_at, deadline, desync_ms, segment):
+        """Regista um par mostrado em `shown_at` (time.monotonic) que devia aparecer em `deadline`"""
+        self.frames_shown += 1
+        if shown_at - deadline > LATE_FRAME_THRESHOLD / self.nominal_fps:
+            self.late_frames += 1
+        self.max_desync_ms = max(self.max_desync_ms, desync_ms)
+        if segment == self._last_segment:
+            gap = shown_at - self._last_shown
+            self._intervals += 1
+            self._interval_time += gap
+            self.max_gap = max(self.max_gap, gap)
+        self._last_shown = shown_at
+        self._last_segment = segment
+
+    @property
+    def achieved_fps(self):
+        """Frames mostrados por segundo de reprodução (0 se o vídeo não foi reproduzido)"""
+        return self._intervals / self._interval_time if self._interval_time > 0 else 0.0
+
+    def to_row(self, dropped_frames=0, underruns=0):
+        """Colunas de telemetria do ensaio (ver COLUMNS)"""
+        return {
+            'playback_fps': round(self.achieved_fps, 2),
+            'nominal_fps': round(self.nominal_fps, 2),
+            'dropped_frames': dropped_frames,
+            'late_frames': self.late_frames,
+            'max_frame_gap_ms': round(self.max_gap * 1000.0, 1),
+            'max_desync_ms': round(self.max_desync_ms, 1),
+            'buffer_underruns': underruns,
+        }
+
+
+class CanvasPool:
+    """Canvases RGB pré-alocados (com barras pretas) reutilizados através de uma lista livre
+
+    render() redimensiona e converte o frame BGR diretamente para a zona central
+    de um canvas livre (dst=), sem criar arrays novos. Cada canvas entregue tem
+    uma referência; retain() acrescenta outra e release() retira-a. O canvas só
+    volta à lista livre quando já não tem referências, por isso um frame no
+    buffer, em apresentação ou à espera de ser copiado pelo Tk nunca é
+    reescrito. São pré-alocados `count` canvases; se estiverem todos em uso é
+    alocado mais um. Os canvases são realocados quando o tamanho de destino muda.
+    """
+
+    def __init__(self, count):
+        self.count = count
+        self.size = None
+        self._free = []
+        self._refs = {}         # id(canvas) -> [canvas, referências]
+        self._letterbox = {}    # id(canvas) -> retângulo do frame (fora dele o canvas está a preto)
+        self._lock = threading.Lock()
+        self._geometry = None   # (forma do frame, retângulo, buffer do frame redimensionado)
+
+    def render(self, frame, width, height):
+        with self._lock:
+            if (width, height) != self.size:
+                self.size = (width, height)
+                self._free = [np.zeros((height, width, 3), dtype=np.uint8) for _ in range(self.count)]
+                self._letterbox = {}
+                self._geometry = None
+            if self._geometry is None or self._geometry[0] != frame.shape:
+                x, y, w, h = letterbox_rect(frame.shape[1], frame.shape[0], width, height)
+                self._geometry = (frame.shape, (x, y, w, h), np.empty((h, w, 3), dtype=np.uint8))
+            _, rect, resized = self._geometry
+            canvas = self._free.pop() if self._free else np.zeros((height, width, 3), dtype=np.uint8)
+            self._refs[id(canvas)] = [canvas, 1]
+
+        # Barras pretas refeitas apenas quando o retângulo do frame neste canvas muda
+        if self._letterbox.get(id(canvas), rect) != rect:
+            canvas.fill(0)
+        self._letterbox[id(canvas)] = rect
+        x, y, w, h = rect
+        cv2.resize(frame, (w, h), dst=resized, interpolation=cv2.INTER_LINEAR)
+        cv2.cvtColor(resized, cv2.COLOR_BGR2RGB, dst=canvas[y:y + h, x:x + w])
+        return canvas
+
+    def retain(self, canvas):
+        """Acrescenta uma referência a um canvas entregue por render()"""
+        with self._lock:
+            self._refs[id(canvas)][1] += 1
+
+    def release(self, canvas):
+        """Retira uma referência; sem referências, o canvas volta à lista livre"""
+        with self._lock:
+            entry = self._refs.get(id(canvas))
+            if entry is None:
+                return
+            entry[1] -= 1
+            if entry[1] > 0:
+                return
+            del self._refs[id(canvas)]
+            # Canvases de um tamanho anterior ou além dos pré-alocados são descartados
+            if canvas.shape[1::-1] == self.size and len(self._free) < self.count:
+                self._free.append(canvas)
+            else:
+                self._letterbox.pop(id(canvas), None)
+
+
+class SideBySideCompositor:
+    """Junta dois canvases lado a lado numa única imagem (buffer reutilizado)
+
+    Usado para enviar ao Tk uma só imagem por frame em vez de duas.
+    """
+
+    def __init__(self, gap=COMPOSITE_GAP):
+        self.gap = gap
+        self._output = None
+
+    def compose(self, left, right):
+        height = max(left.shape[0], right.shape[0])
+        width = left.shape[1] + self.gap + right.shape[1]
+        if self._output is None or self._output.shape[:2] != (height, width):
+            self._output = np.zeros((height, width, 3), dtype=np.uint8)
+        self._output[:left.shape[0], :left.shape[1]] = left
+        self._output[:right.shape[0], left.shape[1] + self.gap:] = right
+        return self._output
+
+
+class FramePrefetcher:
+    """Descodifica um vídeo à frente da apresentação para um buffer circular limitado
+
+    Com `target_size` (função que devolve (largura, altura) do destino), cada frame
+    é desenhado em letterbox num canvas RGB de um CanvasPool próprio; sem ela os
+    frames BGR são entregues tal como lidos. Cada canvas devolvido por frame_at()
+    fica reservado (não é reescrito) até o consumidor o mostrar e chamar
+    release(frame). O consumidor pede o frame em apresentação num dado instante
+    com frame_at(); os frames já ultrapassados são saltados (sem os descodificar,
+    quando ainda não estão no buffer) e seek() reposiciona o vídeo. `underruns`
+    conta as vezes em que o consumidor teve de esperar por um frame com o buffer
+    vazio. Com `preload_seconds` o buffer cresce para guardar pelo menos esses
+    segundos do vídeo (pré-carregamento).
+    """
+
+    def __init__(self, video_path, target_size=None, depth=PLAYBACK_BUFFER_DEPTH, preload_seconds=0):
+        self.video_path = video_path
+        self.cap = cv2.VideoCapture(video_path)
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 30.0
+        self.frame_ms = 1000.0 / self.fps
+        self.target_size = target_size
+        self.depth = max(1, depth, int(preload_seconds * self.fps))
+        self.underruns = 0
+
+        # Buffer + frame a ser escrito + frame apresentado + atualização pendente
+        # (só o número pré-alocado: os canvases em uso nunca são reescritos)
+        self._canvases = CanvasPool(self.depth + 3) if target_size is not None else None
+        self._decoded = None     # buffer reutilizado pelo descodificador
+
+        self._buffer = collections.deque()   # (índice, timestamp_ms, frame)
+        self._current = None                 # último item entregue (repetido até ser substituído)
+        self._cond = threading.Condition()
+        self._next_index = 0     # índice do próximo frame a ler do vídeo
+        self._min_index = 0      # frames abaixo deste índice já não interessam
+        self._seek_to = None     # reposicionamento pendente
+        self._generation = 0     # muda a cada seek (descarta leituras em curso)
+        self._eof = False
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        """Thread de descodificação: mantém o buffer cheio até ao fim do vídeo"""
+        while True:
+            with self._cond:
+                while (not self._stopped and self._seek_to is None
+                       and (self._eof or len(self._buffer) >= self.depth)):
+                    self._cond.wait()
+                if self._stopped:
+                    break
+                if self._seek_to is not None:
+                    self.cap.set(cv2.CAP_PROP_POS_FRAMES, self._seek_to)
+                    self._next_index = self._seek_to
+                    self._seek_to = None
+                    self._eof = False
+                generation = self._generation
+                index = self._next_index
+                skip = index < self._min_index
+
+            # Descodificar fora do lock (o consumidor continua a retirar frames)
+            if skip:
+                ret, frame = self.cap.grab(), None
+            elif self._canvases is not None:
+                ret, self._decoded = self.cap.read(self._decoded)
+                frame = self._canvases.render(self._decoded, *self.target_size()) if ret else None
+            else:
+                ret, frame = self.cap.read()
+
+            timestamp = capture_timestamp_ms(self.cap, index, self.fps) if ret and not skip else None
+
+            with self._cond:
+                if generation != self._generation:
+                    # Leitura anterior a um seek: o frame já não será apresentado
+                    self._release(frame)
+                    continue
+                if not ret:
+                    self._eof = True
+                else:
+                    self._next_index = index + 1
+                    if not skip:
+                        self._buffer.append((index, timestamp, frame))
+                self._cond.notify_all()
+
+        self.cap.release()
+
+    def frame_at(self, time_ms, timeout=None):
+        """Frame em apresentação no instante `time_ms`: devolve (índice, timestamp_ms, frame)
+
+        Os frames com timestamp anterior ao do frame devolvido são saltados; o
+        mesmo frame é devolvido de novo enquanto o seguinte não chega ao seu
+        instante (vídeos com menos FPS do que o relógio de apresentação).
+        Devolve None quando o vídeo acabou e lança queue.Empty se o frame não
+        ficar pronto dentro de `timeout` segundos.
+        """
+        # Frames nominalmente anteriores já foram ultrapassados: não os descodificar
+        self.drop_until(timestamp_to_index(time_ms, self.fps) - 1)
+
+        with self._cond:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            waited = False
+            while True:
+                while self._buffer and self._buffer[0][1] <= time_ms:
+                    if self._current is not None:
+                        self._release(self._current[2])
+                    self._current = self._buffer.popleft()
+                    self._cond.notify_all()
+                if self._buffer or self._eof or self._stopped:
+                    break
+                # Buffer vazio: o frame atual só é válido até ao instante nominal do seguinte
+                if self._current is not None and time_ms < self._current[1] + self.frame_ms:
+                    break
+                if not waited:
+                    self.underruns += 1
+                    waited = True
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise queue.Empty
+                self._cond.wait(remaining)
+
+            if self._current is None:
+                # Instante anterior ao primeiro frame: mostrar já o primeiro
+                return self._hand_out(self._buffer[0]) if self._buffer else None
+            if not self._buffer and self._eof and time_ms >= self._current[1] + self.frame_ms:
+                return None
+            return self._hand_out(self._current)
+
+    def _hand_out(self, item):
+        """Reserva o frame de `item` para o consumidor (libertado com release)"""
+        if self._canvases is not None:
+            self._canvases.retain(item[2])
+        return item
+
+    def _release(self, frame):
+        if self._canvases is not None and frame is not None:
+            self._canvases.release(frame)
+
+    def release(self, frame):
+        """Liberta um frame devolvido por frame_at() depois de apresentado"""
+        self._release(frame)
+
+    def _clear(self):
+        """Esvazia o buffer e esquece o frame atual, libertando os seus canvases (com o lock)"""
+        for _, _, frame in self._buffer:
+            self._release(frame)
+        self._buffer.clear()
+        if self._current is not None:
+            self._release(self._current[2])
+            self._current = None
+
+    def drop_until(self, index):
+        """Descarta os frames anteriores a `index` (já atrasados para apresentar)"""
+        with self._cond:
+            self._min_index = max(self._min_index, index)
+            while self._buffer and self._buffer[0][0] < index:
+                self._release(self._buffer.popleft()[2])
+            self._cond.notify_all()
+
+    def seek(self, index=0):
+        """Reposiciona o vídeo no frame `index`, descartando o que estava no buffer"""
+        with self._cond:
+            self._generation += 1
+            self._seek_to = index
+            self._min_index = index
+            self._eof = False
+            self._clear()
+            self._cond.notify_all()
+
+    def rewind(self):
+        """Volta ao início do vídeo, mantendo o buffer se ainda não saiu do início"""
+        with self._cond:
+            at_start = self._seek_to == 0 or (self._min_index == 0 and (
+                self._buffer[0][0] == 0 if self._buffer else self._next_index == 0))
+        if not at_start:
+            self.seek(0)
+
+    def close(self):
+        """Para a thread de descodificação e liberta o vídeo"""
+        with self._cond:
+            self._stopped = True
+            self._clear()
+            self._cond.notify_all()
+        if self._thread.is_alive():
+            self._thread.join(timeout=1.0)
+        elif not self._thread.ident:
+            self.cap.release()
+
+
+def next_frame_pair(reference, distorted, time_ms, timeout=None):
+    """Obtém os frames dos dois vídeos em apresentação no instante `time_ms`
+
+    Devolve (item_ref, item_dist), cada um (índice, timestamp_ms, frame), ou
+    None quando um dos vídeos acabou. Os dois frames devolvidos ficam reservados
+    até serem libertados com release() do respetivo FramePrefetcher.
+    """
+    ref_item = reference.frame_at(time_ms, timeout)
+    try:
+        dist_item = distorted.frame_at(time_ms, timeout)
+    except queue.Empty:
+        if ref_item is not None:
+            reference.release(ref_item[2])
+        raise
+    if ref_item is None or dist_item is None:
+        for stream, item in ((reference, ref_item), (distorted, dist_item)):
+            if item is not None:
+                stream.release(item[2])
+        return None
+    return ref_item, dist_item
@@ -0,0 +1,1316 @@
+#!/usr/bin/env python3
+"""
+Motor de métricas objetivas de qualidade de vídeo
+Descodifica cada par referência/distorcido uma única vez e alimenta
+todas as métricas registadas a partir da mesma passagem
+"""
+
+import multiprocessing
+import os
+import queue
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import cv2
+import numpy as np
+
+
+# Frames comparados por par na amostragem por omissão (para não demorar muito)
+MAX_FRAMES = 100
+
+# Memória máxima (bytes) para frames da referência em RAM antes de usar o disco
+REFERENCE_CACHE_RAM_BUDGET = 512 * 1024 * 1024
+
+# Espaço máximo (bytes) em disco para frames da referência além da RAM
+REFERENCE_CACHE_DISK_BUDGET = 8 * 1024 * 1024 * 1024
+
+# Distância máxima (em frames) percorrida com grab() antes de preferir um seek
+SEEK_THRESHOLD = 48
+
+# Tamanho mínimo (em frames) de cada segmento no cálculo segmentado de um único par
+MIN_SEGMENT_FRAMES = 50
+
+# Número de frames processados de cada vez pelo kernel de PSNR
+PSNR_BATCH_SIZE = 16
+
+# Implementação de SSIM por omissão: 'fast' (filtros separáveis float32) ou 'skimage' (referência)
+SSIM_IMPLEMENTATION = 'fast'
+
+# Frames processados de cada vez pelo kernel de SSIM (cada frame usa ~32 bytes/pixel de buffers)
+SSIM_BATCH_SIZE = 1
+
+# Diferença absoluta máxima, por frame, entre o SSIM 'fast' e o skimage com os mesmos parâmetros
+SSIM_FAST_TOLERANCE = 1e-4
+
+# Profundidade das filas do pipeline descodificação/cálculo, em frames (limita a memória:
+# ~8 MB por frame grayscale 4K); 0 = descodificação e cálculo na mesma thread.
+# Com um único CPU não há sobreposição possível e o pipeline fica desativado
+PIPELINE_QUEUE_DEPTH = 4 if (os.cpu_count() or 1) > 1 else 0
+
+# Diferença de FPS (frames/s) até à qual os vídeos são emparelhados por índice de frame;
+# acima dela cada frame do distorcido é comparado com o frame da referência em
+# apresentação no mesmo instante (ex.: escadas de frame rate 25 vs 50 fps)
+FPS_MATCH_TOLERANCE = 0.01
+
+# Folga (ms) ao converter timestamps em índices (contentores arredondam os timestamps ao ms)
+TIMESTAMP_TOLERANCE_MS = 1.0
+
+# Métricas calculadas por omissão em cada análise
+DEFAULT_METRICS = ('PSNR', 'SSIM')
+
+# Modo de arranque dos processos do pool: 'spawn' (o do macOS). Com 'fork' os
+# processos seriam copiados de um processo com várias threads (interface Tk,
+# pipeline de descodificação, progresso) e podiam ficar bloqueados num lock
+MP_START_METHOD = 'spawn'
+
+# Registo de métricas disponíveis (nome -> classe acumuladora)
+METRIC_REGISTRY = {}
+
+
+def register_metric(cls):
+    """Regista uma classe acumuladora de métrica pelo seu nome"""
+    METRIC_REGISTRY[cls.name] = cls
+    return cls
+
+
+def to_gray(frame):
+    """Converte o frame para grayscale se necessário"""
+    if len(frame.shape) == 3:
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    return frame
+
+
+def video_frame_count(video_path):
+    """Número de frames indicado pelo contentor do vídeo (0 se desconhecido)"""
+    cap = cv2.VideoCapture(video_path)
+    try:
+        return max(0, int(cap.get(cv2.CAP_PROP_FRAME_COUNT)))
+    finally:
+        cap.release()
+
+
+def video_fps(video_path):
+    """FPS indicado pelo contentor do vídeo (30 se desconhecido)"""
+    cap = cv2.VideoCapture(video_path)
+    try:
+        return cap.get(cv2.CAP_PROP_FPS) or 30.0
+    finally:
+        cap.release()
+
+
+def capture_timestamp_ms(cap, index, fps):
+    """Instante de apresentação (ms) do último frame lido de `cap` (CAP_PROP_POS_MSEC)
+
+    Quando o backend não o fornece, é estimado a partir do índice e do FPS.
+    """
+    timestamp = cap.get(cv2.CAP_PROP_POS_MSEC)
+    if timestamp <= 0 and index > 0:
+        return index * 1000.0 / fps
+    return timestamp
+
+
+def timestamp_to_index(timestamp_ms, fps):
+    """Índice do frame (de um vídeo a `fps` constante) em apresentação no instante `timestamp_ms`"""
+    return max(0, int((timestamp_ms + TIMESTAMP_TOLERANCE_MS) * fps / 1000.0))
+
+
+def fps_differ(ref_fps, dist_fps):
+    """True se os vídeos têm de ser emparelhados por timestamp em vez de por índice"""
+    return abs(ref_fps - dist_fps) > FPS_MATCH_TOLERANCE
+
+
+def paired_frame_count(ref_path, dist_path):
+    """Número de frames do distorcido com frame correspondente na referência (0 se desconhecido)"""
+    ref_frames = video_frame_count(ref_path)
+    dist_frames = video_frame_count(dist_path)
+    ref_fps, dist_fps = video_fps(ref_path), video_fps(dist_path)
+    if fps_differ(ref_fps, dist_fps):
+        # Duração da referência expressa em frames do distorcido
+        ref_frames = int(ref_frames * dist_fps / ref_fps)
+    return min(ref_frames, dist_frames)
+
+
+def keyframe_indices(video_path):
+    """Índices dos keyframes do vídeo (via ffprobe); None se o ffprobe não estiver disponível"""
+    command = ['ffprobe', '-v', 'error', '-select_streams', 'v:0', '-skip_frame', 'nokey',
+               '-show_entries', 'frame=best_effort_timestamp_time', '-of', 'csv=p=0', video_path]
+    try:
+        output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+    fps = video_fps(video_path)
+    indices = set()
+    for line in output.splitlines():
+        value = line.strip().strip(',')
+        try:
+            indices.add(int(round(float(value) * fps)))
+        except ValueError:
+            continue
+    return sorted(indices)
+
+
+class SamplingPolicy:
+    """Política de amostragem temporal dos frames comparados em cada par
+
+    Modos:
+    - 'first': os primeiros `frames` frames (comportamento original, 100 frames)
+    - 'full': todos os frames
+    - 'every_k': um frame em cada `step` (limitado a `frames`, se indicado)
+    - 'uniform': `frames` frames distribuídos uniformemente por toda a duração (com seek)
+    - 'keyframes': apenas keyframes do vídeo distorcido (limitado a `frames`, se indicado)
+    - 'time_budget': frames sequenciais até esgotar `budget_seconds` segundos de cálculo
+    """
+
+    MODES = ('first', 'full', 'every_k', 'uniform', 'keyframes', 'time_budget')
+
+    def __init__(self, mode='first', frames=MAX_FRAMES, step=1, budget_seconds=None):
+        if mode not in self.MODES:
+            raise ValueError(f"Modo de amostragem desconhecido: {mode}")
+        if mode == 'time_budget' and not budget_seconds:
+            raise ValueError("O modo 'time_budget' requer budget_seconds")
+        self.mode = mode
+        self.frames = frames
+        self.step = max(1, int(step))
+        self.budget_seconds = budget_seconds
+
+    def to_dict(self):
+        """Representação serializável (relatórios, manifestos, chaves de cache)"""
+        return {'mode': self.mode, 'frames': self.frames, 'step': self.step,
+                'budget_seconds': self.budget_seconds}
+
+    @classmethod
+    def from_dict(cls, data):
+        """Cria a política a partir de to_dict() (aceita None para a política por omissão)"""
+        return cls(**data) if data else cls()
+
+    def describe(self):
+        """Descrição legível da política (usada no relatório)"""
+        limit = f" (máx. {self.frames})" if self.frames else ""
+        if self.mode == 'first':
+            return f"Primeiros {self.frames} frames"
+        if self.mode == 'full':
+            return "Todos os frames"
+        if self.mode == 'every_k':
+            return f"1 em cada {self.step} frames{limit}"
+        if self.mode == 'uniform':
+            return f"{self.frames} frames distribuídos uniformemente pela duração"
+        if self.mode == 'keyframes':
+            return f"Apenas keyframes{limit}"
+        return f"Frames sequenciais durante {self.budget_seconds:g} s de cálculo"
+
+    def frame_plan(self, ref_path, dist_path):
+        """Índices dos frames a comparar (range ou lista crescente)
+
+        Os índices são do vídeo distorcido (quando os FPS diferem, o frame da
+        referência é escolhido pelo timestamp). Os modos sequenciais devolvem
+        ranges abertos (até sys.maxsize): a leitura termina quando um dos
+        vídeos acaba.
+        """
+        if self.mode == 'first':
+            return range(self.frames)
+        if self.mode in ('full', 'time_budget'):
+            return range(0, sys.maxsize)
+        if self.mode == 'every_k':
+            plan = range(0, sys.maxsize, self.step)
+            return plan[:self.frames] if self.frames else plan
+
+        total_frames = paired_frame_count(ref_path, dist_path)
+
+        if self.mode == 'keyframes':
+            indices = keyframe_indices(dist_path)
+            if indices is None:
+                # Sem ffprobe: aproximar com um frame a cada 2 segundos
+                print("⚠ ffprobe não encontrado; a usar um frame a cada 2 s em vez de keyframes")
+                indices = list(range(0, total_frames, max(1, int(round(video_fps(dist_path) * 2)))))
+            indices = [i for i in indices if i < total_frames]
+            if self.frames and len(indices) > self.frames:
+                picks = np.linspace(0, len(indices) - 1, self.frames).round().astype(int)
+                indices = [indices[i] for i in sorted(set(picks))]
+            return indices
+
+        # 'uniform'
+        if total_frames <= 0:
+            return range(self.frames)
+        count = min(self.frames, total_frames)
+        return sorted(set(np.linspace(0, total_frames - 1, count).round().astype(int).tolist()))
+
+    def expected_frames(self, ref_path, dist_path):
+        """Número previsto de frames comparados num par (para progresso/ETA), ou None se imprevisível"""
+        if self.mode in ('keyframes', 'time_budget'):
+            return None
+        total_frames = paired_frame_count(ref_path, dist_path)
+        if total_frames <= 0:
+            return None
+        if self.mode == 'uniform':
+            return min(self.frames, total_frames)
+        return len(_clip_plan(self.frame_plan(ref_path, dist_path), total_frames))
+
+    def deadline(self):
+        """Instante (time.monotonic) em que a amostragem termina, ou None"""
+        if self.mode == 'time_budget':
+            return time.monotonic() + self.budget_seconds
+        return None
+
+
+class MetricsCancelled(Exception):
+    """O cálculo das métricas foi cancelado (ver JobControl.cancel)"""
+
+
+class JobControl:
+    """Cancelamento e contagem de frames de um cálculo de métricas
+
+    Usa primitivas de multiprocessing para ser partilhado com os processos do
+    pool (é entregue a cada processo na sua criação). `running` indica os
+    pares em curso ({índice: caminho do distorcido}) e só é atualizado no
+    processo principal.
+    """
+
+    def __init__(self):
+        # Mesmo contexto dos pools, para poder ser entregue aos seus processos
+        context = multiprocessing.get_context(MP_START_METHOD)
+        self._cancel_event = context.Event()
+        self._frames = context.Value('q', 0)
+        self.running = {}
+
+    def cancel(self):
+        """Pede o cancelamento; os ciclos de frames param no frame seguinte"""
+        self._cancel_event.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    def check(self):
+        """Lança MetricsCancelled se o cancelamento foi pedido"""
+        if self._cancel_event.is_set():
+            raise MetricsCancelled("Cálculo cancelado")
+
+    def add_frames(self, count=1):
+        with self._frames.get_lock():
+            self._frames.value += count
+
+    @property
+    def frames(self):
+        """Pares de frames processados até agora (em todos os processos)"""
+        return self._frames.value
+
+
+def format_frame_indices(indices, max_items=8):
+    """Resume uma lista de índices em intervalos (ex.: '0-99' ou '0, 30, 60, …')"""
+    indices = list(indices)
+    if not indices:
+        return "-"
+
+    runs = []
+    start = prev = indices[0]
+    for index in indices[1:]:
+        if index == prev + 1:
+            prev = index
+            continue
+        runs.append((start, prev))
+        start = prev = index
+    runs.append((start, prev))
+
+    parts = [f"{a}-{b}" if a != b else f"{a}" for a, b in runs]
+    if len(parts) > max_items:
+        parts = parts[:max_items - 1] + ["…", parts[-1]]
+    return ", ".join(parts)
+
+
+class FrameReader:
+    """Lê frames em grayscale por índice, avançando com grab() ou por seek
+
+    `timestamp_ms` é o instante de apresentação do último frame lido.
+    """
+
+    def __init__(self, video_path):
+        self.video_path = video_path
+        self._cap = cv2.VideoCapture(video_path)
+        self._position = 0
+        self._seekable = True
+        self.fps = self._cap.get(cv2.CAP_PROP_FPS) or 30.0
+        self.timestamp_ms = None
+
+    def read_at(self, index):
+        """Devolve o frame `index` em grayscale (None se não existir)"""
+        gap = index - self._position
+        if gap < 0 or gap > SEEK_THRESHOLD:
+            self._seek(index)
+        else:
+            for _ in range(gap):
+                if not self._cap.grab():
+                    return None
+                self._position += 1
+
+        ret, frame = self._cap.read()
+        if not ret:
+            return None
+        self._position = index + 1
+        self.timestamp_ms = capture_timestamp_ms(self._cap, index, self.fps)
+        return to_gray(frame)
+
+    def _seek(self, index):
+        """Posiciona a leitura no frame `index`"""
+        if self._seekable:
+            self._cap.set(cv2.CAP_PROP_POS_FRAMES, index)
+            if int(self._cap.get(cv2.CAP_PROP_POS_FRAMES)) == index:
+                self._position = index
+                return
+            # Seek impreciso neste contentor: passar a avançar frame a frame
+            self._seekable = False
+
+        if index < self._position or not self._seekable:
+            self._cap.release()
+            self._cap = cv2.VideoCapture(self.video_path)
+            self._position = 0
+        while self._position < index and self._cap.grab():
+            self._position += 1
+
+    def release(self):
+        self._cap.release()
+
+
+class ReferenceFrameCache:
+    """Cache dos frames da referência, descodificados uma única vez por análise
+
+    Os frames (grayscale) ficam em RAM até `ram_budget` bytes; a partir daí
+    são escritos num ficheiro temporário e lidos por memória mapeada, até
+    `disk_budget` bytes. Frames além dos dois orçamentos são descodificados
+    sempre que pedidos. A descodificação é preguiçosa (só os índices pedidos).
+    """
+
+    def __init__(self, ref_path, ram_budget=REFERENCE_CACHE_RAM_BUDGET,
+                 disk_budget=REFERENCE_CACHE_DISK_BUDGET, spill_dir=None):
+        self.ref_path = ref_path
+        self.ram_budget = ram_budget
+        self.disk_budget = disk_budget
+        self.spill_dir = spill_dir
+
+        self._reader = FrameReader(ref_path)
+        self.fps = self._reader.fps
+        self._end = None  # primeiro índice inexistente (quando conhecido)
+
+        # Cada slot é um array (em RAM) ou um índice inteiro no ficheiro de spill
+        self._slots = {}
+        self._ram_bytes = 0
+
+        self._spill_file = None
+        self._spill_path = None
+        self._spill_shape = None
+        self._spill_count = 0
+        self._spill_map = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def get(self, index):
+        """Devolve o frame `index` da referência (None se não existir)"""
+        slot = self._slots.get(index)
+        if slot is not None:
+            if isinstance(slot, np.ndarray):
+                return slot
+            return self._read_spilled(slot)
+
+        if self._end is not None and index >= self._end:
+            return None
+
+        frame = self._reader.read_at(index)
+        if frame is None:
+            self._end = index if self._end is None else min(self._end, index)
+            return None
+
+        self._store(index, frame)
+        return frame
+
+    def _store(self, index, frame):
+        """Guarda o frame em RAM ou no disco (se couber nos orçamentos)"""
+        if self._spill_file is None and self._ram_bytes + frame.nbytes <= self.ram_budget:
+            self._slots[index] = frame
+            self._ram_bytes += frame.nbytes
+        elif self._spill_shape is not None and frame.shape != self._spill_shape:
+            # Frame com dimensões diferentes (raro): não guardar
+            return
+        elif (self._spill_count + 1) * frame.nbytes <= self.disk_budget:
+            self._slots[index] = self._spill(frame)
+
+    def _spill(self, frame):
+        """Escreve o frame no ficheiro de spill e devolve o seu índice"""
+        if self._spill_file is None:
+            fd, self._spill_path = tempfile.mkstemp(prefix='vqa_ref_', suffix='.raw', dir=self.spill_dir)
+            self._spill_file = os.fdopen(fd, 'wb')
+            self._spill_shape = frame.shape
+
+        self._spill_file.write(np.ascontiguousarray(frame).tobytes())
+        self._spill_file.flush()
+        self._spill_count += 1
+        return self._spill_count - 1
+
+    def _read_spilled(self, spill_index):
+        """Lê um frame do ficheiro de spill através de memória mapeada"""
+        if self._spill_map is None or self._spill_map.shape[0] < self._spill_count:
+            self._spill_map = np.memmap(self._spill_path, dtype=np.uint8, mode='r',
+                                        shape=(self._spill_count,) + self._spill_shape)
+        return self._spill_map[spill_index]
+
+    def close(self):
+        """Liberta o vídeo e remove o ficheiro de spill"""
+        self._reader.release()
+        self._spill_map = None
+        if self._spill_file is not None:
+            self._spill_file.close()
+            self._spill_file = None
+        if self._spill_path and os.path.exists(self._spill_path):
+            try:
+                os.remove(self._spill_path)
+            except OSError:
+                pass
+        self._spill_path = None
+
+
+# Marca de fim de stream nas filas do pipeline
+_END_OF_STREAM = object()
+
+
+class _PipelineThread(threading.Thread):
+    """Thread de um pipeline com fila de entrada/saída limitada e paragem cooperativa"""
+
+    def __init__(self, queue_depth, stop_event):
+        super().__init__(daemon=True)
+        self.queue = queue.Queue(maxsize=max(1, queue_depth))
+        self._stop_event = stop_event
+
+    def put(self, item):
+        """Coloca o item na fila; devolve False se o pipeline foi parado entretanto"""
+        while not self._stop_event.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+
+class _DecoderThread(_PipelineThread):
+    """Descodifica os frames do plano de um vídeo para a sua fila (índice, frame)"""
+
+    def __init__(self, read_frame, frame_plan, queue_depth, stop_event):
+        super().__init__(queue_depth, stop_event)
+        self._read_frame = read_frame
+        self._frame_plan = frame_plan
+
+    def run(self):
+        try:
+            for index in self._frame_plan:
+                frame = self._read_frame(index)
+                if not self.put((index, frame)) or frame is None:
+                    return
+            self.put(_END_OF_STREAM)
+        except Exception as e:
+            self.put(e)
+
+
+class _RepeatingReader:
+    """Lê frames por índice, devolvendo o mesmo frame quando o índice se repete"""
+
+    def __init__(self, read_frame):
+        self._read_frame = read_frame
+        self._index = None
+        self._frame = None
+
+    def __call__(self, index):
+        if index != self._index:
+            self._index, self._frame = index, self._read_frame(index)
+        return self._frame
+
+
+def _requested_plan(requests):
+    """Plano de frames entregue por outra thread através de uma fila (até _END_OF_STREAM)"""
+    while True:
+        index = requests.get()
+        if index is _END_OF_STREAM:
+            return
+        yield index
+
+
+def iter_frame_pairs(ref_source, dist_path, frame_plan=range(MAX_FRAMES), deadline=None, queue_depth=None):
+    """Gera tuplos (índice, frame_ref, frame_dist) em grayscale, descodificados uma única vez
+
+    `ref_source` pode ser o caminho da referência ou uma ReferenceFrameCache
+    partilhada entre vários vídeos distorcidos. `frame_plan` é a sequência
+    crescente de índices (do distorcido) a comparar; a iteração termina quando
+    um dos vídeos acaba ou quando `deadline` (time.monotonic) é ultrapassado.
+
+    Com FPS iguais os frames são emparelhados por índice. Com FPS diferentes
+    cada frame do distorcido é comparado com o frame da referência em
+    apresentação no seu timestamp (CAP_PROP_POS_MSEC), repetindo ou saltando
+    frames da referência conforme necessário.
+
+    Com `queue_depth` > 0 (por omissão PIPELINE_QUEUE_DEPTH) cada vídeo é
+    descodificado numa thread própria para uma fila com esse número de frames,
+    sobrepondo a descodificação ao cálculo das métricas (o OpenCV liberta o GIL).
+    """
+    if queue_depth is None:
+        queue_depth = PIPELINE_QUEUE_DEPTH
+
+    ref_reader = None
+    if isinstance(ref_source, ReferenceFrameCache):
+        read_ref = ref_source.get
+        ref_fps = ref_source.fps
+    else:
+        ref_reader = FrameReader(ref_source)
+        read_ref = ref_reader.read_at
+        ref_fps = ref_reader.fps
+    dist_reader = FrameReader(dist_path)
+
+    # Índice da referência para o último frame lido do distorcido (None = o mesmo índice)
+    ref_index_of = None
+    if fps_differ(ref_fps, dist_reader.fps):
+        ref_index_of = lambda: timestamp_to_index(dist_reader.timestamp_ms, ref_fps)
+        read_ref = _RepeatingReader(read_ref)
+
+    try:
+        if queue_depth > 0:
+            yield from _iter_pipelined_pairs(read_ref, dist_reader.read_at, frame_plan, deadline, queue_depth,
+                                             ref_index_of)
+            return
+
+        for index in frame_plan:
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+
+            frame_dist = dist_reader.read_at(index)
+            if frame_dist is None:
+                break
+            frame_ref = read_ref(index if ref_index_of is None else ref_index_of())
+            if frame_ref is None:
+                break
+
+            yield index, frame_ref, frame_dist
+    finally:
+        if ref_reader is not None:
+            ref_reader.release()
+        dist_reader.release()
+
+
+def _iter_pipelined_pairs(read_ref, read_dist, frame_plan, deadline, queue_depth, ref_index_of=None):
+    """Emparelha os frames das threads de descodificação da referência e do distorcido
+
+    Com `ref_index_of` o plano da referência não é conhecido à partida: cada
+    frame lido do distorcido pede à thread da referência o frame correspondente.
+    """
+    stop_event = threading.Event()
+    ref_requests = None
+    ref_plan, read_dist_frame = frame_plan, read_dist
+    if ref_index_of is not None:
+        ref_requests = queue.Queue()
+        ref_plan = _requested_plan(ref_requests)
+
+        def read_dist_frame(index):
+            frame = read_dist(index)
+            if frame is not None:
+                ref_requests.put(ref_index_of())
+            return frame
+
+    dist_decoder = _DecoderThread(read_dist_frame, frame_plan, queue_depth, stop_event)
+    ref_decoder = _DecoderThread(read_ref, ref_plan, queue_depth, stop_event)
+    for decoder in (dist_decoder, ref_decoder):
+        decoder.start()
+
+    try:
+        while deadline is None or time.monotonic() < deadline:
+            # Distorcido primeiro: só há frame da referência para cada frame lido do distorcido
+            dist_item = dist_decoder.queue.get()
+            if isinstance(dist_item, Exception):
+                raise dist_item
+            if dist_item is _END_OF_STREAM or dist_item[1] is None:
+                break
+
+            ref_item = ref_decoder.queue.get()
+            if isinstance(ref_item, Exception):
+                raise ref_item
+            if ref_item is _END_OF_STREAM or ref_item[1] is None:
+                break
+
+            index, frame_dist = dist_item
+            yield index, ref_item[1], frame_dist
+    finally:
+        # Parar e esperar pelas threads antes de os vídeos serem libertados
+        stop_event.set()
+        if ref_requests is not None:
+            ref_requests.put(_END_OF_STREAM)
+        for decoder in (dist_decoder, ref_decoder):
+            decoder.join()
+
+
+class MetricAccumulator:
+    """Classe base: acumula o valor da métrica frame a frame"""
+
+    name = None
+
+    def __init__(self):
+        self.values = []
+
+    def update(self, frame_ref, frame_dist):
+        """Processa um par de frames em grayscale"""
+        self.values.append(self.compute(frame_ref, frame_dist))
+
+    def compute(self, frame_ref, frame_dist):
+        """Calcula o valor da métrica para um par de frames"""
+        raise NotImplementedError
+
+    def extend(self, values):
+        """Acrescenta valores por frame já calculados (ex.: noutro processo)"""
+        self.values.extend(values)
+
+    def finalize(self):
+        """Processa trabalho pendente (ex.: lotes incompletos) no fim da passagem"""
+
+    def params(self):
+        """Parâmetros que alteram os valores da métrica (identificam resultados em cache)"""
+        return {}
+
+    def result(self):
+        """Devolve o valor médio da métrica"""
+        self.finalize()
+        return np.mean(self.values) if self.values else 0.0
+
+
+class PSNRKernel:
+    """Kernel de PSNR em lote para pilhas de frames (N, H, W) uint8
+
+    A soma dos erros quadráticos é calculada em aritmética inteira (diferenças
+    int16, quadrados int32, somas int64) sobre buffers reutilizados, sem
+    temporários float64. O resultado é idêntico, bit a bit, à fórmula
+    20 * log10(255 / sqrt(mean((ref - dist) ** 2))) calculada em float64.
+    """
+
+    def __init__(self):
+        self._diff = None
+        self._squares = None
+
+    def _buffers(self, shape):
+        """Devolve buffers de trabalho com pelo menos `shape` (realoca se necessário)"""
+        n, h, w = shape
+        if self._diff is None or self._diff.shape[0] < n or self._diff.shape[1:] != (h, w):
+            self._diff = np.empty((n, h, w), dtype=np.int16)
+            self._squares = np.empty((n, h, w), dtype=np.int32)
+        return self._diff[:n], self._squares[:n]
+
+    def __call__(self, ref_stack, dist_stack):
+        """Devolve um array float64 com o PSNR de cada frame da pilha"""
+        if ref_stack.shape != dist_stack.shape:
+            raise ValueError(f"Dimensões diferentes: {ref_stack.shape} vs {dist_stack.shape}")
+
+        n = ref_stack.shape[0]
+        pixels = ref_stack.shape[1] * ref_stack.shape[2]
+        diff, squares = self._buffers(ref_stack.shape)
+
+        np.subtract(ref_stack, dist_stack, out=diff, dtype=np.int16)
+        np.multiply(diff, diff, out=squares, dtype=np.int32)  # 255² cabe em int32
+        sse = squares.reshape(n, -1).sum(axis=1, dtype=np.int64)
+
+        psnr_values = np.empty(n, dtype=np.float64)
+        for i in range(n):
+            # Mesma sequência de operações escalares float64 que a fórmula original
+            mse = np.float64(sse[i]) / pixels
+            if mse == 0:
+                psnr_values[i] = 100  # Imagens idênticas
+            else:
+                psnr_values[i] = 20 * np.log10(255.0 / np.sqrt(mse))
+        return psnr_values
+
+
+def psnr_batch(ref_stack, dist_stack):
+    """PSNR por frame de duas pilhas (N, H, W) uint8"""
+    return PSNRKernel()(ref_stack, dist_stack)
+
+
+@register_metric
+class PSNRAccumulator(MetricAccumulator):
+    """PSNR por frame (100 dB para frames idênticos), calculado em lotes"""
+
+    name = 'PSNR'
+
+    def __init__(self, batch_size=PSNR_BATCH_SIZE):
+        super().__init__()
+        self.batch_size = batch_size
+        self._kernel = PSNRKernel()
+        self._ref_batch = None
+        self._dist_batch = None
+        self._pending = 0
+
+    def update(self, frame_ref, frame_dist):
+        if frame_ref.shape != frame_dist.shape:
+            raise ValueError(f"Dimensões diferentes: {frame_ref.shape} vs {frame_dist.shape}")
+
+        if self._ref_batch is None or self._ref_batch.shape[1:] != frame_ref.shape:
+            self.finalize()
+            self._ref_batch = np.empty((self.batch_size,) + frame_ref.shape, dtype=np.uint8)
+            self._dist_batch = np.empty_like(self._ref_batch)
+
+        self._ref_batch[self._pending] = frame_ref
+        self._dist_batch[self._pending] = frame_dist
+        self._pending += 1
+
+        if self._pending == self.batch_size:
+            self.finalize()
+
+    def finalize(self):
+        if self._pending:
+            n = self._pending
+            self._pending = 0
+            self.values.extend(self._kernel(self._ref_batch[:n], self._dist_batch[:n]))
+
+
+class SSIMKernel:
+    """Kernel de SSIM em float32 com filtros separáveis (cv2.sepFilter2D)
+
+    Reproduz skimage.metrics.structural_similarity(data_range=255): por omissão
+    com janela uniforme 7x7 e covariância amostral (a configuração usada até
+    agora nas análises); com `gaussian=True` usa a janela gaussiana 11x11
+    (sigma=1.5) sem covariância amostral, como no artigo de Wang et al.
+    Os buffers são reutilizados entre chamadas. Uma pilha (N, H, W) é filtrada
+    de uma só vez como uma imagem (N*H, W): as margens de cada frame, onde as
+    janelas se misturariam, são excluídas da média tal como no skimage.
+    A diferença para o skimage fica abaixo de SSIM_FAST_TOLERANCE por frame.
+    """
+
+    def __init__(self, gaussian=False, data_range=255, K1=0.01, K2=0.03):
+        if gaussian:
+            win_size = 11
+            self._taps = cv2.getGaussianKernel(win_size, 1.5, cv2.CV_32F)
+            self._cov_norm = 1.0
+        else:
+            win_size = 7
+            self._taps = np.full((win_size, 1), 1.0 / win_size, dtype=np.float32)
+            num_pixels = win_size ** 2
+            self._cov_norm = num_pixels / (num_pixels - 1)
+
+        self.gaussian = gaussian
+        self.pad = (win_size - 1) // 2
+        self._C1 = (K1 * data_range) ** 2
+        self._C2 = (K2 * data_range) ** 2
+        self._shape = None
+        self._buffers = None
+
+    def _get_buffers(self, shape):
+        """Devolve os buffers float32 de trabalho (realoca se a forma mudou)"""
+        if self._shape != shape:
+            names = ('x', 'y', 'mu_x', 'mu_y', 'xx', 'yy', 'xy', 'tmp')
+            self._buffers = {name: np.empty(shape, dtype=np.float32) for name in names}
+            self._shape = shape
+        return self._buffers
+
+    def _filter(self, src, dst):
+        cv2.sepFilter2D(src, cv2.CV_32F, self._taps, self._taps, dst=dst,
+                        borderType=cv2.BORDER_REFLECT)
+
+    def __call__(self, ref_stack, dist_stack):
+        """Devolve um array float64 com o SSIM médio de cada frame da pilha"""
+        if ref_stack.ndim == 2:
+            ref_stack, dist_stack = ref_stack[None], dist_stack[None]
+        if ref_stack.shape != dist_stack.shape:
+            raise ValueError(f"Dimensões diferentes: {ref_stack.shape} vs {dist_stack.shape}")
+
+        n, h, w = ref_stack.shape
+        buffers = self._get_buffers((n * h, w))
+        x, y, tmp = buffers['x'], buffers['y'], buffers['tmp']
+        mu_x, mu_y = buffers['mu_x'], buffers['mu_y']
+        xx, yy, xy = buffers['xx'], buffers['yy'], buffers['xy']
+
+        # Centrar em 128 reduz o cancelamento numérico das variâncias em float32
+        np.subtract(ref_stack.reshape(n * h, w), 128, out=x, dtype=np.float32)
+        np.subtract(dist_stack.reshape(n * h, w), 128, out=y, dtype=np.float32)
+
+        self._filter(x, mu_x)
+        self._filter(y, mu_y)
+        np.multiply(x, x, out=tmp)
+        self._filter(tmp, xx)
+        np.multiply(y, y, out=tmp)
+        self._filter(tmp, yy)
+        np.multiply(x, y, out=tmp)
+        self._filter(tmp, xy)
+
+        # Variâncias e covariância (invariantes ao deslocamento)
+        np.multiply(mu_x, mu_x, out=tmp)
+        xx -= tmp
+        xx *= self._cov_norm
+        np.multiply(mu_y, mu_y, out=tmp)
+        yy -= tmp
+        yy *= self._cov_norm
+        np.multiply(mu_x, mu_y, out=tmp)
+        xy -= tmp
+        xy *= self._cov_norm
+
+        # Médias reais
+        mu_x += 128
+        mu_y += 128
+
+        # Numerador: (2*mu_x*mu_y + C1) * (2*cov_xy + C2)
+        np.multiply(mu_x, mu_y, out=tmp)
+        tmp *= 2
+        tmp += self._C1
+        xy *= 2
+        xy += self._C2
+        tmp *= xy
+
+        # Denominador: (mu_x² + mu_y² + C1) * (var_x + var_y + C2)
+        mu_x *= mu_x
+        mu_y *= mu_y
+        mu_x += mu_y
+        mu_x += self._C1
+        xx += yy
+        xx += self._C2
+        mu_x *= xx
+        tmp /= mu_x
+
+        ssim_map = tmp.reshape(n, h, w)[:, self.pad:h - self.pad, self.pad:w - self.pad]
+        return ssim_map.mean(axis=(1, 2), dtype=np.float64)
+
+
+def ssim_skimage(frame_ref, frame_dist, gaussian=False):
+    """SSIM de referência calculado com o skimage"""
+    from skimage.metrics import structural_similarity as ssim
+
+    if gaussian:
+        return ssim(frame_ref, frame_dist, data_range=255, gaussian_weights=True, sigma=1.5,
+                    use_sample_covariance=False)
+    return ssim(frame_ref, frame_dist, data_range=255)
+
+
+def validate_ssim_kernel(frame_ref, frame_dist, gaussian=False, tolerance=SSIM_FAST_TOLERANCE):
+    """Compara o SSIM 'fast' com o skimage; devolve (diferença absoluta, dentro da tolerância)"""
+    fast_value = SSIMKernel(gaussian=gaussian)(frame_ref, frame_dist)[0]
+    difference = abs(fast_value - ssim_skimage(frame_ref, frame_dist, gaussian))
+    return difference, difference <= tolerance
+
+
+@register_metric
+class SSIMAccumulator(MetricAccumulator):
+    """SSIM por frame (implementação 'fast' ou 'skimage')"""
+
+    name = 'SSIM'
+
+    def __init__(self, implementation=None, gaussian=False, batch_size=SSIM_BATCH_SIZE):
+        super().__init__()
+        self.implementation = implementation or SSIM_IMPLEMENTATION
+        if self.implementation not in ('fast', 'skimage'):
+            raise ValueError(f"Implementação de SSIM desconhecida: {self.implementation}")
+        self.gaussian = gaussian
+        self.batch_size = max(1, batch_size)
+        self._kernel = SSIMKernel(gaussian=gaussian)
+        self._ref_batch = None
+        self._dist_batch = None
+        self._pending = 0
+
+    def params(self):
+        return {'implementation': self.implementation, 'gaussian': self.gaussian}
+
+    def update(self, frame_ref, frame_dist):
+        # Redimensionar se necessário (SSIM requer mesmo tamanho)
+        if frame_ref.shape != frame_dist.shape:
+            h, w = min(frame_ref.shape[0], frame_dist.shape[0]), min(frame_ref.shape[1], frame_dist.shape[1])
+            frame_ref = cv2.resize(frame_ref, (w, h))
+            frame_dist = cv2.resize(frame_dist, (w, h))
+
+        if self.implementation == 'skimage':
+            self.values.append(ssim_skimage(frame_ref, frame_dist, self.gaussian))
+            return
+
+        if self._ref_batch is None or self._ref_batch.shape[1:] != frame_ref.shape:
+            self.finalize()
+            self._ref_batch = np.empty((self.batch_size,) + frame_ref.shape, dtype=np.uint8)
+            self._dist_batch = np.empty_like(self._ref_batch)
+
+        self._ref_batch[self._pending] = frame_ref
+        self._dist_batch[self._pending] = frame_dist
+        self._pending += 1
+
+        if self._pending == self.batch_size:
+            self.finalize()
+
+    def finalize(self):
+        if self._pending:
+            n = self._pending
+            self._pending = 0
+            self.values.extend(self._kernel(self._ref_batch[:n], self._dist_batch[:n]))
+
+
+def create_accumulators(metrics, metric_params=None):
+    """Cria os acumuladores das métricas pedidas
+
+    `metric_params` é um dicionário opcional {nome_da_métrica: {parâmetro: valor}}
+    (ex.: {'SSIM': {'implementation': 'skimage'}}).
+    """
+    metric_params = metric_params or {}
+    return [METRIC_REGISTRY[name](**metric_params.get(name, {})) for name in metrics]
+
+
+class PairMetrics:
+    """Resultado das métricas de um par: médias, valores por frame e frames usados
+
+    `cached` indica que o resultado foi lido da cache de métricas (não calculado).
+    """
+
+    def __init__(self, means, per_frame, frame_indices, sampling, cached=False):
+        self.means = means
+        self.per_frame = per_frame
+        self.frame_indices = frame_indices
+        self.sampling = sampling
+        self.cached = cached
+
+    def __getitem__(self, name):
+        return self.means[name]
+
+
+class _ComputeThread(_PipelineThread):
+    """Alimenta um acumulador com os pares de frames recebidos pela sua fila"""
+
+    def __init__(self, accumulator, queue_depth, stop_event):
+        super().__init__(queue_depth, stop_event)
+        self.accumulator = accumulator
+        self.error = None
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is _END_OF_STREAM:
+                return
+            if self.error is None:
+                try:
+                    self.accumulator.update(*item)
+                except Exception as e:
+                    # Continuar a esvaziar a fila para não bloquear a descodificação
+                    self.error = e
+
+
+def _accumulate_metrics(ref_source, dist_path, metrics, frame_plan, deadline=None, metric_params=None,
+                        queue_depth=None, control=None):
+    """Alimenta os acumuladores das métricas pedidas numa única passagem
+
+    Com o pipeline ativo (`queue_depth` > 0) e várias métricas, cada
+    acumulador corre numa thread de cálculo própria, alimentada por uma fila
+    limitada; a ordem dos frames de cada métrica é preservada. Com `control`
+    (JobControl) cada frame é contado e o cancelamento verificado.
+    Devolve (acumuladores, índices dos frames comparados).
+    """
+    if queue_depth is None:
+        queue_depth = PIPELINE_QUEUE_DEPTH
+
+    accumulators = create_accumulators(metrics, metric_params)
+    frame_indices = []
+    frame_pairs = iter_frame_pairs(ref_source, dist_path, frame_plan, deadline, queue_depth)
+
+    if queue_depth > 0 and len(accumulators) > 1:
+        stop_event = threading.Event()
+        workers = [_ComputeThread(accumulator, queue_depth, stop_event) for accumulator in accumulators]
+        for worker in workers:
+            worker.start()
+        try:
+            for index, frame_ref, frame_dist in frame_pairs:
+                if control is not None:
+                    control.check()
+                for worker in workers:
+                    worker.put((frame_ref, frame_dist))
+                frame_indices.append(index)
+                if control is not None:
+                    control.add_frames()
+        finally:
+            for worker in workers:
+                worker.put(_END_OF_STREAM)
+            for worker in workers:
+                worker.join()
+        for worker in workers:
+            if worker.error is not None:
+                raise worker.error
+    else:
+        for index, frame_ref, frame_dist in frame_pairs:
+            if control is not None:
+                control.check()
+            for accumulator in accumulators:
+                accumulator.update(frame_ref, frame_dist)
+            frame_indices.append(index)
+            if control is not None:
+                control.add_frames()
+
+    for accumulator in accumulators:
+        accumulator.finalize()
+
+    return accumulators, frame_indices
+
+
+def _pair_metrics(accumulators, frame_indices, sampling, dist_path):
+    """Constrói o PairMetrics de um par (falha se nenhum frame foi comparado)"""
+    if not frame_indices:
+        raise ValueError(f"Nenhum frame descodificado (vídeo corrompido?): {os.path.basename(dist_path)}")
+
+    return PairMetrics({accumulator.name: accumulator.result() for accumulator in accumulators},
+                       {accumulator.name: list(accumulator.values) for accumulator in accumulators},
+                       frame_indices, sampling)
+
+
+def compute_metrics(ref_source, dist_path, metrics=DEFAULT_METRICS, sampling=None, metric_params=None,
+                    queue_depth=None):
+    """Calcula várias métricas numa única passagem de descodificação
+
+    `ref_source` é o caminho da referência ou uma ReferenceFrameCache;
+    `sampling` é a SamplingPolicy (por omissão, os primeiros 100 frames);
+    `queue_depth` configura o pipeline (ver iter_frame_pairs).
+    Devolve um dicionário {nome_da_métrica: valor_médio}.
+    """
+    sampling = sampling or SamplingPolicy()
+    ref_path = ref_source.ref_path if isinstance(ref_source, ReferenceFrameCache) else ref_source
+    accumulators, _ = _accumulate_metrics(ref_source, dist_path, metrics,
+                                          sampling.frame_plan(ref_path, dist_path),
+                                          sampling.deadline(), metric_params, queue_depth)
+    return {accumulator.name: accumulator.result() for accumulator in accumulators}
+
+
+# Caches da referência de cada processo do pool (uma por referência)
+_worker_reference_caches = {}
+_worker_ram_budget = REFERENCE_CACHE_RAM_BUDGET
+_worker_disk_budget = REFERENCE_CACHE_DISK_BUDGET
+_worker_control = None
+
+
+def _init_metric_worker(ram_budget, disk_budget, control=None):
+    """Inicializa um processo do pool com os seus orçamentos para a cache da referência
+    e o JobControl partilhado (cancelamento e contagem de frames)"""
+    global _worker_ram_budget, _worker_disk_budget, _worker_control
+    _worker_ram_budget = ram_budget
+    _worker_disk_budget = disk_budget
+    _worker_control = control
+
+
+def _metric_job(ref_source, dist_path, metrics, sampling, metric_params=None, queue_depth=None, control=None):
+    """Calcula as métricas de um par; falha se o par não puder ser comparado"""
+    if not os.path.exists(dist_path):
+        raise FileNotFoundError(f"Vídeo distorcido não encontrado: {dist_path}")
+    if isinstance(ref_source, str) and not os.path.exists(ref_source):
+        raise FileNotFoundError(f"Vídeo de referência não encontrado: {ref_source}")
+
+    ref_path = ref_source.ref_path if isinstance(ref_source, ReferenceFrameCache) else ref_source
+    frame_plan = sampling.frame_plan(ref_path, dist_path)
+    accumulators, frame_indices = _accumulate_metrics(ref_source, dist_path, metrics, frame_plan,
+                                                      sampling.deadline(), metric_params, queue_depth, control)
+    return _pair_metrics(accumulators, frame_indices, sampling, dist_path)
+
+
+def _pooled_metric_job(ref_path, dist_path, metrics, sampling, metric_params=None, queue_depth=None):
+    """Tarefa do pool: reutiliza a referência já descodificada neste processo"""
+    ref_cache = _worker_reference_caches.get(ref_path)
+    if ref_cache is None:
+        if not os.path.exists(ref_path):
+            raise FileNotFoundError(f"Vídeo de referência não encontrado: {ref_path}")
+        ref_cache = ReferenceFrameCache(ref_path, ram_budget=_worker_ram_budget,
+                                        disk_budget=_worker_disk_budget)
+        _worker_reference_caches[ref_path] = ref_cache
+
+    return _metric_job(ref_cache, dist_path, metrics, sampling, metric_params, queue_depth, _worker_control)
+
+
+def _segment_job(ref_path, dist_path, metrics, frame_plan, metric_params=None, queue_depth=None):
+    """Calcula os valores por frame de um segmento do plano de frames"""
+    accumulators, frame_indices = _accumulate_metrics(ref_path, dist_path, metrics, frame_plan,
+                                                      metric_params=metric_params, queue_depth=queue_depth,
+                                                      control=_worker_control)
+    return {accumulator.name: accumulator.values for accumulator in accumulators}, frame_indices
+
+
+def split_segments(total_frames, segments):
+    """Divide [0, total_frames) em `segments` intervalos contíguos (início, fim)"""
+    segments = max(1, min(segments, total_frames))
+    bounds = [round(i * total_frames / segments) for i in range(segments + 1)]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _clip_plan(frame_plan, total_frames):
+    """Parte do plano de frames com índices abaixo de `total_frames`"""
+    if isinstance(frame_plan, range):
+        return range(frame_plan.start, max(frame_plan.start, min(frame_plan.stop, total_frames)),
+                     frame_plan.step)
+    return [index for index in frame_plan if index < total_frames]
+
+
+def compute_metrics_segmented(ref_path, dist_path, metrics=DEFAULT_METRICS, sampling=None,
+                              workers=2, min_segment_frames=MIN_SEGMENT_FRAMES, metric_params=None,
+                              queue_depth=None, control=None):
+    """Calcula as métricas de um único par dividindo-o em segmentos temporais
+
+    O plano de frames da amostragem é dividido em segmentos contíguos; cada
+    segmento posiciona-se no seu primeiro frame e é calculado num processo
+    próprio. Os valores por frame são concatenados pela ordem original, pelo que
+    a média final é idêntica à de uma execução sequencial. O último segmento lê
+    até ao fim do plano (o número de frames do contentor nem sempre é exato).
+    A amostragem 'time_budget' é sempre calculada sequencialmente.
+    """
+    sampling = sampling or SamplingPolicy()
+    if not os.path.exists(dist_path):
+        raise FileNotFoundError(f"Vídeo distorcido não encontrado: {dist_path}")
+    if not os.path.exists(ref_path):
+        raise FileNotFoundError(f"Vídeo de referência não encontrado: {ref_path}")
+
+    frame_plan = sampling.frame_plan(ref_path, dist_path)
+    total_frames = paired_frame_count(ref_path, dist_path)
+    known_plan = _clip_plan(frame_plan, total_frames)
+
+    num_segments = min(workers, len(known_plan) // max(1, min_segment_frames))
+    if num_segments <= 1 or sampling.mode == 'time_budget':
+        return _metric_job(ref_path, dist_path, metrics, sampling, metric_params, queue_depth, control)
+
+    segment_plans = [known_plan[start:end] for start, end in split_segments(len(known_plan), num_segments)]
+    # Último segmento aberto: continua até ao fim do plano original
+    last_plan = segment_plans[-1]
+    if isinstance(frame_plan, range):
+        segment_plans[-1] = range(last_plan.start, frame_plan.stop, frame_plan.step)
+    else:
+        segment_plans[-1] = frame_plan[frame_plan.index(last_plan[0]):]
+
+    with ProcessPoolExecutor(max_workers=num_segments, mp_context=multiprocessing.get_context(MP_START_METHOD),
+                             initializer=_init_metric_worker,
+                             initargs=(REFERENCE_CACHE_RAM_BUDGET, REFERENCE_CACHE_DISK_BUDGET,
+                                       control)) as executor:
+        futures = [executor.submit(_segment_job, ref_path, dist_path, tuple(metrics), plan, metric_params,
+                                   queue_depth)
+                   for plan in segment_plans]
+        segment_results = [future.result() for future in futures]
+
+    accumulators = create_accumulators(metrics, metric_params)
+    frame_indices = []
+    for plan, (values, indices) in zip(segment_plans, segment_results):
+        for accumulator in accumulators:
+            accumulator.extend(values[accumulator.name])
+        frame_indices.extend(indices)
+        # Segmento terminado antes do previsto: a execução sequencial pararia aqui
+        if len(indices) < len(plan):
+            break
+
+    return _pair_metrics(accumulators, frame_indices, sampling, dist_path)
+
+
+def run_metric_jobs(jobs, metrics=DEFAULT_METRICS, sampling=None, workers=1,
+                    max_concurrent=None, on_result=None, metric_params=None, queue_depth=None, control=None):
+    """Calcula as métricas de vários pares (referência, distorcido)
+
+    Com `workers` > 1 os pares são distribuídos por um ProcessPoolExecutor;
+    `max_concurrent` limita o número de pares em descodificação simultânea
+    (e portanto a memória usada). Cada par falha isoladamente. Um único par
+    com `workers` > 1 é dividido em segmentos temporais.
+
+    Devolve uma lista, pela ordem de `jobs`, de tuplos (PairMetrics, erro):
+    o resultado é None e `erro` a mensagem quando o par falhou.
+    `on_result(índice, resultado, erro)` é chamado à medida que cada par termina.
+    `sampling` é a SamplingPolicy, `metric_params` configura as métricas
+    (ver create_accumulators) e `queue_depth` a profundidade das filas do
+    pipeline de descodificação/cálculo de cada par (ver iter_frame_pairs).
+    Com `control` (JobControl) os frames processados são contados, os pares em
+    curso ficam em control.running e um cancelamento interrompe todos os
+    processos no frame seguinte, lançando MetricsCancelled.
+    """
+    sampling = sampling or SamplingPolicy()
+    jobs = list(jobs)
+    results = [None] * len(jobs)
+
+    def record(index, pair_metrics, error):
+        if control is not None:
+            control.running.pop(index, None)
+            # Pares interrompidos pelo cancelamento não são resultados
+            control.check()
+        results[index] = (pair_metrics, error)
+        if on_result:
+            on_result(index, pair_metrics, error)
+
+    def start(index, dist_path):
+        if control is not None:
+            control.check()
+            control.running[index] = dist_path
+
+    if workers > 1 and len(jobs) == 1:
+        # Um só par (ex.: vídeo longo): paralelizar por segmentos temporais
+        ref_path, dist_path = jobs[0]
+        start(0, dist_path)
+        try:
+            pair_metrics = compute_metrics_segmented(ref_path, dist_path, metrics, sampling,
+                                                     min(workers, max_concurrent or workers),
+                                                     metric_params=metric_params, queue_depth=queue_depth,
+                                                     control=control)
+        except Exception as e:
+            record(0, None, str(e))
+        else:
+            record(0, pair_metrics, None)
+        return results
+
+    if workers <= 1 or len(jobs) <= 1:
+        # Execução sequencial: uma cache por referência, partilhada por todos os pares
+        ref_caches = {}
+        try:
+            for index, (ref_path, dist_path) in enumerate(jobs):
+                start(index, dist_path)
+                try:
+                    if ref_path not in ref_caches and os.path.exists(ref_path):
+                        ref_caches[ref_path] = ReferenceFrameCache(ref_path)
+                    ref_source = ref_caches.get(ref_path, ref_path)
+                    pair_metrics = _metric_job(ref_source, dist_path, metrics, sampling, metric_params,
+                                               queue_depth, control)
+                except Exception as e:
+                    record(index, None, str(e))
+                else:
+                    record(index, pair_metrics, None)
+        finally:
+            for ref_cache in ref_caches.values():
+                ref_cache.close()
+        return results
+
+    max_concurrent = max(1, max_concurrent or workers)
+    pending_jobs = iter(enumerate(jobs))
+    running = {}
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(MP_START_METHOD),
+                             initializer=_init_metric_worker,
+                             initargs=(REFERENCE_CACHE_RAM_BUDGET // workers,
+                                       REFERENCE_CACHE_DISK_BUDGET // workers, control)) as executor:
+
+        def submit_next():
+            if control is not None and control.cancelled:
+                return False
+            for index, (ref_path, dist_path) in pending_jobs:
+                start(index, dist_path)
+                future = executor.submit(_pooled_metric_job, ref_path, dist_path, tuple(metrics), sampling,
+                                         metric_params, queue_depth)
+                running[future] = index
+                return True
+            return False
+
+        # Manter no máximo `max_concurrent` pares em curso
+        while len(running) < max_concurrent and submit_next():
+            pass
+
+        while running:
+            # Com JobControl, acordar periodicamente para reagir ao cancelamento
+            done, _ = wait(running, timeout=0.2 if control is not None else None,
+                           return_when=FIRST_COMPLETED)
+            if control is not None and control.cancelled:
+                # Os processos em curso param no frame seguinte; esperar por eles
+                wait(running)
+                break
+            for future in done:
+                index = running.pop(future)
+                try:
+                    pair_metrics = future.result()
+                except Exception as e:
+                    record(index, None, str(e))
+                else:
+                    record(index, pair_metrics, None)
+                submit_next()
+
+    if control is not None:
+        control.check()
+    return results
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Base de dados única (SQLite) com os ratings de todos os testes subjetivos
+Cada sessão de teste acrescenta os seus ensaios à tabela de ratings, indexada
+pelo nome do teste e pelos nomes dos vídeos de referência e distorcido; os
+CSVs tests/<nome>/results_*.csv de versões anteriores podem ser importados.
+As análises consultam apenas as linhas de que precisam, sem reler CSVs
+"""
+
+import argparse
+import glob
+import itertools
+import os
+import sqlite3
+
+import pandas as pd
+
+from playback import PlaybackTelemetry
+
+
+# Localização por omissão da base de dados de ratings
+DEFAULT_STORE_PATH = os.path.join('.', 'tests', 'ratings.sqlite')
+
+# Valores por lista IN (...) numa consulta (o SQLite aceita 999 parâmetros nas versões antigas)
+QUERY_CHUNK_SIZE = 500
+
+# Colunas de cada ensaio (mesmos nomes dos CSVs de resultados) e tipo SQLite
+RATING_COLUMNS = {
+    'nome_do_teste': 'TEXT',
+    'reference_filename': 'TEXT',
+    'distorted_filename': 'TEXT NOT NULL',
+    'trial_index': 'INTEGER',
+    'rating_0_10': 'REAL NOT NULL',
+    'timestamp': 'TEXT',
+    **{column: 'REAL' for column in PlaybackTelemetry.COLUMNS},
+}
+
+
+def _chunks(values):
+    """Divide `values` em listas de no máximo QUERY_CHUNK_SIZE elementos"""
+    values = list(values)
+    return [values[start:start + QUERY_CHUNK_SIZE] for start in range(0, len(values), QUERY_CHUNK_SIZE)]
+
+
+class RatingsStore:
+    """Tabela SQLite de ratings, só com inserções (uma sessão = um CSV ou um teste gravado)"""
+
+    def __init__(self, db_path=DEFAULT_STORE_PATH):
+        self.db_path = db_path
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+
+        self._conn = sqlite3.connect(db_path)
+        columns_sql = ",\n                ".join(f"{name} {sql_type}" for name, sql_type in RATING_COLUMNS.items())
+        self._conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS ratings (
+                id INTEGER PRIMARY KEY,
+                session TEXT NOT NULL,
+                {columns_sql}
+            )
+        """)
+        # Ficheiros CSV já importados (para não duplicar ratings ao importar de novo)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS imported_files (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                rows INTEGER NOT NULL
+            )
+        """)
+        for column in ('nome_do_teste', 'reference_filename', 'distorted_filename', 'session'):
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_ratings_{column} ON ratings ({column})")
+        self._conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self._conn.close()
+
+    def add_session(self, rows, session):
+        """Acrescenta os ensaios de uma sessão (lista de dicts ou DataFrame); devolve quantos"""
+        count = self._insert(rows, session)
+        self._conn.commit()
+        return count
+
+    def _insert(self, rows, session):
+        """Insere as linhas sem confirmar a transação"""
+        # Colunas em falta e valores vazios passam a NULL
+        df = pd.DataFrame(rows).reindex(columns=list(RATING_COLUMNS)).astype(object)
+        values = list(df.where(df.notna(), None).itertuples(index=False, name=None))
+        placeholders = ", ".join("?" * (len(RATING_COLUMNS) + 1))
+        self._conn.executemany(f"INSERT INTO ratings (session, {', '.join(RATING_COLUMNS)}) "
+                               f"VALUES ({placeholders})",
+                               [(session,) + row for row in values])
+        return len(values)
+
+    def import_csv(self, csv_path):
+        """Importa um CSV de resultados; devolve o número de ratings importados
+
+        Um CSV já importado e não modificado é ignorado (devolve 0); se tiver
+        sido modificado, os seus ratings são substituídos.
+        """
+        path = os.path.abspath(csv_path)
+        stat = os.stat(path)
+        imported = self._conn.execute("SELECT size, mtime_ns FROM imported_files WHERE path = ?",
+                                      (path,)).fetchone()
+        if imported == (stat.st_size, stat.st_mtime_ns):
+            return 0
+
+        df = pd.read_csv(path)
+        if 'distorted_filename' not in df.columns or 'rating_0_10' not in df.columns:
+            raise ValueError(f"CSV inválido: {os.path.basename(path)} "
+                             "(deve conter colunas 'distorted_filename' e 'rating_0_10')")
+
+        self._conn.execute("DELETE FROM ratings WHERE session = ?", (path,))
+        count = self._insert(df, path)
+        self._conn.execute("INSERT OR REPLACE INTO imported_files VALUES (?, ?, ?, ?)",
+                           (path, stat.st_size, stat.st_mtime_ns, count))
+        self._conn.commit()
+        return count
+
+    def import_tests_dir(self, tests_dir=os.path.join('.', 'tests')):
+        """Importa todos os tests/<nome>/results_*.csv; devolve o número de ratings novos"""
+        imported = 0
+        for csv_path in sorted(glob.glob(os.path.join(tests_dir, '*', 'results_*.csv'))):
+            try:
+                imported += self.import_csv(csv_path)
+            except Exception as e:
+                print(f"⚠ Aviso: Falha ao importar {csv_path}: {e}")
+        return imported
+
+    def query(self, test_names=None, sources=None, reference_filename=None, distorted_filenames=None):
+        """Ratings individuais como DataFrame (colunas dos CSVs de resultados)
+
+        Devolve as linhas de qualquer dos testes `test_names` ou das sessões
+        `sources` (caminhos de CSVs importados), restringidas opcionalmente a
+        uma referência e a uma lista de vídeos distorcidos. Sem testes nem
+        sessões, considera todos os ratings.
+        """
+        # Uma consulta por bloco de valores (limite de parâmetros do SQLite); as
+        # condições de testes e de sessões (OR) dão consultas separadas
+        selections = ([('nome_do_teste', chunk) for chunk in _chunks(test_names or [])] +
+                      [('session', chunk) for chunk in _chunks(os.path.abspath(source) for source in sources or [])])
+        distorted_chunks = _chunks(distorted_filenames) if distorted_filenames else [None]
+
+        frames = []
+        for selection, distorted_chunk in itertools.product(selections or [None], distorted_chunks):
+            conditions = []
+            args = []
+            if selection:
+                column, values = selection
+                conditions.append(f"{column} IN ({', '.join('?' * len(values))})")
+                args += values
+            if reference_filename:
+                conditions.append("reference_filename = ?")
+                args.append(reference_filename)
+            if distorted_chunk:
+                conditions.append(f"distorted_filename IN ({', '.join('?' * len(distorted_chunk))})")
+                args += distorted_chunk
+
+            query = f"SELECT id, {', '.join(RATING_COLUMNS)} FROM ratings"
+            if conditions:
+                query += " WHERE " + " AND ".join(conditions)
+            frames.append(pd.read_sql_query(query, self._conn, params=args))
+
+        # Uma linha pode pertencer a um teste e a uma sessão selecionados
+        df = pd.concat(frames, ignore_index=True).drop_duplicates('id').sort_values('id')
+        df = df.drop(columns='id').reset_index(drop=True)
+
+        # Colunas numéricas só com NULL (ex.: CSVs sem telemetria) chegam como objetos
+        for column, sql_type in RATING_COLUMNS.items():
+            if sql_type.startswith(('REAL', 'INTEGER')):
+                df[column] = pd.to_numeric(df[column])
+        return df
+
+    def tests(self):
+        """Testes guardados: DataFrame com nome, número de sessões e de ratings, e último rating"""
+        return pd.read_sql_query("""
+            SELECT nome_do_teste, COUNT(DISTINCT session) AS sessions, COUNT(*) AS ratings,
+                   MAX(timestamp) AS last_rating
+            FROM ratings WHERE nome_do_teste IS NOT NULL
+            GROUP BY nome_do_teste ORDER BY nome_do_teste
+        """, self._conn)
+
+    def stats(self):
+        """Número de ratings, sessões e testes, e tamanho da base de dados"""
+        ratings, sessions, tests = self._conn.execute(
+            "SELECT COUNT(*), COUNT(DISTINCT session), COUNT(DISTINCT nome_do_teste) FROM ratings"
+        ).fetchone()
+        size = os.path.getsize(self.db_path) if os.path.exists(self.db_path) else 0
+        return {'ratings': ratings, 'sessions': sessions, 'tests': tests, 'bytes': size}
+
+
+def main():
+    """Linha de comandos para importar CSVs e consultar a base de dados de ratings"""
+    parser = argparse.ArgumentParser(description="Gestão da base de dados de ratings")
+    parser.add_argument('--db', default=DEFAULT_STORE_PATH, help="caminho da base de dados de ratings")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    import_parser = subparsers.add_parser('import', help="importa CSVs de resultados")
+    import_parser.add_argument('paths', nargs='*',
+                               help="CSVs a importar (por omissão, tests/*/results_*.csv)")
+
+    subparsers.add_parser('tests', help="lista os testes guardados")
+    subparsers.add_parser('stats', help="mostra o número de ratings e o tamanho da base de dados")
+
+    args = parser.parse_args()
+
+    with RatingsStore(args.db) as store:
+        if args.command == 'import':
+            if args.paths:
+                imported = sum(store.import_csv(path) for path in args.paths)
+            else:
+                imported = store.import_tests_dir()
+            print(f"✓ {imported} rating(s) importado(s)")
+        elif args.command == 'tests':
+            for row in store.tests().itertuples():
+                print(f"{row.nome_do_teste}: {row.ratings} rating(s) em {row.sessions} sessão(ões), "
+                      f"último em {row.last_rating}")
+        else:
+            stats = store.stats()
+            print(f"Ratings: {stats['ratings']} ({stats['sessions']} sessão(ões), {stats['tests']} teste(s))")
+            print(f"Tamanho: {stats['bytes'] / 1024:.1f} KiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Diário de sessão (append-only) gravado à medida que cada rating é dado
+Cada sessão de teste escreve tests/<nome>/journal_<timestamp>.jsonl: um
+cabeçalho com a configuração (vídeos e ordem dos ensaios), uma linha por
+ensaio avaliado e, no fim, o estado final da sessão. As escritas são feitas
+por uma thread própria (flush + fsync por linha), sem bloquear a interface.
+Uma sessão sem linha final foi interrompida e pode ser retomada
+"""
+
+import glob
+import json
+import os
+import queue
+import threading
+
+
+# Padrão dos diários de sessão dentro de cada pasta de teste
+JOURNAL_PATTERN = 'journal_*.jsonl'
+
+# Estados finais de uma sessão
+STATUS_COMPLETED = 'completed'
+STATUS_DISCARDED = 'discarded'
+
+
+class TrialJournal:
+    """Escritor do diário de uma sessão numa thread em segundo plano"""
+
+    def __init__(self, path):
+        self.path = path
+        self.error = None
+        self._queue = queue.Queue()
+
+        journal_dir = os.path.dirname(path)
+        if journal_dir:
+            os.makedirs(journal_dir, exist_ok=True)
+
+        self._file = open(path, 'a', encoding='utf-8')
+        # Terminar uma última linha incompleta (interrupção a meio da escrita) antes de acrescentar
+        if self._file.tell() > 0:
+            with open(path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    self._file.write("\n")
+        self._thread = threading.Thread(target=self._writer, daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def create(cls, path, nome_do_teste, reference_path, distorted_videos, trial_order, **settings):
+        """Inicia o diário de uma nova sessão com o cabeçalho da configuração"""
+        journal = cls(path)
+        journal._put({'type': 'session', 'nome_do_teste': nome_do_teste,
+                      'reference_path': os.path.abspath(reference_path),
+                      'distorted_videos': [os.path.abspath(video_path) for video_path in distorted_videos],
+                      'trial_order': list(trial_order), 'settings': settings})
+        return journal
+
+    def _put(self, record):
+        self._queue.put(json.dumps(record, ensure_ascii=False))
+
+    def append_trial(self, result):
+        """Acrescenta o resultado de um ensaio (não bloqueia)"""
+        self._put(dict(result, type='trial'))
+
+    def finish(self, status=STATUS_COMPLETED, **details):
+        """Regista o estado final da sessão e fecha o diário (espera pelas escritas pendentes)"""
+        self._put(dict(details, type='end', status=status))
+        self.close()
+
+    def close(self):
+        """Fecha o diário depois de gravar todas as linhas pendentes"""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        self._file.close()
+
+    def _writer(self):
+        """Grava as linhas pendentes; cada lote fica em disco (fsync) antes do seguinte"""
+        running = True
+        while running:
+            lines = [self._queue.get()]
+            while True:
+                try:
+                    lines.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in lines:
+                lines = lines[:lines.index(None)]
+                running = False
+
+            if not lines:
+                continue
+            try:
+                self._file.write("".join(line + "\n" for line in lines))
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            except OSError as e:
+                self.error = e
+                print(f"⚠ Aviso: Falha ao gravar o diário da sessão {self.path}: {e}")
+
+
+def read_journal(path):
+    """Lê um diário; devolve (cabeçalho, lista de ensaios, registo final ou None)
+
+    Uma última linha incompleta (interrupção a meio da escrita) é ignorada.
+    """
+    header = None
+    trials = []
+    end = None
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            kind = record.pop('type', None)
+            if kind == 'session':
+                header = record
+            elif kind == 'trial':
+                trials.append(record)
+            elif kind == 'end':
+                end = record
+    return header, trials, end
+
+
+def find_interrupted_sessions(tests_dir=os.path.join('.', 'tests')):
+    """Diários de sessões interrompidas (sem registo final), do mais recente para o mais antigo"""
+    sessions = []
+    for path in glob.glob(os.path.join(tests_dir, '*', JOURNAL_PATTERN)):
+        try:
+            header, trials, end = read_journal(path)
+        except OSError:
+            continue
+        if header is not None and end is None:
+            sessions.append((os.path.getmtime(path), path, header, trials))
+    sessions.sort(reverse=True)
+    return [(path, header, trials) for _, path, header, trials in sessions]
+
+
+def discard_session(path):
+    """Marca uma sessão interrompida como descartada (deixa de ser proposta para retomar)"""
+    journal = TrialJournal(path)
+    journal.finish(STATUS_DISCARDED)
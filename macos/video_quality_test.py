@@ -11,21 +11,33 @@ import random
 import csv
 import os
 import platform
+import queue
 import threading
 import time
 from datetime import datetime
 from pathlib import Path
 from PIL import Image, ImageTk
 import numpy as np
-import matplotlib
-matplotlib.use('Agg')  # Usar backend não-interativo
-import matplotlib.pyplot as plt
-from scipy import stats
-from scipy.optimize import curve_fit
-from skimage.metrics import structural_similarity as ssim
-import pandas as pd
-from dotenv import load_dotenv
-import google.generativeai as genai
+
+from analysis_engine import aggregate_rating_rows, generate_analysis, safe_dirname
+from playback import (COMPOSITE_GAP, PRELOAD_SECONDS, FramePrefetcher, PlaybackTelemetry,
+                      SideBySideCompositor, next_frame_pair)
+from quality_metrics import MAX_FRAMES, JobControl, MetricsCancelled, SamplingPolicy
+from media_library import MediaLibrary
+from ratings_store import RatingsStore
+from trial_journal import (STATUS_COMPLETED, TrialJournal, discard_session, find_interrupted_sessions,
+                           read_journal)
+
+
+# Opções de amostragem temporal no ecrã de resultados (texto -> modo da SamplingPolicy)
+SAMPLING_OPTIONS = {
+    "Primeiros N frames": 'first',
+    "Todos os frames": 'full',
+    "1 em cada k frames": 'every_k',
+    "N frames uniformes": 'uniform',
+    "Apenas keyframes (máx. N)": 'keyframes',
+    "Orçamento de tempo (s)": 'time_budget',
+}
 
 
 class VideoQualityTestApp:
@@ -44,9 +56,16 @@ class VideoQualityTestApp:
         self.results = []
         self.nome_do_teste = None
         
-        # Caputadores de vídeo OpenCV
-        self.reference_cap = None
-        self.distorted_cap = None
+        # Diário da sessão em curso (cada rating fica em disco assim que é dado)
+        self.journal = None
+        
+        # Leitores de vídeo com descodificação antecipada (playback.FramePrefetcher)
+        self.reference_stream = None
+        self.distorted_stream = None
+        
+        # Pré-carregamento do vídeo distorcido do próximo ensaio (thread e leitor resultante)
+        self.preload_thread = None
+        self.preloaded_stream = None
         
         # Estado de reprodução
         self.is_playing = False
@@ -57,6 +76,29 @@ class VideoQualityTestApp:
         self.fps = 30.0
         self.frame_time = 1.0 / self.fps
         
+        # Relógio de apresentação: próximo frame a apresentar, instante do frame 0
+        # (None = reancorar ao retomar) e frames saltados por atraso no ensaio atual
+        self.playback_frame = 0
+        self.playback_start = None
+        self.dropped_frames = 0
+        self.restart_requested = False
+        
+        # Telemetria da reprodução do ensaio atual; playback_segment muda sempre que o
+        # relógio é reancorado (retoma, reinício), para não medir pausas como falhas
+        self.playback_telemetry = PlaybackTelemetry(self.fps)
+        self.playback_segment = 0
+        
+        # Atualização do ecrã: no máximo uma pendente (o frame mais recente substitui
+        # o anterior); coalesced_frames conta os frames substituídos sem serem mostrados
+        self.frames_lock = threading.Lock()
+        self.pending_frames = None
+        self.update_scheduled = False
+        self.coalesced_frames = 0
+        
+        # Mostrar referência e distorcido numa única imagem (um só envio ao Tk por frame)
+        self.composite_display = False
+        self.compositor = SideBySideCompositor()
+        
         # Criar interface inicial
         self.create_welcome_screen()
     
@@ -93,6 +135,23 @@ class VideoQualityTestApp:
                  command=self.create_test_setup_screen,
                  width=20).pack(pady=20)
         
+        # Sessão interrompida (diário sem registo final): retomar no primeiro ensaio por avaliar
+        interrupted = find_interrupted_sessions()
+        if interrupted:
+            journal_path, header, trials = interrupted[0]
+            ttk.Label(test_frame,
+                     text=f"Teste interrompido: {header['nome_do_teste']}\n"
+                          f"{len(trials)}/{len(header['trial_order'])} ensaios avaliados",
+                     foreground="gray",
+                     justify=tk.CENTER).pack(pady=5)
+            
+            resume_frame = ttk.Frame(test_frame)
+            resume_frame.pack()
+            ttk.Button(resume_frame, text="Retomar Teste",
+                      command=lambda: self.resume_test(journal_path)).pack(side=tk.LEFT, padx=5)
+            ttk.Button(resume_frame, text="Descartar",
+                      command=lambda: self.discard_interrupted_test(journal_path)).pack(side=tk.LEFT, padx=5)
+        
         # Opção 2: Criar Resultado
         result_frame = ttk.LabelFrame(options_frame, text="Criar Resultado", padding="30")
         result_frame.pack(side=tk.LEFT, padx=30, fill=tk.BOTH, expand=True)
@@ -164,6 +223,11 @@ class VideoQualityTestApp:
         ttk.Button(dist_frame, text="Selecionar Vídeos Distorcidos", 
                   command=self.select_distorted_videos).pack(pady=5)
         
+        # Opção de apresentação: uma só imagem composta (mais leve em máquinas lentas)
+        self.composite_display_var = tk.BooleanVar(value=self.composite_display)
+        ttk.Checkbutton(main_frame, text="Mostrar os dois vídeos numa única imagem (mais leve)",
+                        variable=self.composite_display_var).pack(pady=5)
+        
         # Botões de ação
         action_frame = ttk.Frame(main_frame)
         action_frame.pack(pady=30)
@@ -219,15 +283,63 @@ class VideoQualityTestApp:
             return
         
         self.nome_do_teste = nome_teste
+        self.composite_display = self.composite_display_var.get()
         
         # Criar ordem aleatória dos vídeos distorcidos
         self.trial_order = list(range(len(self.distorted_videos)))
         random.shuffle(self.trial_order)
         self.current_trial_index = 0
         
+        # Diário da sessão (permite retomar o teste após uma interrupção)
+        timestamp_str = datetime.now().strftime("%Y%m%d_%H%M%S")
+        journal_path = os.path.join('.', 'tests', safe_dirname(self.nome_do_teste),
+                                    f"journal_{timestamp_str}.jsonl")
+        self.journal = TrialJournal.create(journal_path, self.nome_do_teste, self.reference_video_path,
+                                           self.distorted_videos, self.trial_order,
+                                           composite_display=self.composite_display)
+        
         # Criar interface de teste
         self.create_test_screen()
     
+    def resume_test(self, journal_path):
+        """Retoma uma sessão interrompida no primeiro ensaio por avaliar, com a mesma ordem dos ensaios"""
+        try:
+            header, trials, _ = read_journal(journal_path)
+        except Exception as e:
+            messagebox.showerror("Erro", f"Erro ao ler o diário da sessão:\n{str(e)}")
+            return
+        
+        videos = [header['reference_path']] + header['distorted_videos']
+        missing = [os.path.basename(path) for path in videos if not os.path.exists(path)]
+        if missing:
+            messagebox.showerror("Erro", "Vídeos da sessão não encontrados:\n" + "\n".join(missing[:10]) +
+                                 ("\n..." if len(missing) > 10 else ""))
+            return
+        
+        self.nome_do_teste = header['nome_do_teste']
+        self.reference_video_path = header['reference_path']
+        self.distorted_videos = header['distorted_videos']
+        self.trial_order = header['trial_order']
+        self.composite_display = header.get('settings', {}).get('composite_display', False)
+        self.results = trials
+        self.current_trial_index = len(trials)
+        self.journal = TrialJournal(journal_path)
+        
+        if self.current_trial_index >= len(self.trial_order):
+            # Todos os ensaios já avaliados: faltava apenas guardar os resultados
+            self.save_results()
+            self.show_completion_screen()
+            return
+        
+        self.create_test_screen()
+    
+    def discard_interrupted_test(self, journal_path):
+        """Descarta uma sessão interrompida (o diário fica guardado, mas deixa de ser proposto)"""
+        if messagebox.askyesno("Descartar", "Descartar o teste interrompido?\n\n"
+                                            "Os ratings já dados não serão guardados em CSV."):
+            discard_session(journal_path)
+            self.create_welcome_screen()
+    
     def create_test_screen(self):
         """Cria a interface de teste com os dois players de vídeo"""
         # Limpar widgets existentes
@@ -242,10 +354,8 @@ class VideoQualityTestApp:
         info_frame = ttk.Frame(main_frame)
         info_frame.pack(fill=tk.X, pady=5)
         
-        trial_num = self.current_trial_index + 1
-        total_trials = len(self.distorted_videos)
-        info_text = f"Ensaio {trial_num}/{total_trials} | Teste: {self.nome_do_teste}"
-        ttk.Label(info_frame, text=info_text, font=("Arial", 12, "bold")).pack()
+        self.trial_info_label = ttk.Label(info_frame, text=self.trial_info_text(), font=("Arial", 12, "bold"))
+        self.trial_info_label.pack()
         
         # Frame de controlos fixo no bottom (empacotar primeiro com side=BOTTOM para ficar sempre no fundo)
         controls_frame = ttk.Frame(main_frame)
@@ -255,20 +365,33 @@ class VideoQualityTestApp:
         video_frame = ttk.Frame(main_frame)
         video_frame.pack(fill=tk.BOTH, expand=True, pady=10)
         
-        # Frame para vídeo de referência (esquerda)
-        ref_video_frame = ttk.LabelFrame(video_frame, text="Referência", padding="5")
-        ref_video_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=5)
-        
-        # Label para exibir o vídeo de referência (com tamanho fixo)
-        self.reference_video_label = tk.Label(ref_video_frame, bg="black", text="Carregando...")
-        self.reference_video_label.pack(fill=tk.BOTH, expand=True)
-        
-        # Frame para vídeo distorcido (direita)
-        dist_video_frame = ttk.LabelFrame(video_frame, text="Distorcido", padding="5")
-        dist_video_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=5)
+        if self.composite_display:
+            # Um único label com a imagem composta (referência à esquerda, distorcido à direita)
+            composite_frame = ttk.LabelFrame(video_frame, text="Referência  |  Distorcido", padding="5")
+            composite_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=5)
+            
+            self.reference_video_label = tk.Label(composite_frame, bg="black", text="Carregando...")
+            self.reference_video_label.pack(fill=tk.BOTH, expand=True)
+            self.distorted_video_label = self.reference_video_label
+        else:
+            # Frame para vídeo de referência (esquerda)
+            ref_video_frame = ttk.LabelFrame(video_frame, text="Referência", padding="5")
+            ref_video_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=5)
+            
+            # Label para exibir o vídeo de referência (com tamanho fixo)
+            self.reference_video_label = tk.Label(ref_video_frame, bg="black", text="Carregando...")
+            self.reference_video_label.pack(fill=tk.BOTH, expand=True)
+            
+            # Frame para vídeo distorcido (direita)
+            dist_video_frame = ttk.LabelFrame(video_frame, text="Distorcido", padding="5")
+            dist_video_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=5)
+            
+            self.distorted_video_label = tk.Label(dist_video_frame, bg="black", text="Carregando...")
+            self.distorted_video_label.pack(fill=tk.BOTH, expand=True)
         
-        self.distorted_video_label = tk.Label(dist_video_frame, bg="black", text="Carregando...")
-        self.distorted_video_label.pack(fill=tk.BOTH, expand=True)
+        # PhotoImage persistente de cada label (criada no primeiro frame)
+        self.reference_photo = None
+        self.distorted_photo = None
         
         # Guardar tamanhos fixos dos labels após serem criados
         self.root.update_idletasks()
@@ -324,6 +447,28 @@ class VideoQualityTestApp:
         # Inicializar players de vídeo
         self.setup_video_players()
     
+    def trial_info_text(self):
+        """Texto de informação do ensaio atual"""
+        trial_num = self.current_trial_index + 1
+        total_trials = len(self.distorted_videos)
+        return f"Ensaio {trial_num}/{total_trials} | Teste: {self.nome_do_teste}"
+    
+    def show_next_trial(self):
+        """Passa ao ensaio seguinte reutilizando o ecrã e o leitor da referência"""
+        self.trial_info_label.config(text=self.trial_info_text())
+        self.rating_var.set(5)
+        self.rating_label.config(text="5")
+        self.play_pause_button.config(text="▶ Play")
+        
+        # Limpar o último frame do ensaio anterior
+        for label in (self.reference_video_label, self.distorted_video_label):
+            label.config(image='')
+            label.image = None
+        self.reference_photo = None
+        self.distorted_photo = None
+        
+        self.setup_video_players()
+    
     def update_label_sizes(self):
         """Atualiza os tamanhos dos labels (chamado apenas quando necessário)"""
         try:
@@ -362,25 +507,85 @@ class VideoQualityTestApp:
             self.root.after_idle(self.update_label_sizes)
     
     def setup_video_players(self):
-        """Configura os captadores OpenCV para os dois vídeos"""
-        # Abrir vídeos com OpenCV
-        self.reference_cap = cv2.VideoCapture(self.reference_video_path)
+        """Configura os leitores (com descodificação antecipada) para os dois vídeos
+        
+        A referência é a mesma em todos os ensaios: o leitor é reaberto apenas no
+        primeiro ensaio e depois só volta ao início. O vídeo distorcido vem do
+        pré-carregamento feito durante o ensaio anterior, quando existe.
+        """
+        # Abrir vídeos; cada um é descodificado e redimensionado na sua própria thread
+        if self.reference_stream is None:
+            self.reference_stream = FramePrefetcher(
+                self.reference_video_path,
+                target_size=lambda: self.label_size(self.reference_video_label)
+            ).start()
+        else:
+            self.reference_stream.rewind()
         
         current_distorted_index = self.trial_order[self.current_trial_index]
-        self.distorted_cap = cv2.VideoCapture(self.distorted_videos[current_distorted_index])
-        
-        # Obter FPS dos vídeos (usar o menor para sincronização)
-        ref_fps = self.reference_cap.get(cv2.CAP_PROP_FPS) or 30.0
-        dist_fps = self.distorted_cap.get(cv2.CAP_PROP_FPS) or 30.0
-        self.fps = min(ref_fps, dist_fps)
+        distorted_path = self.distorted_videos[current_distorted_index]
+        self.distorted_stream = self.take_preloaded_stream(distorted_path)
+        if self.distorted_stream is None:
+            self.distorted_stream = FramePrefetcher(
+                distorted_path,
+                target_size=lambda: self.label_size(self.distorted_video_label)
+            ).start()
+        
+        # Relógio de apresentação ao FPS do vídeo mais rápido; os frames são emparelhados
+        # por timestamp (o vídeo mais lento repete frames)
+        self.fps = max(self.reference_stream.fps, self.distorted_stream.fps)
         self.frame_time = 1.0 / self.fps
         
         # Estado inicial: pausado
         self.is_playing = False
         self.stop_video = False
+        self.playback_frame = 0
+        self.playback_start = None
+        self.dropped_frames = 0
+        self.restart_requested = False
+        self.coalesced_frames = 0
+        with self.frames_lock:
+            if self.pending_frames is not None:
+                self.release_frames(self.pending_frames)
+            self.pending_frames = None
+        self.playback_telemetry = PlaybackTelemetry(self.fps)
         
         # Iniciar thread de reprodução
         self.start_video_thread()
+        
+        # Abrir e descodificar o início do próximo ensaio enquanto este é avaliado
+        self.preload_next_trial()
+    
+    def preload_next_trial(self):
+        """Abre o vídeo distorcido do próximo ensaio em segundo plano"""
+        next_index = self.current_trial_index + 1
+        if next_index >= len(self.trial_order):
+            return
+        
+        distorted_path = self.distorted_videos[self.trial_order[next_index]]
+        
+        def preload():
+            self.preloaded_stream = FramePrefetcher(
+                distorted_path,
+                target_size=lambda: self.label_size(self.distorted_video_label),
+                preload_seconds=PRELOAD_SECONDS
+            ).start()
+        
+        self.preloaded_stream = None
+        self.preload_thread = threading.Thread(target=preload, daemon=True)
+        self.preload_thread.start()
+    
+    def take_preloaded_stream(self, distorted_path):
+        """Devolve o leitor pré-carregado para `distorted_path` (ou None se não existir)"""
+        if self.preload_thread is not None:
+            self.preload_thread.join()
+            self.preload_thread = None
+        
+        stream, self.preloaded_stream = self.preloaded_stream, None
+        if stream is not None and stream.video_path != distorted_path:
+            stream.close()
+            stream = None
+        return stream
     
     def start_video_thread(self):
         """Inicia a thread de reprodução de vídeo"""
@@ -393,44 +598,73 @@ class VideoQualityTestApp:
         self.video_thread.start()
     
     def video_loop(self):
-        """Loop principal de reprodução de vídeo (executa em thread separada)"""
+        """Loop principal de reprodução de vídeo (executa em thread separada)
+        
+        Os frames chegam já redimensionados e convertidos dos FramePrefetcher de
+        cada vídeo. O tick N do relógio de apresentação (ao FPS do vídeo mais
+        rápido) ocorre no instante playback_start + N / fps (relógio monotónico) e
+        mostra, de cada vídeo, o frame cujo timestamp está em apresentação nesse
+        instante. Quando a reprodução se atrasa, os ticks cujo instante já passou
+        são saltados e contados em dropped_frames. O instante previsto de cada
+        tick segue com os frames para a telemetria (PlaybackTelemetry).
+        """
         while not self.stop_video:
+            if self.restart_requested:
+                # Reposicionar aqui (e não na thread principal) para não misturar frames antigos
+                self.restart_requested = False
+                self.reference_stream.seek(0)
+                self.distorted_stream.seek(0)
+                self.playback_frame = 0
+                self.playback_start = None
+            
             if self.is_playing:
-                # Ler frames de ambos os vídeos
-                ret_ref, frame_ref = self.reference_cap.read()
-                ret_dist, frame_dist = self.distorted_cap.read()
+                if self.playback_start is None:
+                    # Início ou retoma após pausa: ancorar o relógio no frame atual
+                    self.playback_start = time.monotonic() - self.playback_frame * self.frame_time
+                    self.playback_segment += 1
+                
+                # Primeiro tick cujo instante de substituição ainda não passou
+                elapsed = time.monotonic() - self.playback_start
+                target = max(self.playback_frame, int(elapsed / self.frame_time))
+                
+                streams = (self.reference_stream, self.distorted_stream)
+                try:
+                    pair = next_frame_pair(*streams, target * self.frame_time * 1000.0, timeout=0.1)
+                except queue.Empty:
+                    continue
                 
-                if not ret_ref or not ret_dist:
+                if pair is None:
                     # Fim do vídeo - parar reprodução
                     self.is_playing = False
                     self.root.after(0, lambda: self.play_pause_button.config(text="▶ Play"))
                     # Reiniciar para o início para próxima reprodução
-                    self.reference_cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-                    self.distorted_cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                    self.reference_stream.seek(0)
+                    self.distorted_stream.seek(0)
+                    self.playback_frame = 0
+                    self.playback_start = None
                     continue
                 
-                # Redimensionar frames para caber nos labels
-                frame_ref = self.resize_frame(frame_ref, self.reference_video_label)
-                frame_dist = self.resize_frame(frame_dist, self.distorted_video_label)
-                
-                # Converter para formato compatível com Tkinter
-                img_ref = Image.fromarray(cv2.cvtColor(frame_ref, cv2.COLOR_BGR2RGB))
-                img_dist = Image.fromarray(cv2.cvtColor(frame_dist, cv2.COLOR_BGR2RGB))
+                (_, ts_ref, img_ref), (_, ts_dist, img_dist) = pair
+                self.dropped_frames += target - self.playback_frame
+                self.playback_frame = target
                 
-                # Atualizar labels na thread principal (usar método auxiliar para evitar problemas de closure)
-                self.root.after(0, self._update_frames, img_ref, img_dist)
+                # Esperar pelo instante de apresentação deste tick
+                deadline = self.playback_start + target * self.frame_time
+                delay = deadline - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
                 
-                # Controlar FPS
-                time.sleep(self.frame_time)
+                # Atualizar labels na thread principal (no máximo uma atualização pendente)
+                self.schedule_frames(img_ref, img_dist, (deadline, abs(ts_ref - ts_dist), self.playback_segment),
+                                     streams)
+                self.playback_frame += 1
             else:
-                # Quando pausado, apenas esperar
+                # Quando pausado, apenas esperar (o relógio é reancorado ao retomar)
+                self.playback_start = None
                 time.sleep(0.1)
     
-    def resize_frame(self, frame, label):
-        """Redimensiona o frame para caber no label mantendo aspect ratio"""
-        if frame is None:
-            return None
-        
+    def label_size(self, label):
+        """Tamanho (largura, altura) em que os frames são desenhados para o label"""
         # Usar tamanhos fixos guardados (evita crescimento infinito)
         if label == self.reference_video_label:
             label_width = getattr(self, 'ref_label_width', 500)
@@ -444,56 +678,86 @@ class VideoQualityTestApp:
             label_width = 500
             label_height = 400
         
-        # Calcular novo tamanho mantendo aspect ratio
-        frame_height, frame_width = frame.shape[:2]
-        if frame_height == 0 or frame_width == 0:
-            return frame
-        
-        aspect_ratio = frame_width / frame_height
-        
-        if label_width / label_height > aspect_ratio:
-            new_height = label_height
-            new_width = int(new_height * aspect_ratio)
-        else:
-            new_width = label_width
-            new_height = int(new_width / aspect_ratio)
-        
-        # Garantir que os tamanhos são válidos
-        new_width = max(1, min(new_width, label_width))
-        new_height = max(1, min(new_height, label_height))
-        
-        # Redimensionar
-        resized = cv2.resize(frame, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
-        
-        # Criar frame preto do tamanho fixo do label e centralizar o vídeo
-        result = np.zeros((label_height, label_width, 3), dtype=np.uint8)
-        y_offset = (label_height - new_height) // 2
-        x_offset = (label_width - new_width) // 2
-        result[y_offset:y_offset+new_height, x_offset:x_offset+new_width] = resized
-        
-        return result
+        # Na imagem composta cada vídeo ocupa metade do label
+        if self.composite_display:
+            label_width = max(1, (label_width - COMPOSITE_GAP) // 2)
+        return label_width, label_height
+    
+    def schedule_frames(self, img_ref, img_dist, timing=None, streams=None):
+        """Entrega um par de frames à thread principal (executa na thread de reprodução)
+        
+        Se a atualização anterior ainda não foi feita, o par pendente é substituído
+        pelo mais recente em vez de se acumularem callbacks no Tk. `timing` é
+        (instante previsto, dessincronização em ms, troço de reprodução) e
+        `streams` os FramePrefetcher de onde vêm os frames, que os libertam
+        depois de mostrados.
+        """
+        with self.frames_lock:
+            if self.pending_frames is not None:
+                self.coalesced_frames += 1
+                self.release_frames(self.pending_frames)
+            self.pending_frames = (img_ref, img_dist, timing, streams)
+            if self.update_scheduled:
+                return
+            self.update_scheduled = True
+        self.root.after(0, self._update_frames)
+    
+    def release_frames(self, frames):
+        """Devolve os canvases de um par de frames pendente aos respetivos leitores"""
+        img_ref, img_dist, _, streams = frames
+        if streams is not None:
+            streams[0].release(img_ref)
+            streams[1].release(img_dist)
     
-    def _update_frames(self, img_ref, img_dist):
-        """Método auxiliar para atualizar frames (evita problemas de closure)"""
-        self.update_video_frames(img_ref, img_dist)
+    def _update_frames(self):
+        """Mostra o par de frames pendente mais recente (executa na thread principal)"""
+        with self.frames_lock:
+            frames, self.pending_frames = self.pending_frames, None
+            self.update_scheduled = False
+        if frames is not None:
+            img_ref, img_dist, timing, _ = frames
+            try:
+                self.update_video_frames(img_ref, img_dist)
+            finally:
+                # A PhotoImage guarda uma cópia: os canvases podem voltar a ser usados
+                self.release_frames(frames)
+            if timing is not None:
+                self.playback_telemetry.frame_shown(time.monotonic(), *timing)
     
     def update_video_frames(self, img_ref, img_dist):
-        """Atualiza os frames dos vídeos nos labels (executa na thread principal)"""
+        """Atualiza os frames dos vídeos nos labels (executa na thread principal)
+        
+        Os frames são canvases RGB já com o tamanho do label; cada label tem uma
+        PhotoImage persistente que é atualizada no lugar (paste), recriada apenas
+        quando o tamanho muda. Na imagem composta os dois frames são juntos numa
+        só imagem, enviada ao Tk uma única vez.
+        """
         try:
-            # As imagens já vêm redimensionadas do resize_frame com tamanho fixo
-            photo_ref = ImageTk.PhotoImage(image=img_ref)
-            photo_dist = ImageTk.PhotoImage(image=img_dist)
-            
-            # Atualizar apenas a imagem, sem alterar tamanho do label
-            self.reference_video_label.config(image=photo_ref)
-            self.reference_video_label.image = photo_ref  # Manter referência
-            
-            self.distorted_video_label.config(image=photo_dist)
-            self.distorted_video_label.image = photo_dist  # Manter referência
+            if self.composite_display:
+                frame = self.compositor.compose(img_ref, img_dist)
+                self.reference_photo = self._paste_frame(self.reference_video_label, self.reference_photo, frame)
+                return
+            self.reference_photo = self._paste_frame(self.reference_video_label, self.reference_photo, img_ref)
+            self.distorted_photo = self._paste_frame(self.distorted_video_label, self.distorted_photo, img_dist)
         except Exception as e:
             # Ignorar erros de atualização (pode acontecer ao fechar)
             pass
     
+    def _paste_frame(self, label, photo, canvas):
+        """Copia o canvas para a PhotoImage do label, criando-a se necessário"""
+        height, width = canvas.shape[:2]
+        # Imagem PIL sobre a memória do canvas (sem cópia)
+        image = Image.frombuffer('RGB', (width, height), canvas, 'raw', 'RGB', 0, 1)
+        
+        if photo is None or (photo.width(), photo.height()) != (width, height):
+            photo = ImageTk.PhotoImage(image=image)
+            # Atualizar apenas a imagem, sem alterar tamanho do label
+            label.config(image=photo)
+            label.image = photo  # Manter referência
+        else:
+            photo.paste(image)
+        return photo
+    
     def toggle_play_pause(self):
         """Alterna entre play e pause para ambos os vídeos"""
         self.is_playing = not self.is_playing
@@ -507,11 +771,8 @@ class VideoQualityTestApp:
         was_playing = self.is_playing
         self.is_playing = False
         
-        # Reiniciar vídeos
-        if self.reference_cap:
-            self.reference_cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-        if self.distorted_cap:
-            self.distorted_cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        # Reiniciar vídeos (o reposicionamento é feito pela thread de reprodução)
+        self.restart_requested = True
         
         self.is_playing = was_playing
         if not self.is_playing:
@@ -548,19 +809,31 @@ class VideoQualityTestApp:
         if self.video_thread and self.video_thread.is_alive():
             self.video_thread.join(timeout=1.0)
         
-        if self.reference_cap:
-            self.reference_cap.release()
-        if self.distorted_cap:
-            self.distorted_cap.release()
+        # Telemetria da reprodução deste ensaio (frames não vistos = saltados + substituídos)
+        result.update(self.playback_telemetry.to_row(
+            dropped_frames=self.dropped_frames + self.coalesced_frames,
+            underruns=self.reference_stream.underruns + self.distorted_stream.underruns
+        ))
+        
+        # Gravar no diário da sessão (em segundo plano)
+        if self.journal:
+            self.journal.append_trial(result)
+        
+        if self.distorted_stream:
+            self.distorted_stream.close()
+            self.distorted_stream = None
         
         # Avançar para próximo ensaio
         self.current_trial_index += 1
         
         if self.current_trial_index < len(self.distorted_videos):
-            # Criar novo ecrã de teste
-            self.create_test_screen()
+            # Reutilizar o ecrã de teste (o próximo vídeo já está pré-carregado)
+            self.show_next_trial()
         else:
             # Todos os ensaios concluídos
+            if self.reference_stream:
+                self.reference_stream.close()
+                self.reference_stream = None
             self.save_results()
             self.show_completion_screen()
     
@@ -580,7 +853,7 @@ class VideoQualityTestApp:
         title_label.pack(pady=20)
         
         # Variáveis para armazenar seleções
-        self.calc_csv_paths = []  # Lista de CSVs
+        self.calc_sources = []  # Lista de ('csv', caminho) ou ('test', nome do teste)
         self.calc_ref_path = None
         
         # Nome do resultado
@@ -592,8 +865,8 @@ class VideoQualityTestApp:
         self.calc_nome_resultado_entry.pack(side=tk.LEFT, padx=5)
         self.calc_nome_resultado_entry.bind('<KeyRelease>', self.on_nome_resultado_change)
         
-        # Frame para CSVs
-        csv_frame = ttk.LabelFrame(main_frame, text="Ficheiros CSV (pode adicionar vários para calcular médias)", padding="15")
+        # Frame para CSVs e testes guardados
+        csv_frame = ttk.LabelFrame(main_frame, text="Testes guardados e ficheiros CSV (pode adicionar vários para calcular médias)", padding="15")
         csv_frame.pack(fill=tk.BOTH, expand=True, padx=20, pady=10)
         
         # Lista de CSVs com scrollbar
@@ -618,6 +891,16 @@ class VideoQualityTestApp:
         ttk.Button(csv_buttons_frame, text="Remover Selecionado", 
                   command=self.remove_csv_file).pack(side=tk.LEFT, padx=5)
         
+        # Testes da base de dados de ratings (todas as sessões de cada teste)
+        ttk.Button(csv_buttons_frame, text="Adicionar Teste",
+                  command=self.add_saved_test).pack(side=tk.RIGHT, padx=5)
+        self.calc_test_var = tk.StringVar(value="")
+        self.calc_test_combo = ttk.Combobox(csv_buttons_frame, textvariable=self.calc_test_var,
+                                            state="readonly", width=25, values=[])
+        self.calc_test_combo.pack(side=tk.RIGHT, padx=5)
+        ttk.Label(csv_buttons_frame, text="Teste guardado:").pack(side=tk.RIGHT, padx=5)
+        self.load_saved_tests()
+        
         # Frame para vídeo de referência
         ref_frame = ttk.LabelFrame(main_frame, text="Vídeo de Referência", padding="15")
         ref_frame.pack(fill=tk.X, padx=20, pady=10)
@@ -635,6 +918,58 @@ class VideoQualityTestApp:
             command=self.select_reference_for_calc
         ).pack(side=tk.RIGHT)
         
+        # Biblioteca de vídeos: os vídeos distorcidos são encontrados pelo nome no índice
+        library_frame = ttk.LabelFrame(main_frame, text="Biblioteca de Vídeos", padding="15")
+        library_frame.pack(fill=tk.X, padx=20, pady=10)
+        
+        self.library_status_label = ttk.Label(library_frame, text="", foreground="gray")
+        self.library_status_label.pack(side=tk.LEFT, padx=10)
+        
+        ttk.Button(library_frame, text="Atualizar",
+                  command=self.update_media_library).pack(side=tk.RIGHT, padx=5)
+        ttk.Button(library_frame, text="Adicionar Pasta",
+                  command=self.add_library_folder).pack(side=tk.RIGHT, padx=5)
+        
+        self.library_thread = None
+        self.update_media_library()
+        
+        # Número de processos para o cálculo das métricas
+        workers_frame = ttk.Frame(main_frame)
+        workers_frame.pack(pady=10)
+        
+        ttk.Label(workers_frame, text="Processos paralelos:").pack(side=tk.LEFT, padx=5)
+        self.calc_workers_var = tk.IntVar(value=os.cpu_count() or 1)
+        ttk.Spinbox(workers_frame, from_=1, to=os.cpu_count() or 1, width=5,
+                    textvariable=self.calc_workers_var).pack(side=tk.LEFT, padx=5)
+        
+        # Amostragem temporal dos frames usados nas métricas objetivas
+        ttk.Label(workers_frame, text="Amostragem:").pack(side=tk.LEFT, padx=(20, 5))
+        self.calc_sampling_var = tk.StringVar(value=list(SAMPLING_OPTIONS)[0])
+        ttk.Combobox(workers_frame, textvariable=self.calc_sampling_var, state="readonly", width=22,
+                     values=list(SAMPLING_OPTIONS)).pack(side=tk.LEFT, padx=5)
+        
+        ttk.Label(workers_frame, text="Valor:").pack(side=tk.LEFT, padx=5)
+        self.calc_sampling_value_entry = ttk.Entry(workers_frame, width=8)
+        self.calc_sampling_value_entry.insert(0, str(MAX_FRAMES))
+        self.calc_sampling_value_entry.pack(side=tk.LEFT, padx=5)
+        
+        # Reutilizar métricas já calculadas em análises anteriores
+        self.calc_use_cache_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(workers_frame, text="Usar cache de métricas",
+                        variable=self.calc_use_cache_var).pack(side=tk.LEFT, padx=(20, 5))
+        
+        # Excluir ensaios com reprodução degradada (telemetria gravada em cada ensaio)
+        telemetry_frame = ttk.Frame(main_frame)
+        telemetry_frame.pack(pady=5)
+        
+        self.calc_filter_playback_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(telemetry_frame, text="Excluir ensaios com reprodução degradada",
+                        variable=self.calc_filter_playback_var).pack(side=tk.LEFT, padx=5)
+        ttk.Label(telemetry_frame, text="FPS mínimo (% do nominal):").pack(side=tk.LEFT, padx=5)
+        self.calc_min_fps_entry = ttk.Entry(telemetry_frame, width=5)
+        self.calc_min_fps_entry.insert(0, "90")
+        self.calc_min_fps_entry.pack(side=tk.LEFT, padx=5)
+        
         # Botões de ação
         action_frame = ttk.Frame(main_frame)
         action_frame.pack(pady=30)
@@ -647,11 +982,29 @@ class VideoQualityTestApp:
         )
         self.process_button.pack(side=tk.LEFT, padx=10)
         
-        ttk.Button(
+        self.cancel_button = ttk.Button(
+            action_frame,
+            text="Cancelar",
+            command=self.cancel_calculation,
+            state=tk.DISABLED
+        )
+        self.cancel_button.pack(side=tk.LEFT, padx=10)
+        
+        self.calc_back_button = ttk.Button(
             action_frame,
             text="Voltar ao Menu",
             command=self.create_welcome_screen
-        ).pack(side=tk.LEFT, padx=10)
+        )
+        self.calc_back_button.pack(side=tk.LEFT, padx=10)
+        
+        # Progresso da análise (executada em segundo plano)
+        progress_frame = ttk.Frame(main_frame)
+        progress_frame.pack(fill=tk.X, padx=20)
+        
+        self.calc_progress_bar = ttk.Progressbar(progress_frame, mode='determinate', maximum=100)
+        self.calc_progress_bar.pack(fill=tk.X)
+        self.calc_progress_label = ttk.Label(progress_frame, text="", foreground="gray")
+        self.calc_progress_label.pack(pady=5)
     
     def add_csv_file(self):
         """Adiciona um CSV à lista"""
@@ -660,23 +1013,71 @@ class VideoQualityTestApp:
             filetypes=[("CSV files", "*.csv"), ("All files", "*.*")]
         )
         
-        for csv_path in csv_paths:
-            if csv_path not in self.calc_csv_paths:
-                # Verificar se o CSV é válido
-                try:
-                    df = pd.read_csv(csv_path)
-                    if 'distorted_filename' not in df.columns or 'rating_0_10' not in df.columns:
+        with RatingsStore() as store:
+            for csv_path in csv_paths:
+                if ('csv', csv_path) not in self.calc_sources:
+                    # Importar para a base de dados (verifica se o CSV é válido)
+                    try:
+                        store.import_csv(csv_path)
+                    except ValueError:
                         messagebox.showwarning("Aviso", 
                                               f"CSV inválido: {os.path.basename(csv_path)}\n"
                                               "Deve conter colunas 'distorted_filename' e 'rating_0_10'")
                         continue
-                    self.calc_csv_paths.append(csv_path)
+                    except Exception as e:
+                        messagebox.showerror("Erro", f"Erro ao ler CSV:\n{str(e)}")
+                        continue
+                    self.calc_sources.append(('csv', csv_path))
                     self.csv_listbox.insert(tk.END, os.path.basename(csv_path))
-                except Exception as e:
-                    messagebox.showerror("Erro", f"Erro ao ler CSV:\n{str(e)}")
         
         self.check_calc_ready()
     
+    def load_saved_tests(self):
+        """Importa em segundo plano os CSVs de tests/ ainda não importados e lista os testes guardados"""
+        self.calc_test_var.set("A carregar testes...")
+        self.saved_tests_queue = queue.Queue()
+        
+        def run():
+            try:
+                with RatingsStore() as store:
+                    imported = store.import_tests_dir()
+                    saved_tests = store.tests()['nome_do_teste'].tolist()
+                if imported:
+                    print(f"✓ {imported} rating(s) importado(s) de tests/ para a base de dados")
+                self.saved_tests_queue.put(('done', saved_tests))
+            except Exception as e:
+                self.saved_tests_queue.put(('error', str(e)))
+        
+        threading.Thread(target=run, daemon=True).start()
+        self.root.after(200, self.poll_saved_tests_queue)
+    
+    def poll_saved_tests_queue(self):
+        """Preenche a lista de testes guardados quando a importação termina (chamado com root.after)"""
+        try:
+            kind, payload = self.saved_tests_queue.get_nowait()
+        except queue.Empty:
+            self.root.after(200, self.poll_saved_tests_queue)
+            return
+        try:
+            if kind == 'done':
+                self.calc_test_combo.config(values=payload)
+                self.calc_test_var.set(payload[0] if payload else "")
+            else:
+                self.calc_test_var.set("")
+                print(f"⚠ Aviso: Falha ao carregar os testes guardados: {payload}")
+        except tk.TclError:
+            pass  # Ecrã fechado entretanto
+    
+    def add_saved_test(self):
+        """Adiciona à lista todos os ratings de um teste guardado na base de dados"""
+        test_name = self.calc_test_var.get()
+        if test_name not in self.calc_test_combo.cget('values'):
+            return  # Lista de testes ainda a carregar
+        if ('test', test_name) not in self.calc_sources:
+            self.calc_sources.append(('test', test_name))
+            self.csv_listbox.insert(tk.END, f"Teste: {test_name}")
+        self.check_calc_ready()
+    
     def on_nome_resultado_change(self, *args):
         """Callback quando o nome do resultado muda"""
         self.check_calc_ready()
@@ -686,10 +1087,65 @@ class VideoQualityTestApp:
         selection = self.csv_listbox.curselection()
         if selection:
             index = selection[0]
-            self.calc_csv_paths.pop(index)
+            self.calc_sources.pop(index)
             self.csv_listbox.delete(index)
             self.check_calc_ready()
     
+    def add_library_folder(self):
+        """Acrescenta uma pasta de vídeos à biblioteca e atualiza o índice"""
+        folder = filedialog.askdirectory(title="Selecionar Pasta de Vídeos")
+        if folder:
+            with MediaLibrary() as library:
+                library.add_root(folder)
+            self.update_media_library()
+    
+    def update_media_library(self):
+        """Atualiza o índice da biblioteca em segundo plano (só as pastas modificadas são relidas)"""
+        if self.library_thread and self.library_thread.is_alive():
+            return
+        
+        with MediaLibrary() as library:
+            stats = library.stats()
+        if not stats['roots']:
+            self.library_status_label.config(
+                text="Sem pastas na biblioteca (os vídeos distorcidos serão selecionados à mão)")
+            return
+        
+        self.library_status_label.config(text=f"A indexar {stats['roots']} pasta(s)...")
+        self.library_queue = queue.Queue()
+        
+        def run():
+            try:
+                with MediaLibrary() as library:
+                    library.update(progress=lambda done, total: self.library_queue.put(('progress', (done, total))))
+                    self.library_queue.put(('done', library.stats()))
+            except Exception as e:
+                self.library_queue.put(('error', str(e)))
+        
+        self.library_thread = threading.Thread(target=run, daemon=True)
+        self.library_thread.start()
+        self.root.after(200, self.poll_library_queue)
+    
+    def poll_library_queue(self):
+        """Mostra o progresso da indexação da biblioteca (chamado periodicamente com root.after)"""
+        try:
+            while True:
+                kind, payload = self.library_queue.get_nowait()
+                if kind == 'progress':
+                    self.library_status_label.config(text=f"A indexar vídeos... {payload[0]}/{payload[1]}")
+                elif kind == 'done':
+                    self.library_status_label.config(
+                        text=f"✓ {payload['videos']} vídeo(s) em {payload['roots']} pasta(s)")
+                    return
+                else:
+                    self.library_status_label.config(text=f"⚠ Erro ao indexar a biblioteca: {payload}")
+                    return
+        except queue.Empty:
+            pass
+        except tk.TclError:
+            return  # Ecrã fechado entretanto
+        self.root.after(200, self.poll_library_queue)
+    
     def select_reference_for_calc(self):
         """Seleciona vídeo de referência para cálculo"""
         ref_path = filedialog.askopenfilename(
@@ -704,153 +1160,230 @@ class VideoQualityTestApp:
             self.calc_ref_path_label.config(text=f"Referência: {filename}", foreground="black")
             self.check_calc_ready()
     
+    def get_sampling_policy(self):
+        """Constrói a SamplingPolicy a partir das opções do ecrã de resultados"""
+        mode = SAMPLING_OPTIONS[self.calc_sampling_var.get()]
+        value = self.calc_sampling_value_entry.get().strip()
+        
+        if mode == 'full':
+            return SamplingPolicy('full')
+        if mode == 'time_budget':
+            return SamplingPolicy('time_budget', budget_seconds=float(value))
+        if mode == 'every_k':
+            return SamplingPolicy('every_k', frames=None, step=int(value))
+        if mode == 'keyframes':
+            return SamplingPolicy('keyframes', frames=int(value) if value else None)
+        return SamplingPolicy(mode, frames=int(value))
+    
     def check_calc_ready(self):
         """Verifica se está tudo pronto para processar"""
         nome_resultado = self.calc_nome_resultado_entry.get().strip()
-        if self.calc_csv_paths and self.calc_ref_path and nome_resultado:
+        if self.calc_sources and self.calc_ref_path and nome_resultado:
             self.process_button.config(state=tk.NORMAL)
         else:
             self.process_button.config(state=tk.DISABLED)
     
     def process_calculation(self):
-        """Processa o cálculo de resultados combinando múltiplos CSVs"""
+        """Processa o cálculo de resultados combinando vários testes/CSVs
+        
+        Os ratings são lidos da base de dados de ratings (apenas as sessões
+        selecionadas).
+        A análise corre numa thread em segundo plano; o progresso chega pela
+        fila self.calc_queue, lida periodicamente com root.after.
+        """
         nome_resultado = self.calc_nome_resultado_entry.get().strip()
         if not nome_resultado:
             messagebox.showerror("Erro", "Por favor, introduza o nome do resultado")
             return
         
-        if not self.calc_csv_paths or not self.calc_ref_path:
-            messagebox.showerror("Erro", "Por favor, adicione pelo menos um CSV e selecione o vídeo de referência")
+        if not self.calc_sources or not self.calc_ref_path:
+            messagebox.showerror("Erro", "Por favor, adicione pelo menos um teste ou CSV e selecione o vídeo de referência")
             return
         
-        # Desabilitar botão durante processamento
-        self.process_button.config(state=tk.DISABLED, text="Processando...")
-        self.root.update()
+        try:
+            sampling = self.get_sampling_policy()
+        except ValueError:
+            messagebox.showerror("Erro", "Valor de amostragem inválido")
+            return
+        
+        min_fps_ratio = None
+        if self.calc_filter_playback_var.get():
+            try:
+                min_fps_ratio = float(self.calc_min_fps_entry.get()) / 100.0
+            except ValueError:
+                messagebox.showerror("Erro", "FPS mínimo inválido")
+                return
         
         try:
-            # Combinar todos os CSVs
-            all_dfs = []
-            for csv_path in self.calc_csv_paths:
-                df = pd.read_csv(csv_path)
-                all_dfs.append(df)
-            
-            # Combinar DataFrames
-            combined_df = pd.concat(all_dfs, ignore_index=True)
-            
-            # Sempre calcular médias de MOS por vídeo distorcido (agrupar duplicados)
-            # Agrupar por vídeo distorcido e calcular média de ratings
-            mos_df = combined_df.groupby('distorted_filename')['rating_0_10'].agg(['mean', 'count']).reset_index()
-            mos_df.columns = ['distorted_filename', 'rating_0_10', 'num_ratings']
-            
-            # Criar novo DataFrame com médias
-            # Manter apenas uma linha por vídeo distorcido com a média
-            result_rows = []
-            for _, row in mos_df.iterrows():
-                # Pegar primeira ocorrência para outros campos
-                first_occurrence = combined_df[combined_df['distorted_filename'] == row['distorted_filename']].iloc[0]
-                result_rows.append({
-                    'nome_do_teste': first_occurrence.get('nome_do_teste', 'Análise Combinada' if len(self.calc_csv_paths) > 1 else 'Análise'),
-                    'reference_filename': first_occurrence.get('reference_filename', os.path.basename(self.calc_ref_path)),
-                    'distorted_filename': row['distorted_filename'],
-                    'trial_index': first_occurrence.get('trial_index', 0),
-                    'rating_0_10': row['rating_0_10'],  # Média
-                    'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                })
-            
-            # Criar CSV temporário combinado
-            timestamp_str = datetime.now().strftime("%Y%m%d_%H%M%S")
-            temp_csv = os.path.join('.', f"combined_results_{timestamp_str}.csv")
-            combined_result_df = pd.DataFrame(result_rows)
-            combined_result_df.to_csv(temp_csv, index=False)
-            
-            csv_to_use = temp_csv
-            
-            # Obter nomes únicos dos vídeos distorcidos (já são únicos após agrupamento)
-            distorted_filenames = mos_df['distorted_filename'].tolist()
-            
-            # Pedir ao usuário para selecionar vídeos distorcidos
+            # Ratings das sessões selecionadas (MOS = média dos ratings de cada vídeo distorcido)
+            with RatingsStore() as store:
+                ratings_df = store.query(
+                    test_names=[value for kind, value in self.calc_sources if kind == 'test'],
+                    sources=[value for kind, value in self.calc_sources if kind == 'csv'])
+        except Exception as e:
+            messagebox.showerror("Erro", f"Erro ao ler os ratings:\n{str(e)}")
+            return
+        
+        if ratings_df.empty:
+            messagebox.showerror("Erro", "Nenhum rating encontrado nos testes selecionados")
+            return
+        
+        combined_result_df = aggregate_rating_rows(
+            ratings_df, self.calc_ref_path, min_fps_ratio,
+            'Análise Combinada' if len(self.calc_sources) > 1 else 'Análise')
+        
+        excluded_trials = combined_result_df.attrs.get('excluded_trials', 0)
+        if combined_result_df.empty:
+            messagebox.showerror("Erro", "Nenhum ensaio cumpre o FPS mínimo de reprodução")
+            return
+        
+        # Obter nomes únicos dos vídeos distorcidos (já são únicos após agrupamento)
+        distorted_filenames = combined_result_df['distorted_filename'].tolist()
+        excluded_note = (f"⚠ {excluded_trials} ensaio(s) excluído(s) por reprodução degradada.\n\n"
+                         if excluded_trials else "")
+        
+        # Encontrar os vídeos distorcidos no índice da biblioteca (preferindo a pasta da referência)
+        with MediaLibrary() as library:
+            resolved = library.resolve(distorted_filenames, near=os.path.dirname(self.calc_ref_path))
+        missing = [name for name in distorted_filenames if name not in resolved]
+        dist_paths = list(resolved.values())
+        
+        if missing:
+            # Pedir ao usuário para selecionar os vídeos distorcidos que não estão na biblioteca
             messagebox.showinfo("Selecionar Vídeos", 
+                               excluded_note +
+                               (f"✓ {len(resolved)} vídeo(s) encontrado(s) na biblioteca.\n\n" if resolved else "") +
                                f"Por favor, selecione os vídeos distorcidos.\n\n"
-                               f"Vídeos esperados ({len(distorted_filenames)}):\n" + 
-                               "\n".join(distorted_filenames[:10]) + 
-                               ("\n..." if len(distorted_filenames) > 10 else ""))
+                               f"Vídeos esperados ({len(missing)}):\n" + 
+                               "\n".join(missing[:10]) + 
+                               ("\n..." if len(missing) > 10 else ""))
             
-            dist_paths = filedialog.askopenfilenames(
+            selected_paths = filedialog.askopenfilenames(
                 title="Selecionar Vídeos Distorcidos",
                 filetypes=[("Vídeo files", "*.mp4 *.avi *.mov *.mkv *.flv *.wmv"), 
                           ("All files", "*.*")]
             )
             
-            if not dist_paths:
-                self.process_button.config(state=tk.NORMAL, text="Gerar Análise")
+            if not selected_paths:
                 return
-            
-            # Criar pasta 'results' se não existir
-            results_base_dir = os.path.join('.', 'results')
-            os.makedirs(results_base_dir, exist_ok=True)
-            
-            # Criar pasta com o nome do resultado (sanitizar nome)
-            safe_nome_resultado = "".join(c for c in nome_resultado if c.isalnum() or c in (' ', '-', '_')).strip()
-            safe_nome_resultado = safe_nome_resultado.replace(' ', '_')
-            
-            # Criar diretório para o resultado dentro de results
-            results_dir = os.path.join(results_base_dir, safe_nome_resultado)
-            os.makedirs(results_dir, exist_ok=True)
-            
-            # Guardar temporariamente os dados necessários para generate_analysis
-            original_ref = self.reference_video_path
-            original_dist = self.distorted_videos
-            original_nome = self.nome_do_teste
-            
-            self.reference_video_path = self.calc_ref_path
-            self.distorted_videos = list(dist_paths)
-            self.nome_do_teste = nome_resultado
-            
-            # Obter timestamp
-            timestamp_str = datetime.now().strftime("%Y%m%d_%H%M%S")
-            
-            # Gerar análise usando o CSV combinado
-            pdf_file = self.generate_analysis(csv_to_use, timestamp_str, results_dir)
-            
-            # Limpar CSV temporário
-            if os.path.exists(temp_csv):
-                try:
-                    os.remove(temp_csv)
-                except:
-                    pass
-            
-            if pdf_file:
-                messagebox.showinfo("Sucesso", 
-                                   f"✓ Análise gerada com sucesso!\n\n"
-                                   f"✓ Ficheiros guardados em:\n{os.path.abspath(results_dir)}\n\n"
-                                   f"✓ {len(self.calc_csv_paths)} CSV(s) processado(s)\n"
-                                   f"✓ PDF de dados gerado\n"
-                                   f"✓ Análise com Gemini gerada (MD e PDF)")
-            else:
-                messagebox.showinfo("Sucesso", 
-                                   f"✓ Análise gerada!\n\n"
-                                   f"✓ Ficheiros guardados em:\n{os.path.abspath(results_dir)}\n\n"
-                                   f"✓ {len(self.calc_csv_paths)} CSV(s) processado(s)\n"
-                                   f"✓ Análise Markdown gerada\n"
-                                   f"⚠ PDF não foi gerado (verifique dependências)")
-            
-            # Restaurar valores originais
-            self.reference_video_path = original_ref
-            self.distorted_videos = original_dist
-            self.nome_do_teste = original_nome
-            
+            dist_paths += list(selected_paths)
+        elif excluded_note:
+            messagebox.showinfo("Aviso", excluded_note.strip())
+        
+        # Criar pasta 'results' se não existir
+        results_base_dir = os.path.join('.', 'results')
+        os.makedirs(results_base_dir, exist_ok=True)
+        
+        # Criar pasta com o nome do resultado (sanitizar nome)
+        safe_nome_resultado = safe_dirname(nome_resultado)
+        
+        # Criar diretório para o resultado dentro de results
+        results_dir = os.path.join(results_base_dir, safe_nome_resultado)
+        os.makedirs(results_dir, exist_ok=True)
+        
+        try:
+            workers = max(1, int(self.calc_workers_var.get()))
+        except (tk.TclError, ValueError):
+            workers = 1
+        
+        # Desabilitar botões durante processamento
+        self.process_button.config(state=tk.DISABLED, text="Processando...")
+        self.cancel_button.config(state=tk.NORMAL, text="Cancelar")
+        self.calc_back_button.config(state=tk.DISABLED)
+        self.calc_progress_bar['value'] = 0
+        self.calc_progress_label.config(text="A iniciar análise...")
+        
+        self.calc_results_dir = results_dir
+        self.calc_control = JobControl()
+        self.calc_queue = queue.Queue()
+        threading.Thread(
+            target=self.run_calculation_job,
+            args=(combined_result_df, results_dir, list(dist_paths), nome_resultado, workers, sampling,
+                  self.calc_use_cache_var.get()),
+            daemon=True
+        ).start()
+        self.root.after(100, self.poll_calculation_queue)
+    
+    def run_calculation_job(self, combined_result_df, results_dir, dist_paths, nome_resultado, workers,
+                            sampling, use_cache):
+        """Executa a análise em segundo plano (sem tocar na interface; comunica por self.calc_queue)"""
+        timestamp_str = datetime.now().strftime("%Y%m%d_%H%M%S")
+        
+        try:
+            # Os ratings agregados seguem em memória para o motor de análise
+            result = generate_analysis(combined_result_df, timestamp_str, results_dir, self.calc_ref_path, dist_paths,
+                                       nome_resultado, workers=workers, sampling=sampling, use_cache=use_cache,
+                                       progress=lambda info: self.calc_queue.put(('progress', info)),
+                                       control=self.calc_control)
+            self.calc_queue.put(('done', result))
+        except MetricsCancelled:
+            self.calc_queue.put(('cancelled', None))
         except Exception as e:
             import traceback
-            error_details = traceback.format_exc()
+            print(f"Erro completo:\n{traceback.format_exc()}")
+            self.calc_queue.put(('error', str(e)))
+    
+    def poll_calculation_queue(self):
+        """Atualiza o progresso com as mensagens da análise em segundo plano"""
+        try:
+            while True:
+                kind, payload = self.calc_queue.get_nowait()
+                if kind == 'progress':
+                    self.calc_progress_label.config(text=payload['message'])
+                    if payload.get('fraction') is not None:
+                        self.calc_progress_bar['value'] = payload['fraction'] * 100
+                else:
+                    self.finish_calculation(kind, payload)
+                    return
+        except queue.Empty:
+            pass
+        self.root.after(100, self.poll_calculation_queue)
+    
+    def cancel_calculation(self):
+        """Pede o cancelamento da análise em curso"""
+        self.calc_control.cancel()
+        self.cancel_button.config(state=tk.DISABLED, text="Cancelando...")
+        self.calc_progress_label.config(text="Cancelando...")
+    
+    def finish_calculation(self, kind, payload):
+        """Repõe o ecrã e mostra o resultado da análise em segundo plano"""
+        self.process_button.config(state=tk.NORMAL, text="Gerar Análise")
+        self.cancel_button.config(state=tk.DISABLED, text="Cancelar")
+        self.calc_back_button.config(state=tk.NORMAL)
+        results_dir = self.calc_results_dir
+        
+        if kind == 'cancelled':
+            self.calc_progress_bar['value'] = 0
+            self.calc_progress_label.config(text="Análise cancelada")
+            messagebox.showinfo("Cancelado", "Análise cancelada.\n\nOs ficheiros parciais foram removidos.")
+            return
+        
+        if kind == 'error':
+            self.calc_progress_label.config(text="Erro ao gerar análise")
             messagebox.showerror("Erro", 
-                                f"Erro ao gerar análise:\n{str(e)}\n\n"
+                                f"Erro ao gerar análise:\n{payload}\n\n"
                                 f"Verifique o console para mais detalhes.")
-            print(f"Erro completo:\n{error_details}")
-        finally:
-            self.process_button.config(state=tk.NORMAL, text="Gerar Análise")
+            return
+        
+        self.calc_progress_bar['value'] = 100
+        self.calc_progress_label.config(text="Análise concluída")
+        if payload.pdf_file:
+            messagebox.showinfo("Sucesso", 
+                               f"✓ Análise gerada com sucesso!\n\n"
+                               f"✓ Ficheiros guardados em:\n{os.path.abspath(results_dir)}\n\n"
+                               f"✓ {len(self.calc_sources)} teste(s)/CSV(s) processado(s)\n"
+                               f"✓ PDF de dados gerado\n"
+                               f"✓ Análise com Gemini gerada (MD e PDF)")
+        else:
+            messagebox.showinfo("Sucesso", 
+                               f"✓ Análise gerada!\n\n"
+                               f"✓ Ficheiros guardados em:\n{os.path.abspath(results_dir)}\n\n"
+                               f"✓ {len(self.calc_sources)} teste(s)/CSV(s) processado(s)\n"
+                               f"✓ Análise Markdown gerada\n"
+                               f"⚠ PDF não foi gerado (verifique dependências)")
     
     def save_results(self):
-        """Guarda os resultados num ficheiro CSV na pasta tests"""
+        """Guarda os resultados num ficheiro CSV na pasta tests e na base de dados de ratings"""
         if not self.results:
             return
         
@@ -858,12 +1391,8 @@ class VideoQualityTestApp:
         tests_dir = os.path.join('.', 'tests')
         os.makedirs(tests_dir, exist_ok=True)
         
-        # Criar pasta com o nome do teste (sanitizar nome para evitar problemas com caminhos)
-        safe_nome_teste = "".join(c for c in self.nome_do_teste if c.isalnum() or c in (' ', '-', '_')).strip()
-        safe_nome_teste = safe_nome_teste.replace(' ', '_')
-        
-        # Criar diretório para o teste dentro de tests
-        test_dir = os.path.join(tests_dir, safe_nome_teste)
+        # Criar diretório para o teste dentro de tests (mesma pasta do diário da sessão)
+        test_dir = os.path.join(tests_dir, safe_dirname(self.nome_do_teste))
         os.makedirs(test_dir, exist_ok=True)
         
         # Nome do ficheiro com timestamp
@@ -873,581 +1402,31 @@ class VideoQualityTestApp:
         # Escrever CSV
         with open(csv_filename, 'w', newline='', encoding='utf-8') as csvfile:
             fieldnames = ['nome_do_teste', 'reference_filename', 'distorted_filename', 
-                         'trial_index', 'rating_0_10', 'timestamp']
+                         'trial_index', 'rating_0_10', 'timestamp'] + list(PlaybackTelemetry.COLUMNS)
             writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
             
             writer.writeheader()
             for result in self.results:
                 writer.writerow(result)
         
+        # Sessão concluída: o diário deixa de ser proposto para retomar
+        if self.journal:
+            self.journal.finish(STATUS_COMPLETED, csv=os.path.abspath(csv_filename))
+            self.journal = None
+        
+        # Acrescentar a sessão à base de dados de ratings (o CSV fica registado como importado)
+        try:
+            with RatingsStore() as store:
+                store.import_csv(csv_filename)
+        except Exception as e:
+            print(f"⚠ Aviso: Falha ao guardar os ratings na base de dados: {e}")
+        
         # Apenas mostrar mensagem de sucesso com o CSV
         messagebox.showinfo("Sucesso", 
                            f"✓ Teste concluído!\n\n"
                            f"✓ CSV guardado em:\n{os.path.abspath(csv_filename)}\n\n"
                            f"Use 'Calcular Resultados' no menu inicial para gerar análises.")
     
-    def calculate_psnr(self, ref_path, dist_path):
-        """Calcula PSNR médio entre dois vídeos"""
-        ref_cap = cv2.VideoCapture(ref_path)
-        dist_cap = cv2.VideoCapture(dist_path)
-        
-        psnr_values = []
-        frame_count = 0
-        
-        while True:
-            ret_ref, frame_ref = ref_cap.read()
-            ret_dist, frame_dist = dist_cap.read()
-            
-            if not ret_ref or not ret_dist:
-                break
-            
-            # Converter para grayscale se necessário
-            if len(frame_ref.shape) == 3:
-                frame_ref = cv2.cvtColor(frame_ref, cv2.COLOR_BGR2GRAY)
-            if len(frame_dist.shape) == 3:
-                frame_dist = cv2.cvtColor(frame_dist, cv2.COLOR_BGR2GRAY)
-            
-            # Calcular MSE
-            mse = np.mean((frame_ref.astype(float) - frame_dist.astype(float)) ** 2)
-            
-            if mse == 0:
-                psnr = 100  # Imagens idênticas
-            else:
-                psnr = 20 * np.log10(255.0 / np.sqrt(mse))
-            
-            psnr_values.append(psnr)
-            frame_count += 1
-            
-            # Limitar a 100 frames para não demorar muito
-            if frame_count >= 100:
-                break
-        
-        ref_cap.release()
-        dist_cap.release()
-        
-        return np.mean(psnr_values) if psnr_values else 0.0
-    
-    def calculate_ssim(self, ref_path, dist_path):
-        """Calcula SSIM médio entre dois vídeos"""
-        ref_cap = cv2.VideoCapture(ref_path)
-        dist_cap = cv2.VideoCapture(dist_path)
-        
-        ssim_values = []
-        frame_count = 0
-        
-        while True:
-            ret_ref, frame_ref = ref_cap.read()
-            ret_dist, frame_dist = dist_cap.read()
-            
-            if not ret_ref or not ret_dist:
-                break
-            
-            # Converter para grayscale
-            if len(frame_ref.shape) == 3:
-                frame_ref = cv2.cvtColor(frame_ref, cv2.COLOR_BGR2GRAY)
-            if len(frame_dist.shape) == 3:
-                frame_dist = cv2.cvtColor(frame_dist, cv2.COLOR_BGR2GRAY)
-            
-            # Redimensionar se necessário (SSIM requer mesmo tamanho)
-            if frame_ref.shape != frame_dist.shape:
-                h, w = min(frame_ref.shape[0], frame_dist.shape[0]), min(frame_ref.shape[1], frame_dist.shape[1])
-                frame_ref = cv2.resize(frame_ref, (w, h))
-                frame_dist = cv2.resize(frame_dist, (w, h))
-            
-            # Calcular SSIM
-            ssim_val = ssim(frame_ref, frame_dist, data_range=255)
-            ssim_values.append(ssim_val)
-            frame_count += 1
-            
-            # Limitar a 100 frames para não demorar muito
-            if frame_count >= 100:
-                break
-        
-        ref_cap.release()
-        dist_cap.release()
-        
-        return np.mean(ssim_values) if ssim_values else 0.0
-    
-    def generate_analysis(self, csv_filename, timestamp_str, results_dir):
-        """Gera análise completa: PSNR, SSIM, correlações e regressões"""
-        # Ler CSV
-        df = pd.read_csv(csv_filename)
-        
-        # Usar o diretório de resultados fornecido
-        base_dir = results_dir
-        base_name = f"analysis_{timestamp_str}"
-        
-        # Calcular métricas objetivas
-        print("Calculando métricas objetivas...")
-        psnr_values = []
-        ssim_values = []
-        mos_values = []
-        distorted_files = []
-        
-        ref_path = self.reference_video_path
-        
-        for idx, row in df.iterrows():
-            dist_filename = row['distorted_filename']
-            # Encontrar caminho completo do vídeo distorcido
-            dist_path = None
-            for video_path in self.distorted_videos:
-                # Comparar tanto pelo nome do ficheiro quanto pelo caminho completo
-                if os.path.basename(video_path) == dist_filename or video_path == dist_filename:
-                    dist_path = video_path
-                    break
-            
-            if dist_path and os.path.exists(dist_path):
-                print(f"Processando {dist_filename}...")
-                psnr = self.calculate_psnr(ref_path, dist_path)
-                ssim_val = self.calculate_ssim(ref_path, dist_path)
-                
-                psnr_values.append(psnr)
-                ssim_values.append(ssim_val)
-                mos_values.append(row['rating_0_10'])
-                distorted_files.append(dist_filename)
-            else:
-                print(f"⚠ Aviso: Vídeo distorcido não encontrado: {dist_filename}")
-        
-        # Criar DataFrame com métricas
-        metrics_df = pd.DataFrame({
-            'distorted_filename': distorted_files,
-            'MOS': mos_values,
-            'PSNR': psnr_values,
-            'SSIM': ssim_values
-        })
-        
-        # Calcular correlações (com tratamento de arrays constantes)
-        import warnings
-        with warnings.catch_warnings():
-            warnings.filterwarnings('ignore', category=stats.ConstantInputWarning)
-            
-            # Verificar se arrays têm variância antes de calcular correlação
-            def safe_correlation(x, y, corr_func):
-                if len(x) < 2 or np.std(x) == 0 or np.std(y) == 0:
-                    return 0.0
-                try:
-                    return corr_func(x, y)[0]
-                except (ValueError, TypeError):
-                    return 0.0
-            
-            pearson_psnr = safe_correlation(mos_values, psnr_values, stats.pearsonr)
-            pearson_ssim = safe_correlation(mos_values, ssim_values, stats.pearsonr)
-            spearman_psnr = safe_correlation(mos_values, psnr_values, stats.spearmanr)
-            spearman_ssim = safe_correlation(mos_values, ssim_values, stats.spearmanr)
-        
-        # Regressão linear PSNR -> MOS
-        try:
-            slope_psnr, intercept_psnr, r_psnr, p_psnr, _ = stats.linregress(psnr_values, mos_values)
-        except ValueError:
-            slope_psnr, intercept_psnr, r_psnr, p_psnr = 0.0, 0.0, 0.0, 1.0
-        
-        # Regressão linear SSIM -> MOS
-        try:
-            slope_ssim, intercept_ssim, r_ssim, p_ssim, _ = stats.linregress(ssim_values, mos_values)
-        except ValueError:
-            slope_ssim, intercept_ssim, r_ssim, p_ssim = 0.0, 0.0, 0.0, 1.0
-        
-        # Regressão polinomial (grau 2) PSNR -> MOS
-        try:
-            poly_psnr = np.polyfit(psnr_values, mos_values, 2)
-            poly_psnr_func = np.poly1d(poly_psnr)
-        except (np.linalg.LinAlgError, ValueError):
-            # Se falhar, usar regressão linear como fallback
-            poly_psnr = [0.0, slope_psnr, intercept_psnr]
-            poly_psnr_func = np.poly1d(poly_psnr)
-        
-        # Regressão polinomial (grau 2) SSIM -> MOS
-        try:
-            poly_ssim = np.polyfit(ssim_values, mos_values, 2)
-            poly_ssim_func = np.poly1d(poly_ssim)
-        except (np.linalg.LinAlgError, ValueError):
-            # Se falhar, usar regressão linear como fallback
-            poly_ssim = [0.0, slope_ssim, intercept_ssim]
-            poly_ssim_func = np.poly1d(poly_ssim)
-        
-        # Gerar gráficos (dentro da pasta do teste)
-        fig_dir = os.path.join(base_dir, "figures")
-        os.makedirs(fig_dir, exist_ok=True)
-        
-        # Gráfico 1: Scatter PSNR vs MOS com regressão
-        plt.figure(figsize=(10, 6))
-        plt.scatter(psnr_values, mos_values, alpha=0.6, s=100)
-        psnr_sorted = np.sort(psnr_values)
-        plt.plot(psnr_sorted, slope_psnr * psnr_sorted + intercept_psnr, 
-                'r--', label=f'Linear (R²={r_psnr**2:.3f})', linewidth=2)
-        plt.plot(psnr_sorted, poly_psnr_func(psnr_sorted), 
-                'g--', label='Polinomial (grau 2)', linewidth=2)
-        plt.xlabel('PSNR (dB)', fontsize=12)
-        plt.ylabel('MOS (Mean Opinion Score)', fontsize=12)
-        plt.title(f'PSNR vs MOS - Correlação Pearson: {pearson_psnr:.3f}', fontsize=14)
-        plt.legend()
-        plt.grid(True, alpha=0.3)
-        plt.tight_layout()
-        plt.savefig(os.path.join(fig_dir, 'psnr_vs_mos.png'), dpi=300, bbox_inches='tight')
-        plt.close()
-        
-        # Gráfico 2: Scatter SSIM vs MOS com regressão
-        plt.figure(figsize=(10, 6))
-        plt.scatter(ssim_values, mos_values, alpha=0.6, s=100)
-        ssim_sorted = np.sort(ssim_values)
-        plt.plot(ssim_sorted, slope_ssim * ssim_sorted + intercept_ssim, 
-                'r--', label=f'Linear (R²={r_ssim**2:.3f})', linewidth=2)
-        plt.plot(ssim_sorted, poly_ssim_func(ssim_sorted), 
-                'g--', label='Polinomial (grau 2)', linewidth=2)
-        plt.xlabel('SSIM', fontsize=12)
-        plt.ylabel('MOS (Mean Opinion Score)', fontsize=12)
-        plt.title(f'SSIM vs MOS - Correlação Pearson: {pearson_ssim:.3f}', fontsize=14)
-        plt.legend()
-        plt.grid(True, alpha=0.3)
-        plt.tight_layout()
-        plt.savefig(os.path.join(fig_dir, 'ssim_vs_mos.png'), dpi=300, bbox_inches='tight')
-        plt.close()
-        
-        # Gráfico 3: Comparação de métricas
-        plt.figure(figsize=(12, 6))
-        x = np.arange(len(distorted_files))
-        width = 0.35
-        
-        # Normalizar PSNR e SSIM para escala 0-10
-        psnr_norm = (np.array(psnr_values) - np.min(psnr_values)) / (np.max(psnr_values) - np.min(psnr_values)) * 10
-        ssim_norm = np.array(ssim_values) * 10
-        
-        plt.bar(x - width/2, mos_values, width, label='MOS (Subjetivo)', alpha=0.8)
-        plt.bar(x + width/2, psnr_norm, width, label='PSNR (Normalizado)', alpha=0.8)
-        plt.xlabel('Vídeo Distorcido', fontsize=12)
-        plt.ylabel('Score (0-10)', fontsize=12)
-        plt.title('Comparação: MOS vs PSNR Normalizado', fontsize=14)
-        plt.xticks(x, [f"V{i+1}" for i in range(len(distorted_files))], rotation=45)
-        plt.legend()
-        plt.grid(True, alpha=0.3, axis='y')
-        plt.tight_layout()
-        plt.savefig(os.path.join(fig_dir, 'mos_vs_psnr_comparison.png'), dpi=300, bbox_inches='tight')
-        plt.close()
-        
-        # Gerar documento Markdown
-        md_filename = os.path.join(base_dir, f"{base_name}_analysis.md")
-        
-        with open(md_filename, 'w', encoding='utf-8') as f:
-            f.write(f"# Análise de Qualidade de Vídeo\n\n")
-            f.write(f"**Nome do Teste:** {self.nome_do_teste}\n\n")
-            f.write(f"**Data:** {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
-            f.write("---\n\n")
-            
-            # Tabela de métricas
-            f.write("## Métricas Objetivas e Subjetivas\n\n")
-            f.write("| Vídeo | MOS | PSNR (dB) | SSIM |\n")
-            f.write("|-------|-----|-----------|------|\n")
-            for i, row in metrics_df.iterrows():
-                f.write(f"| {row['distorted_filename']} | {row['MOS']:.1f} | {row['PSNR']:.2f} | {row['SSIM']:.3f} |\n")
-            f.write("\n")
-            
-            # Correlações
-            f.write("## Correlações\n\n")
-            f.write("| Métrica | Pearson | Spearman |\n")
-            f.write("|---------|---------|----------|\n")
-            f.write(f"| PSNR | {pearson_psnr:.3f} | {spearman_psnr:.3f} |\n")
-            f.write(f"| SSIM | {pearson_ssim:.3f} | {spearman_ssim:.3f} |\n")
-            f.write("\n")
-            
-            # Regressões
-            f.write("## Modelos de Regressão\n\n")
-            f.write("### PSNR → MOS\n\n")
-            f.write(f"- **Linear:** MOS = {slope_psnr:.3f} × PSNR + {intercept_psnr:.3f}\n")
-            f.write(f"- **R² Linear:** {r_psnr**2:.3f}\n")
-            f.write(f"- **Polinomial (grau 2):** MOS = {poly_psnr[0]:.3f} × PSNR² + {poly_psnr[1]:.3f} × PSNR + {poly_psnr[2]:.3f}\n")
-            f.write("\n")
-            
-            f.write("### SSIM → MOS\n\n")
-            f.write(f"- **Linear:** MOS = {slope_ssim:.3f} × SSIM + {intercept_ssim:.3f}\n")
-            f.write(f"- **R² Linear:** {r_ssim**2:.3f}\n")
-            f.write(f"- **Polinomial (grau 2):** MOS = {poly_ssim[0]:.3f} × SSIM² + {poly_ssim[1]:.3f} × SSIM + {poly_ssim[2]:.3f}\n")
-            f.write("\n")
-            
-            # Gráficos (usar caminhos relativos - tudo na mesma pasta)
-            f.write("## Gráficos\n\n")
-            f.write(f"![PSNR vs MOS](figures/psnr_vs_mos.png)\n\n")
-            f.write(f"![SSIM vs MOS](figures/ssim_vs_mos.png)\n\n")
-            f.write(f"![Comparação MOS vs PSNR](figures/mos_vs_psnr_comparison.png)\n\n")
-        
-        # Converter MD para PDF e renomear para 'dados_...'
-        pdf_file = self.md_to_pdf(md_filename, fig_dir)
-        
-        if pdf_file:
-            # Renomear PDF para 'dados_...'
-            dados_pdf = os.path.join(base_dir, f"dados_{timestamp_str}.pdf")
-            if os.path.exists(pdf_file):
-                os.rename(pdf_file, dados_pdf)
-                pdf_file = dados_pdf
-            
-            # Gerar análise com Gemini
-            try:
-                self.generate_gemini_analysis(dados_pdf, md_filename, timestamp_str, base_dir, fig_dir)
-            except Exception as e:
-                print(f"⚠ Erro ao gerar análise com Gemini: {e}")
-                print("Os dados foram gerados com sucesso, mas a análise automática falhou.")
-        
-        return pdf_file
-    
-    def generate_gemini_analysis(self, dados_pdf, md_filename, timestamp_str, base_dir, fig_dir):
-        """Gera análise com Gemini AI baseada nos dados"""
-        # Carregar variáveis de ambiente
-        load_dotenv()
-        gemini_key = os.getenv('GEMINI_API_KEY')
-        
-        if not gemini_key:
-            print("⚠ GEMINI_API_KEY não encontrada no .env")
-            return None
-        
-        try:
-            # Configurar Gemini
-            genai.configure(api_key=gemini_key)
-            model = genai.GenerativeModel('gemini-2.5-flash')
-            
-            print("Enviando dados ao Gemini para análise...")
-            
-            # Ler conteúdo do Markdown para contexto
-            with open(md_filename, 'r', encoding='utf-8') as f:
-                md_content = f.read()
-            
-            # Preparar prompt com dados do Markdown
-            prompt = f"""
-Analisa os seguintes dados de um teste subjetivo de qualidade de vídeo e fornece uma análise detalhada com conclusões.
-
-Dados do teste:
-{md_content}
-
-Por favor, fornece:
-1. Uma análise geral dos resultados
-2. Interpretação das correlações entre métricas objetivas (PSNR, SSIM) e subjetivas (MOS)
-3. Avaliação da qualidade dos modelos de regressão
-4. Conclusões sobre que métricas objetivas melhor prevêem a qualidade percebida
-
-Formata a resposta em Markdown com títulos, parágrafos e listas quando apropriado.
-"""
-            
-            # Enviar prompt ao Gemini (usando apenas texto)
-            response = model.generate_content(prompt)
-            
-            # Obter texto da resposta
-            analysis_text = response.text
-            
-            # Gerar ficheiro Markdown com análise
-            analysis_md = os.path.join(base_dir, f"analise_{timestamp_str}.md")
-            with open(analysis_md, 'w', encoding='utf-8') as f:
-                f.write(f"# Análise de Qualidade de Vídeo - Conclusões\n\n")
-                f.write(f"**Nome do Teste:** {self.nome_do_teste}\n\n")
-                f.write(f"**Data:** {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
-                f.write("---\n\n")
-                f.write(analysis_text)
-            
-            print(f"✓ Análise gerada: {analysis_md}")
-            
-            # Converter para PDF
-            analysis_pdf = self.md_to_pdf(analysis_md, fig_dir)
-            if analysis_pdf:
-                # Renomear para analise_...
-                final_analysis_pdf = os.path.join(base_dir, f"analise_{timestamp_str}.pdf")
-                if os.path.exists(analysis_pdf):
-                    os.rename(analysis_pdf, final_analysis_pdf)
-                print(f"✓ PDF de análise gerado: {final_analysis_pdf}")
-            
-        except Exception as e:
-            print(f"Erro ao gerar análise com Gemini: {e}")
-            import traceback
-            traceback.print_exc()
-            raise
-    
-    def md_to_pdf(self, md_file, fig_dir):
-        """Converte Markdown para PDF usando reportlab"""
-        pdf_file = md_file.replace('.md', '.pdf')
-        
-        try:
-            from reportlab.lib.pagesizes import A4
-            from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-            from reportlab.lib.units import cm
-            from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image, PageBreak
-            from reportlab.lib import colors
-            from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_JUSTIFY
-            import re
-            
-            # Ler conteúdo do Markdown
-            with open(md_file, 'r', encoding='utf-8') as f:
-                md_content = f.read()
-            
-            # Criar documento PDF
-            doc = SimpleDocTemplate(
-                pdf_file,
-                pagesize=A4,
-                rightMargin=2*cm,
-                leftMargin=2*cm,
-                topMargin=2.5*cm,
-                bottomMargin=2.5*cm
-            )
-            
-            # Estilos
-            styles = getSampleStyleSheet()
-            title_style = ParagraphStyle(
-                'CustomTitle',
-                parent=styles['Heading1'],
-                fontSize=24,
-                textColor=colors.HexColor('#2c3e50'),
-                spaceAfter=20,
-                alignment=TA_LEFT
-            )
-            heading2_style = ParagraphStyle(
-                'CustomHeading2',
-                parent=styles['Heading2'],
-                fontSize=18,
-                textColor=colors.HexColor('#34495e'),
-                spaceAfter=15,
-                spaceBefore=25
-            )
-            heading3_style = ParagraphStyle(
-                'CustomHeading3',
-                parent=styles['Heading3'],
-                fontSize=14,
-                textColor=colors.HexColor('#555'),
-                spaceAfter=10,
-                spaceBefore=20
-            )
-            normal_style = ParagraphStyle(
-                'CustomNormal',
-                parent=styles['Normal'],
-                fontSize=11,
-                leading=16,
-                alignment=TA_JUSTIFY
-            )
-            
-            # Elementos do PDF
-            story = []
-            
-            # Parsear Markdown linha por linha
-            lines = md_content.split('\n')
-            i = 0
-            current_table_rows = []
-            in_table = False
-            
-            while i < len(lines):
-                line = lines[i].strip()
-                
-                # Título H1
-                if line.startswith('# ') and not line.startswith('##'):
-                    text = line[2:].strip()
-                    story.append(Paragraph(text, title_style))
-                    story.append(Spacer(1, 12))
-                
-                # Título H2
-                elif line.startswith('## ') and not line.startswith('###'):
-                    text = line[3:].strip()
-                    story.append(Spacer(1, 12))
-                    story.append(Paragraph(text, heading2_style))
-                    story.append(Spacer(1, 12))
-                
-                # Título H3
-                elif line.startswith('### '):
-                    text = line[4:].strip()
-                    story.append(Spacer(1, 10))
-                    story.append(Paragraph(text, heading3_style))
-                    story.append(Spacer(1, 10))
-                
-                # Tabela
-                elif line.startswith('|'):
-                    if not in_table:
-                        in_table = True
-                        current_table_rows = []
-                    # Parsear linha da tabela
-                    cells = [cell.strip() for cell in line.split('|')[1:-1]]
-                    current_table_rows.append(cells)
-                
-                # Linha separadora de tabela
-                elif line.startswith('|---') and in_table:
-                    i += 1
-                    continue
-                
-                # Fim da tabela ou processar tabela
-                elif in_table and line == '':
-                    if current_table_rows:
-                        # Criar tabela
-                        table_data = current_table_rows
-                        table = Table(table_data)
-                        table.setStyle(TableStyle([
-                            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#3498db')),
-                            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                            ('FONTSIZE', (0, 0), (-1, 0), 10),
-                            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-                            ('GRID', (0, 0), (-1, -1), 1, colors.grey),
-                            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f9f9f9')]),
-                            ('FONTSIZE', (0, 1), (-1, -1), 9),
-                            ('TOPPADDING', (0, 1), (-1, -1), 8),
-                            ('BOTTOMPADDING', (0, 1), (-1, -1), 8),
-                        ]))
-                        story.append(table)
-                        story.append(Spacer(1, 12))
-                        current_table_rows = []
-                        in_table = False
-                
-                # Imagem
-                elif '![' in line and '](' in line:
-                    # Extrair caminho da imagem
-                    match = re.search(r'!\[.*?\]\((.*?)\)', line)
-                    if match:
-                        img_path = match.group(1)
-                        # Se for caminho relativo, tornar absoluto
-                        if not os.path.isabs(img_path):
-                            img_path = os.path.join(os.path.dirname(md_file), img_path)
-                        
-                        if os.path.exists(img_path):
-                            try:
-                                img = Image(img_path, width=16*cm, height=12*cm, kind='proportional')
-                                story.append(Spacer(1, 12))
-                                story.append(img)
-                                story.append(Spacer(1, 12))
-                            except:
-                                story.append(Paragraph(f"[Imagem: {os.path.basename(img_path)}]", normal_style))
-                
-                # Lista
-                elif line.startswith('- ') or line.startswith('* '):
-                    text = line[2:].strip()
-                    # Remover formatação markdown básica
-                    text = re.sub(r'\*\*(.*?)\*\*', r'<b>\1</b>', text)
-                    story.append(Paragraph(f"• {text}", normal_style))
-                
-                # Parágrafo normal
-                elif line and not line.startswith('---'):
-                    # Remover formatação markdown básica
-                    text = line
-                    text = re.sub(r'\*\*(.*?)\*\*', r'<b>\1</b>', text)
-                    text = re.sub(r'\*(.*?)\*', r'<i>\1</i>', text)
-                    text = re.sub(r'`(.*?)`', r'<font name="Courier">\1</font>', text)
-                    story.append(Paragraph(text, normal_style))
-                    story.append(Spacer(1, 6))
-                
-                # Separador
-                elif line.startswith('---'):
-                    story.append(Spacer(1, 20))
-                
-                i += 1
-            
-            # Construir PDF
-            doc.build(story)
-            print(f"✓ PDF gerado com sucesso usando reportlab: {pdf_file}")
-            return pdf_file
-            
-        except ImportError:
-            print("\n⚠ reportlab não está instalado.")
-            print("Instale com: pip install reportlab")
-            print(f"\nO ficheiro Markdown foi gerado: {os.path.abspath(md_file)}")
-            return None
-        except Exception as e:
-            print(f"\n⚠ Erro ao gerar PDF: {str(e)}")
-            print(f"O ficheiro Markdown foi gerado: {os.path.abspath(md_file)}")
-            import traceback
-            traceback.print_exc()
-            return None
-    
     def show_completion_screen(self):
         """Mostra ecrã de conclusão do teste"""
         # Limpar widgets existentes
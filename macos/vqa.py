@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Linha de comandos (sem interface gráfica) para gerar análises a partir de um manifesto
+
+    python -m vqa analyze manifest.json
+
+O manifesto (JSON) descreve uma ou mais análises; os caminhos relativos são
+resolvidos a partir da pasta do manifesto e aceitam padrões glob:
+
+    {
+        "workers": 8,
+        "sampling": {"mode": "uniform", "frames": 100},
+        "analyses": [
+            {
+                "name": "ladder_a",
+                "reference": "videos/ref.mp4",
+                "distorted": ["videos/ladder_a/*.mp4"],
+                "ratings": ["tests/ladder_a/results_*.csv"]
+            }
+        ]
+    }
+
+Em vez de (ou além de) "ratings", a chave "tests" indica nomes de testes
+guardados na base de dados de ratings (ratings_db, por omissão
+tests/ratings.sqlite), cujas sessões são todas incluídas. Os vídeos com
+rating que não estejam em "distorted" (opcional) são procurados pelo nome no
+índice da biblioteca de vídeos (media_library, por omissão
+results/media_library.sqlite; ver media_library.py), atualizado antes. A
+cache de métricas (metrics_cache) fica por omissão em
+<results_dir>/metrics_cache.sqlite.
+
+As opções globais (results_dir, ratings_db, media_library, metrics_cache,
+workers, max_concurrent, sampling, use_cache, gemini, min_fps_ratio,
+incremental) podem ser redefinidas em cada análise; min_fps_ratio (ex.: 0.9)
+exclui os ensaios cuja reprodução ficou abaixo dessa fração do FPS nominal;
+com incremental (por omissão) só são refeitas as etapas cujas entradas
+mudaram desde a última execução. Sem a chave "analyses" o próprio manifesto
+é tratado como uma única análise. Este módulo nunca importa o tkinter.
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import traceback
+from datetime import datetime
+
+import pandas as pd
+
+from analysis_engine import aggregate_rating_rows, distorted_path_index, generate_analysis, safe_dirname
+from media_library import MediaLibrary
+from quality_metrics import SamplingPolicy
+from ratings_store import RatingsStore
+
+
+# Opções de cada análise e os seus valores por omissão
+DEFAULT_OPTIONS = {
+    'results_dir': 'results',
+    'ratings_db': os.path.join('tests', 'ratings.sqlite'),
+    'media_library': os.path.join('results', 'media_library.sqlite'),
+    'metrics_cache': None,  # por omissão, <results_dir>/metrics_cache.sqlite
+    'workers': os.cpu_count() or 1,
+    'max_concurrent': None,
+    'sampling': None,
+    'use_cache': True,
+    'gemini': False,
+    'min_fps_ratio': None,
+    'incremental': True,
+}
+
+
+def expand_paths(patterns, base_dir):
+    """Expande uma lista de caminhos/padrões glob relativos a `base_dir`"""
+    if isinstance(patterns, str):
+        patterns = [patterns]
+
+    paths = []
+    for pattern in patterns:
+        pattern = os.path.join(base_dir, os.path.expanduser(pattern))
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        for path in matches:
+            if path not in paths:
+                paths.append(path)
+    return paths
+
+
+def load_manifest(manifest_path):
+    """Lê o manifesto e devolve a lista de análises com as opções globais aplicadas"""
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    entries = manifest.get('analyses', [manifest])
+    defaults = dict(DEFAULT_OPTIONS)
+    defaults.update({key: manifest[key] for key in DEFAULT_OPTIONS if key in manifest})
+
+    analyses = []
+    for position, entry in enumerate(entries, start=1):
+        for key in ('name', 'reference'):
+            if key not in entry:
+                raise ValueError(f"Análise {position} do manifesto sem '{key}'")
+        if 'ratings' not in entry and 'tests' not in entry:
+            raise ValueError(f"Análise {position} do manifesto sem 'ratings' nem 'tests'")
+
+        analysis = dict(defaults)
+        analysis.update({key: entry[key] for key in DEFAULT_OPTIONS if key in entry})
+        analysis['name'] = entry['name']
+        analysis['reference'] = expand_paths(entry['reference'], base_dir)[0]
+        analysis['distorted'] = expand_paths(entry.get('distorted', []), base_dir)
+        analysis['ratings'] = expand_paths(entry.get('ratings', []), base_dir)
+        analysis['tests'] = [entry['tests']] if isinstance(entry.get('tests'), str) else entry.get('tests', [])
+        analysis['results_dir'] = os.path.join(base_dir, analysis['results_dir'])
+        analysis['ratings_db'] = os.path.join(base_dir, analysis['ratings_db'])
+        analysis['media_library'] = os.path.join(base_dir, analysis['media_library'])
+        analysis['metrics_cache'] = (os.path.join(base_dir, analysis['metrics_cache']) if analysis['metrics_cache']
+                                     else os.path.join(analysis['results_dir'], 'metrics_cache.sqlite'))
+        analyses.append(analysis)
+    return analyses
+
+
+def run_analysis(analysis):
+    """Executa uma análise do manifesto; devolve o resumo e o caminho do JSON gerado"""
+    name = analysis['name']
+    if not os.path.exists(analysis['reference']):
+        raise FileNotFoundError(f"Vídeo de referência não encontrado: {analysis['reference']}")
+    if not analysis['ratings'] and not analysis['tests']:
+        raise ValueError("Nenhum CSV de ratings nem teste guardado indicado")
+
+    for csv_path in analysis['ratings']:
+        columns = pd.read_csv(csv_path, nrows=0).columns
+        if 'distorted_filename' not in columns or 'rating_0_10' not in columns:
+            raise ValueError(f"CSV inválido: {os.path.basename(csv_path)} "
+                             "(deve conter colunas 'distorted_filename' e 'rating_0_10')")
+
+    sampling = SamplingPolicy.from_dict(analysis['sampling']) if analysis['sampling'] else SamplingPolicy()
+    results_dir = os.path.join(analysis['results_dir'], safe_dirname(name))
+    os.makedirs(results_dir, exist_ok=True)
+    timestamp_str = datetime.now().strftime("%Y%m%d_%H%M%S")
+
+    # Ratings individuais dos CSVs e dos testes guardados na base de dados
+    rating_frames = [pd.read_csv(csv_path) for csv_path in analysis['ratings']]
+    if analysis['tests']:
+        with RatingsStore(analysis['ratings_db']) as store:
+            rating_frames.append(store.query(test_names=analysis['tests']))
+    all_ratings = pd.concat(rating_frames, ignore_index=True)
+    if all_ratings.empty:
+        raise ValueError(f"Nenhum rating encontrado para os testes {', '.join(analysis['tests'])}")
+
+    # Ratings agregados (uma linha por vídeo distorcido, com o MOS), passados em memória
+    ratings_df = aggregate_rating_rows(all_ratings, analysis['reference'], analysis['min_fps_ratio'],
+                                       'Análise Combinada' if len(rating_frames) > 1 else 'Análise')
+
+    # Vídeos com rating que não foram indicados: procurados na biblioteca de vídeos
+    distorted = list(analysis['distorted'])
+    path_index = distorted_path_index(distorted)
+    missing = [filename for filename in ratings_df['distorted_filename'].unique() if filename not in path_index]
+    if missing and os.path.exists(analysis['media_library']):
+        with MediaLibrary(analysis['media_library']) as library:
+            library.update(workers=max(1, int(analysis['workers'])))
+            found = library.resolve(missing, near=os.path.dirname(os.path.abspath(analysis['reference'])))
+        distorted += found.values()
+        print(f"✓ {len(found)}/{len(missing)} vídeo(s) encontrado(s) na biblioteca de vídeos")
+
+    result = generate_analysis(ratings_df, timestamp_str, results_dir, analysis['reference'],
+                               distorted, name, workers=max(1, int(analysis['workers'])),
+                               max_concurrent=analysis['max_concurrent'], sampling=sampling,
+                               use_cache=analysis['use_cache'], gemini=analysis['gemini'],
+                               incremental=analysis['incremental'], cache_path=analysis['metrics_cache'])
+
+    summary = result.to_dict()
+    summary['ratings'] = analysis['ratings']
+    summary['tests'] = analysis['tests']
+    json_filename = os.path.join(results_dir, f"analysis_{timestamp_str}.json")
+    with open(json_filename, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, indent=2, ensure_ascii=False)
+    return summary, json_filename
+
+
+def analyze(manifest_path, overrides):
+    """Executa todas as análises do manifesto; devolve o número de análises falhadas"""
+    analyses = load_manifest(manifest_path)
+    failures = 0
+
+    for position, analysis in enumerate(analyses, start=1):
+        analysis.update(overrides)
+        print(f"\n=== Análise {position}/{len(analyses)}: {analysis['name']} ===")
+        try:
+            summary, json_filename = run_analysis(analysis)
+        except Exception as e:
+            failures += 1
+            print(f"⚠ Falha na análise {analysis['name']}: {e}")
+            traceback.print_exc()
+            continue
+
+        print(f"✓ {len(summary['videos'])} vídeo(s) analisado(s), {len(summary['errors'])} com erro")
+        print(f"✓ Resultados: {json_filename}")
+
+    print(f"\n{len(analyses) - failures}/{len(analyses)} análise(s) concluída(s)")
+    return failures
+
+
+def main(argv=None):
+    """Ponto de entrada da linha de comandos"""
+    parser = argparse.ArgumentParser(prog='vqa', description="Análise de qualidade de vídeo sem interface gráfica")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    analyze_parser = subparsers.add_parser('analyze', help="gera as análises descritas num manifesto JSON")
+    analyze_parser.add_argument('manifest', help="caminho do manifesto")
+    analyze_parser.add_argument('--workers', type=int, help="processos paralelos (redefine o manifesto)")
+    analyze_parser.add_argument('--max-concurrent', type=int, help="máximo de pares em descodificação simultânea")
+    analyze_parser.add_argument('--no-cache', action='store_true', help="não usar a cache de métricas")
+    analyze_parser.add_argument('--gemini', action='store_true', help="gerar também a análise com Gemini")
+    analyze_parser.add_argument('--full', action='store_true',
+                                help="refazer todas as etapas (ignorar o manifesto da pasta de resultados)")
+
+    args = parser.parse_args(argv)
+
+    overrides = {}
+    if args.workers is not None:
+        overrides['workers'] = args.workers
+    if args.max_concurrent is not None:
+        overrides['max_concurrent'] = args.max_concurrent
+    if args.no_cache:
+        overrides['use_cache'] = False
+    if args.gemini:
+        overrides['gemini'] = True
+    if args.full:
+        overrides['incremental'] = False
+
+    return 1 if analyze(args.manifest, overrides) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())